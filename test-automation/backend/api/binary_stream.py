@@ -0,0 +1,202 @@
+from fastapi import WebSocket
+from collections import deque
+from typing import Dict, Any, Deque, Iterable, List, Optional, Set, Tuple
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+# Formato de trama (little-endian):
+#   cabecera fija  <4sBBHIIdd>: magic, versión, tipo de dato, nº columnas,
+#                  nº filas, nº de secuencia, t0 (s), dt (s, 0 = irregular)
+#   cadenas        test_id y canal (u16 longitud + utf-8), nombres de
+#                  columna (u8 longitud + utf-8)
+#   relleno        hasta múltiplo de 8 bytes, para que el cliente pueda crear
+#                  Float32Array/Float64Array directamente sobre el buffer
+#   datos          columnas consecutivas de n filas cada una
+MAGIC = b"TAMB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHIIdd")
+DTYPES = {"float32": (1, np.dtype("<f4")), "float64": (2, np.dtype("<f8"))}
+DTYPE_CODES = {code: dtype for code, dtype in DTYPES.values()}
+
+def encode_block(test_id: str, channel: str, columns: Dict[str, Any], dtype: str = "float32",
+                 sequence: int = 0, t0: float = 0.0, dt: float = 0.0) -> bytes:
+    """Empaquetar un bloque de medidas en una trama binaria"""
+    code, np_dtype = DTYPES[dtype]
+    arrays = [np.ascontiguousarray(values, dtype=np_dtype) for values in columns.values()]
+    n_rows = arrays[0].size if arrays else 0
+    if any(array.size != n_rows for array in arrays):
+        raise ValueError("Todas las columnas deben tener el mismo número de filas")
+    
+    parts = [HEADER.pack(MAGIC, VERSION, code, len(arrays), n_rows, sequence & 0xFFFFFFFF, t0, dt)]
+    for text in (test_id, channel):
+        raw = text.encode("utf-8")
+        parts.append(struct.pack("<H", len(raw)) + raw)
+    for name in columns:
+        raw = name.encode("utf-8")
+        parts.append(struct.pack("<B", len(raw)) + raw)
+    header_size = sum(len(part) for part in parts)
+    parts.append(b"\x00" * (-header_size % 8))
+    parts.extend(array.tobytes() for array in arrays)
+    return b"".join(parts)
+
+def decode_block(frame: bytes) -> Dict[str, Any]:
+    """Desempaquetar una trama binaria (clientes Python y pruebas)"""
+    magic, version, code, n_columns, n_rows, sequence, t0, dt = HEADER.unpack_from(frame, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Trama binaria no reconocida")
+    offset = HEADER.size
+    texts = []
+    for _ in range(2):
+        (length,) = struct.unpack_from("<H", frame, offset)
+        texts.append(frame[offset + 2:offset + 2 + length].decode("utf-8"))
+        offset += 2 + length
+    names = []
+    for _ in range(n_columns):
+        length = frame[offset]
+        names.append(frame[offset + 1:offset + 1 + length].decode("utf-8"))
+        offset += 1 + length
+    offset += -offset % 8
+    
+    np_dtype = DTYPE_CODES[code]
+    columns = {}
+    for name in names:
+        columns[name] = np.frombuffer(frame, dtype=np_dtype, count=n_rows, offset=offset)
+        offset += n_rows * np_dtype.itemsize
+    return {"test_id": texts[0], "channel": texts[1], "sequence": sequence, "t0": t0, "dt": dt, "columns": columns}
+
+class StreamSubscriber:
+    """Cliente del canal binario con sus suscripciones y cola propia
+    
+    Los bloques de datos son reemplazables: si el cliente no da abasto se
+    descarta el bloque más antiguo en lugar de frenar la adquisición.
+    """
+    
+    def __init__(self, websocket: WebSocket, max_queue: int = 64):
+        self.websocket = websocket
+        self.subscriptions: Set[Tuple[str, str]] = set()  # (test_id, canal); "*" = todos
+        self.dtype = "float32"
+        self.queue: Deque[bytes] = deque(maxlen=max_queue)
+        self._wakeup = asyncio.Event()
+        self.sender_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+
+    def matches(self, test_id: str, channel: str) -> bool:
+        subscriptions = self.subscriptions
+        return ((test_id, channel) in subscriptions or (test_id, "*") in subscriptions
+                or ("*", channel) in subscriptions or ("*", "*") in subscriptions)
+
+    def enqueue(self, frame: bytes):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(frame)
+        self._wakeup.set()
+
+    async def run_sender(self):
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                frame = self.queue.popleft()
+                await self.websocket.send_bytes(frame)
+                self.sent += 1
+                self.bytes_sent += len(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Conexión cerrada: el endpoint la retirará al recibir la desconexión
+            self.closed = True
+
+class StreamManager:
+    """Canal WebSocket binario para datos de medida de alta frecuencia
+    
+    El JSON de ``/ws`` se mantiene para los mensajes de control; aquí solo
+    viajan bloques de columnas empaquetadas. Cada bloque se codifica una vez
+    por tipo de dato pedido y solo si hay algún suscriptor interesado.
+    """
+    
+    def __init__(self):
+        self.subscribers: Dict[WebSocket, StreamSubscriber] = {}
+        self._sequence = 0
+        self.blocks_published = 0
+
+    def has_subscribers(self, test_id: str, channel: str) -> bool:
+        return any(subscriber.matches(test_id, channel) for subscriber in self.subscribers.values())
+
+    async def connect(self, websocket: WebSocket) -> StreamSubscriber:
+        await websocket.accept()
+        subscriber = StreamSubscriber(websocket)
+        subscriber.sender_task = asyncio.create_task(subscriber.run_sender())
+        self.subscribers[websocket] = subscriber
+        return subscriber
+
+    def disconnect(self, websocket: WebSocket):
+        subscriber = self.subscribers.pop(websocket, None)
+        if subscriber is not None:
+            subscriber.closed = True
+            if subscriber.sender_task is not None:
+                subscriber.sender_task.cancel()
+
+    def handle_control(self, websocket: WebSocket, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Procesar un mensaje de control JSON (subscribe/unsubscribe)"""
+        subscriber = self.subscribers[websocket]
+        test_id = message.get("test_id") or "*"
+        channels: Iterable[str] = message.get("channels") or ["*"]
+        
+        if message.get("type") == "subscribe":
+            dtype = message.get("dtype", subscriber.dtype)
+            if dtype not in DTYPES:
+                return {"type": "stream_error", "error": f"Tipo de dato no soportado: {dtype}"}
+            subscriber.dtype = dtype
+            subscriber.subscriptions.update((test_id, channel) for channel in channels)
+        elif message.get("type") == "unsubscribe":
+            subscriber.subscriptions.difference_update((test_id, channel) for channel in channels)
+        else:
+            return {"type": "stream_error", "error": f"Mensaje no soportado: {message.get('type')}"}
+        
+        return {
+            "type": "stream_subscriptions",
+            "dtype": subscriber.dtype,
+            "subscriptions": [{"test_id": t, "channel": c} for t, c in sorted(subscriber.subscriptions)]
+        }
+
+    def publish(self, test_id: str, channel: str, columns: Dict[str, Any],
+                t0: Optional[float] = None, dt: float = 0.0) -> int:
+        """Publicar un bloque de columnas; devuelve a cuántos clientes se encoló"""
+        targets: List[StreamSubscriber] = [s for s in self.subscribers.values() if s.matches(test_id, channel)]
+        if not targets:
+            return 0
+        
+        self._sequence += 1
+        self.blocks_published += 1
+        t0 = time.time() if t0 is None else t0
+        frames: Dict[str, bytes] = {}
+        for subscriber in targets:
+            frame = frames.get(subscriber.dtype)
+            if frame is None:
+                frame = frames[subscriber.dtype] = encode_block(
+                    test_id, channel, columns, subscriber.dtype, self._sequence, t0, dt
+                )
+            subscriber.enqueue(frame)
+        return len(targets)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self.subscribers),
+            "blocks_published": self.blocks_published,
+            "clients": [{
+                "subscriptions": len(subscriber.subscriptions),
+                "dtype": subscriber.dtype,
+                "queue_depth": len(subscriber.queue),
+                "sent": subscriber.sent,
+                "dropped": subscriber.dropped,
+                "bytes_sent": subscriber.bytes_sent,
+            } for subscriber in self.subscribers.values()]
+        }
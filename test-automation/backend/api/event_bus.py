@@ -0,0 +1,280 @@
+import asyncio
+import json
+from collections import deque
+from typing import Dict, Any, Awaitable, Callable, Deque, List, Optional
+
+from config.settings import settings, get_node_id
+from monitoring.metrics import CALLBACK_ERRORS, EVENT_BUS_ERRORS, EVENT_BUS_MESSAGES
+from test_engine.step_record import json_default
+from .event_journal import JOURNALED_TYPES, TERMINAL_TYPES
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Sin redis solo está disponible el bus en proceso
+    aioredis = None
+
+EventHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+def default_node_id() -> str:
+    return get_node_id()
+
+class InProcessEventBus:
+    """Bus de eventos de un solo nodo
+
+    ``publish`` llama directamente a los suscriptores (en el mismo bucle y
+    sin serializar ni copiar el mensaje): es lo mismo que pasar
+    ``ConnectionManager.send_to_all`` como callback del motor. No hay otros
+    nodos, así que ``send_command`` solo llega a los manejadores locales.
+    """
+
+    backend = "memory"
+
+    def __init__(self, node_id: Optional[str] = None):
+        self.node_id = node_id or default_node_id()
+        self.handlers: List[EventHandler] = []
+        self.command_handlers: List[EventHandler] = []
+
+    def subscribe(self, handler: EventHandler):
+        """Recibir los eventos publicados por cualquier nodo (también los propios)"""
+        self.handlers.append(handler)
+
+    def on_command(self, handler: EventHandler):
+        """Recibir las órdenes enviadas por cualquier nodo (p. ej. ``stop_test``)"""
+        self.command_handlers.append(handler)
+
+    async def publish(self, message: Dict[str, Any]):
+        for handler in self.handlers:
+            await handler(message)
+
+    async def send_command(self, command: Dict[str, Any]):
+        """Enviar una orden a todos los nodos (también a este)"""
+        for handler in self.command_handlers:
+            try:
+                await handler(command)
+            except Exception as e:
+                CALLBACK_ERRORS.inc("event_bus")
+                print(f"Error entregando orden del bus: {str(e)}")
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "node_id": self.node_id}
+
+class RedisEventBus(InProcessEventBus):
+    """Bus de eventos entre nodos sobre Redis
+
+    Los eventos van a un stream (``XADD`` con ``MAXLEN`` aproximado): se
+    leen en orden y un lector que pierde la conexión continúa desde el
+    último id visto. Los suscriptores locales reciben el evento al
+    publicarlo, sin esperar a Redis; la escritura la hace una tarea que
+    agrupa los pendientes en un pipeline, así el motor nunca espera a la
+    red. Cada entrada lleva el nodo de origen y el lector descarta las
+    propias.
+
+    El nodo que ejecuta una prueba numera sus eventos (``seq``), de modo
+    que el buffer de reenvío de cualquier nodo usa los mismos números y un
+    cliente puede reanudar contra otro nodo. Las órdenes (parar una
+    ejecución) van por pub/sub: no necesitan historial.
+
+    ``client`` permite usar un cliente ya creado (un Redis local o un
+    sustituto compatible en pruebas) en lugar de conectarse a ``url``.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: Optional[str] = None, node_id: Optional[str] = None, client=None,
+                 stream: Optional[str] = None, commands: Optional[str] = None,
+                 maxlen: Optional[int] = None, max_pending: Optional[int] = None):
+        super().__init__(node_id)
+        if client is None and aioredis is None:
+            raise RuntimeError("El bus de eventos Redis necesita el paquete redis")
+        self.url = url or settings.REDIS_URL
+        self.client = client
+        self.stream = stream or settings.EVENT_BUS_STREAM
+        self.commands = commands or settings.EVENT_BUS_COMMANDS
+        self.maxlen = maxlen or settings.EVENT_BUS_STREAM_MAXLEN
+        self.max_pending = max_pending or settings.EVENT_BUS_MAX_PENDING
+        self.last_id: Optional[str] = None  # Último id leído; al arrancar, el último del stream
+        self.published = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+        self._seqs: Dict[str, int] = {}  # test_id -> último seq de las ejecuciones de este nodo
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def publish(self, message: Dict[str, Any]):
+        message = self._number(message)
+        if len(self._pending) >= self.max_pending:
+            # Redis no responde: se descarta lo más antiguo en lugar de crecer sin límite
+            self._pending.popleft()
+            self.dropped += 1
+        self._pending.append(message)
+        self._wakeup.set()
+        await super().publish(message)
+
+    def _number(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        test_id = message.get("test_id")
+        message_type = message.get("type")
+        if message_type not in JOURNALED_TYPES or not isinstance(test_id, str) or "seq" in message:
+            return message
+        seq = self._seqs.get(test_id, 0) + 1
+        if message_type in TERMINAL_TYPES:
+            self._seqs.pop(test_id, None)
+        else:
+            self._seqs[test_id] = seq
+        return {**message, "seq": seq}
+
+    async def send_command(self, command: Dict[str, Any]):
+        await super().send_command(command)
+        try:
+            await self.client.publish(self.commands, json.dumps({"node": self.node_id, "data": command}))
+        except Exception as e:
+            self._error("command", e)
+
+    async def start(self):
+        if self._tasks:
+            return
+        if self.client is None:
+            self.client = aioredis.from_url(self.url, decode_responses=True)
+        self._tasks = [asyncio.create_task(self._write_loop(), name="event-bus-writer"),
+                       asyncio.create_task(self._read_loop(), name="event-bus-reader"),
+                       asyncio.create_task(self._command_loop(), name="event-bus-commands")]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pending and self.client is not None:
+            try:
+                await self._flush()
+            except Exception as e:
+                self._error("publish", e)
+
+    async def _write_loop(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                try:
+                    await self._flush()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self._error("publish", e)
+                    await asyncio.sleep(1.0)
+
+    async def _flush(self, batch_size: int = 256):
+        # El lote sale del buffer antes de esperar a Redis: un publish concurrente
+        # que descarte lo más antiguo no puede quitar mensajes de este lote
+        batch = [self._pending.popleft() for _ in range(min(batch_size, len(self._pending)))]
+        try:
+            pipeline = self.client.pipeline(transaction=False)
+            for message in batch:
+                pipeline.xadd(self.stream, {"node": self.node_id, "data": json.dumps(message, default=json_default)},
+                              maxlen=self.maxlen, approximate=True)
+            await pipeline.execute()
+        except BaseException:
+            # Redis no los ha aceptado: vuelven al principio del buffer, en orden
+            self._pending.extendleft(reversed(batch))
+            while len(self._pending) > self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            raise
+        self.published += len(batch)
+        EVENT_BUS_MESSAGES.inc("published", amount=len(batch))
+
+    async def _read_loop(self):
+        while self.last_id is None:
+            # Empezar en el último id que ya existe, no en "$": con "$" cada XREAD
+            # solo ve lo añadido durante esa llamada y se pierde lo que llegue entre dos
+            try:
+                latest = await self.client.xrevrange(self.stream, count=1)
+                self.last_id = latest[0][0] if latest else "0-0"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._error("read", e)
+                await asyncio.sleep(1.0)
+        while True:
+            try:
+                response = await self.client.xread({self.stream: self.last_id}, count=256, block=1000)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._error("read", e)
+                await asyncio.sleep(1.0)
+                continue
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    self.last_id = entry_id
+                    if fields.get("node") != self.node_id:
+                        await self._dispatch(self.handlers, fields.get("data"))
+
+    async def _command_loop(self):
+        while True:
+            pubsub = self.client.pubsub()
+            try:
+                await pubsub.subscribe(self.commands)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is None:
+                        continue
+                    envelope = json.loads(message["data"])
+                    if envelope.get("node") != self.node_id:
+                        await self._dispatch(self.command_handlers, envelope.get("data"), json_encoded=False)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._error("command", e)
+                await asyncio.sleep(1.0)
+            finally:
+                await pubsub.close()
+
+    async def _dispatch(self, handlers: List[EventHandler], data: Any, json_encoded: bool = True):
+        try:
+            message = json.loads(data) if json_encoded else data
+        except (TypeError, ValueError) as e:
+            self._error("read", e)
+            return
+        self.received += 1
+        EVENT_BUS_MESSAGES.inc("received")
+        for handler in handlers:
+            try:
+                await handler(message)
+            except Exception as e:
+                CALLBACK_ERRORS.inc("event_bus")
+                print(f"Error entregando evento del bus: {str(e)}")
+
+    def _error(self, operation: str, error: Exception):
+        self.errors += 1
+        EVENT_BUS_ERRORS.inc(operation)
+        print(f"Error en el bus de eventos Redis ({operation}): {str(error)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **super().get_stats(),
+            "stream": self.stream,
+            "last_id": self.last_id,
+            "published": self.published,
+            "received": self.received,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+def create_event_bus(backend: Optional[str] = None) -> InProcessEventBus:
+    """Bus según ``EVENT_BUS``: ``memory`` (un nodo, por defecto) o ``redis``"""
+    backend = backend or settings.EVENT_BUS
+    if backend == "redis":
+        return RedisEventBus()
+    if backend != "memory":
+        raise ValueError(f"Bus de eventos desconocido: {backend}")
+    return InProcessEventBus()
@@ -0,0 +1,196 @@
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, Deque, List, Optional, Tuple
+
+from config.settings import settings
+from test_engine.step_record import json_default
+
+# Eventos de una ejecución que se guardan para reenviarlos al reconectar
+JOURNALED_TYPES = {"test_started", "step_started", "step_completed", "test_completed", "test_error", "test_stopped"}
+# Eventos agrupables: no se guardan en el buffer, solo el último en el snapshot
+LATEST_ONLY_TYPES = {"sweep_point", "test_progress"}
+TERMINAL_TYPES = {"test_completed", "test_error", "test_stopped"}
+
+class RunJournal:
+    """Eventos numerados de una ejecución en un buffer circular acotado
+
+    Además del buffer se mantiene un estado compacto (inicio, resultados
+    por paso, último evento agrupable y evento final) con el que se
+    reconstruye la ejecución cuando los eventos pedidos ya se han
+    descartado o el cliente no la conocía.
+    """
+
+    def __init__(self, test_id: str, max_events: int, max_bytes: int):
+        self.test_id = test_id
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.seq = 0
+        self.events: Deque[Tuple[int, str]] = deque()
+        self.bytes = 0
+        self.evicted = 0
+        self.started: Optional[Dict[str, Any]] = None
+        self.steps: Dict[Any, Dict[str, Any]] = {}  # step_number -> último resultado
+        self.latest: Dict[str, Dict[str, Any]] = {}
+        self.final: Optional[Dict[str, Any]] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        if self.final is None:
+            return "running"
+        return {"test_completed": "completed", "test_error": "failed", "test_stopped": "stopped"}[self.final["type"]]
+
+    def append(self, message: Dict[str, Any]) -> Tuple[int, str]:
+        """Numerar y guardar un evento; devuelve (seq, texto serializado)
+
+        Si el evento ya trae ``seq`` (numerado por el nodo que ejecuta la
+        prueba, ver ``RedisEventBus``) se conserva ese número; si no avanza
+        (p. ej. un ``test_error`` del coordinador) se numera a continuación.
+        """
+        if message.get("seq", 0) > self.seq:
+            self.seq = message["seq"]
+        else:
+            self.seq += 1
+            message = {**message, "seq": self.seq}
+        text = json.dumps(message, default=json_default)
+        self._update_state(message)
+        self.events.append((self.seq, text))
+        self.bytes += len(text)
+        while self.events and (len(self.events) > self.max_events or self.bytes > self.max_bytes):
+            _, dropped = self.events.popleft()
+            self.bytes -= len(dropped)
+            self.evicted += 1
+        return self.seq, text
+
+    def observe(self, message: Dict[str, Any]):
+        """Recordar el último evento agrupable (sin numerarlo ni guardarlo)"""
+        self.latest[message["type"]] = message
+
+    def _update_state(self, message: Dict[str, Any]):
+        message_type = message["type"]
+        if message_type == "test_started":
+            self.started = message
+        elif message_type == "step_completed":
+            result = message.get("result") or {}
+            self.steps[result.get("step_number", message.get("step"))] = result
+        elif message_type in TERMINAL_TYPES:
+            self.final = message
+            self.finished_at = time.monotonic()
+
+    def covers(self, last_seq: int) -> bool:
+        """Si el buffer conserva todos los eventos posteriores a ``last_seq``"""
+        first = self.events[0][0] if self.events else self.seq + 1
+        return last_seq + 1 >= first
+
+    def delta(self, last_seq: int) -> List[str]:
+        return [text for seq, text in self.events if seq > last_seq]
+
+    def snapshot(self, full: bool) -> Dict[str, Any]:
+        """Estado compacto de la ejecución; con ``full`` incluye los resultados de los pasos"""
+        snapshot = {
+            "type": "run_snapshot",
+            "test_id": self.test_id,
+            "seq": self.seq,
+            "status": self.status,
+            "full": full,
+            "started": self.started,
+            "completed_steps": len(self.steps),
+            "latest": list(self.latest.values()),
+            "final": self.final,
+        }
+        if full:
+            snapshot["results"] = [self.steps[key] for key in self.steps]
+        return snapshot
+
+class EventJournal:
+    """Buffers de reenvío por ejecución para clientes que reconectan o llegan tarde
+
+    Cada ejecución numera sus eventos (``seq``). Al reconectar, el cliente
+    envía el último número visto de cada ejecución y recibe los eventos
+    que le faltan seguidos de un snapshot compacto; si ya se descartaron
+    (o no conocía la ejecución) recibe un snapshot completo. La memoria
+    está acotada por ejecución (eventos y bytes) y en número de
+    ejecuciones; las terminadas se descartan pasado ``retention`` segundos.
+    """
+
+    def __init__(self, max_events: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_runs: Optional[int] = None, retention: Optional[float] = None):
+        self.max_events = max_events or settings.WS_REPLAY_MAX_EVENTS
+        self.max_bytes = max_bytes or settings.WS_REPLAY_MAX_BYTES
+        self.max_runs = max_runs or settings.WS_REPLAY_MAX_RUNS
+        self.retention = settings.WS_REPLAY_RETENTION if retention is None else retention
+        self.runs: "OrderedDict[str, RunJournal]" = OrderedDict()
+        self.evicted_runs = 0
+
+    def record(self, message: Dict[str, Any]) -> Optional[str]:
+        """Guardar un evento de ejecución; devuelve su texto numerado (None si no se guarda)"""
+        test_id = message.get("test_id")
+        message_type = message.get("type")
+        if test_id is None or not isinstance(test_id, str):
+            return None
+        if message_type in LATEST_ONLY_TYPES:
+            run = self.runs.get(test_id)
+            if run is not None:
+                run.observe(message)
+            return None
+        if message_type not in JOURNALED_TYPES:
+            return None
+
+        run = self.runs.get(test_id)
+        if run is None:
+            self._evict(room_for_new=True)
+            run = self.runs[test_id] = RunJournal(test_id, self.max_events, self.max_bytes)
+        _, text = run.append(message)
+        return text
+
+    def replay(self, last_seen: Dict[str, int], include_active: bool = True,
+               max_delta: Optional[int] = None) -> List[str]:
+        """Mensajes para ponerse al día desde ``{test_id: último seq visto}``
+
+        Con ``include_active`` también se envía un snapshot completo de las
+        ejecuciones en curso que el cliente no conocía (incorporación tardía).
+        Si faltan más de ``max_delta`` eventos se envía el snapshot completo.
+        """
+        self._evict()
+        messages = []
+        for test_id, run in self.runs.items():
+            last_seq = last_seen.get(test_id)
+            if last_seq is None:
+                if include_active and run.final is None:
+                    messages.append(json.dumps(run.snapshot(full=True), default=json_default))
+                continue
+            if last_seq >= run.seq:
+                continue
+            if run.covers(last_seq) and (max_delta is None or run.seq - last_seq <= max_delta):
+                messages.extend(run.delta(last_seq))
+                messages.append(json.dumps(run.snapshot(full=False), default=json_default))
+            else:
+                messages.append(json.dumps(run.snapshot(full=True), default=json_default))
+        return messages
+
+    def _evict(self, room_for_new: bool = False):
+        """Descartar las ejecuciones caducadas y, al insertar una nueva, hacerle sitio"""
+        now = time.monotonic()
+        for test_id in [test_id for test_id, run in self.runs.items()
+                        if run.finished_at is not None and now - run.finished_at > self.retention]:
+            del self.runs[test_id]
+            self.evicted_runs += 1
+        while len(self.runs) > self.max_runs - (1 if room_for_new else 0):
+            # Primero la terminada más antigua; si todas siguen en curso, la más antigua
+            victim = next((test_id for test_id, run in self.runs.items() if run.finished_at is not None),
+                          next(iter(self.runs)))
+            del self.runs[victim]
+            self.evicted_runs += 1
+
+    def buffered_bytes(self) -> int:
+        return sum(run.bytes for run in self.runs.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "runs": len(self.runs),
+            "max_runs": self.max_runs,
+            "buffered_bytes": self.buffered_bytes(),
+            "evicted_runs": self.evicted_runs,
+            "evicted_events": sum(run.evicted for run in self.runs.values()),
+        }
@@ -1,120 +1,190 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+from typing import List, Dict, Any, Optional
+import asyncio
+import os
+import time
 from pydantic import BaseModel
 
-#from hardware.power_supply import PowerSupply
-#from hardware.daq_controller import DAQController
-from models.test_models import TestSequence, TestResult, InstrumentConfig
+from hardware.instrument_pool import instrument_pool
+from hardware.telemetry import telemetry_poller
+from config.settings import settings
+from monitoring.tracing import trace_path
+from models.test_models import TestSequence, TestResult, InstrumentConfig, StartTestRequest
+from cluster.coordinator import submit_job_command
+from test_engine.plan import SequenceValidationError
+from storage.results_store import results_store
+from storage.sequence_repository import sequence_repository
+from storage.measurement_archive import measurement_archive
 
 router = APIRouter()
 
-# Instancias globales de instrumentos (en producción usar un pool)
-instruments = {}
-
 class InstrumentStatus(BaseModel):
     name: str
     connected: bool
     status: str
     last_reading: Dict[str, Any] = {}
-
-class TestStartRequest(BaseModel):
-    sequence_id: str
-    parameters: Dict[str, Any] = {}
+    timestamp: Optional[float] = None
+    age_seconds: Optional[float] = None
+    leased_by: Optional[str] = None
 
 @router.get("/instruments")
 async def get_instruments() -> List[InstrumentStatus]:
-    """Obtener estado de todos los instrumentos"""
+    """Obtener estado de todos los instrumentos (última lectura en caché)"""
     status_list = []
-    for name, instrument in instruments.items():
-        try:
-            status = await instrument.get_status()
-            status_list.append(InstrumentStatus(
-                name=name,
-                connected=True,
-                status=status.get('status', 'unknown'),
-                last_reading=status.get('readings', {})
-            ))
-        except Exception as e:
-            status_list.append(InstrumentStatus(
-                name=name,
-                connected=False,
-                status=f"Error: {str(e)}"
-            ))
+    for reading in telemetry_poller.get_snapshot():
+        error = reading["error"]
+        status_list.append(InstrumentStatus(
+            name=reading["name"],
+            connected=error is None and reading["status"] != "disconnected",
+            status=f"Error: {error}" if error else reading["status"],
+            last_reading=reading["readings"],
+            timestamp=reading["timestamp"],
+            age_seconds=reading["age_seconds"],
+            leased_by=reading["leased_by"]
+        ))
     return status_list
 
 @router.post("/instruments/{instrument_name}/connect")
 async def connect_instrument(instrument_name: str, config: InstrumentConfig):
     """Conectar un instrumento específico"""
     try:
-        if instrument_name.startswith("power_supply"):
-            instrument = PowerSupply(config.resource_name)
-        elif instrument_name.startswith("daq"):
-            instrument = DAQController(config.device_name)
-        else:
-            raise ValueError(f"Tipo de instrumento no soportado: {instrument_name}")
-        
-        await instrument.connect()
-        instruments[instrument_name] = instrument
+        # Reutiliza la sesión si el instrumento ya estaba conectado
+        await instrument_pool.connect(instrument_name, config)
         
         return {"status": "connected", "message": f"{instrument_name} conectado exitosamente"}
     
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error conectando {instrument_name}: {str(e)}")
 
+@router.get("/instruments/pool")
+async def get_instrument_pool() -> List[Dict[str, Any]]:
+    """Obtener el estado de las sesiones del pool (reservas, reconexiones)"""
+    return instrument_pool.get_status()
+
 @router.delete("/instruments/{instrument_name}")
 async def disconnect_instrument(instrument_name: str):
     """Desconectar un instrumento"""
-    if instrument_name not in instruments:
+    if instrument_name not in instrument_pool:
         raise HTTPException(status_code=404, detail="Instrumento no encontrado")
     
     try:
-        await instruments[instrument_name].disconnect()
-        del instruments[instrument_name]
+        await instrument_pool.disconnect(instrument_name)
         return {"status": "disconnected"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error desconectando: {str(e)}")
 
 @router.get("/sequences")
-async def get_test_sequences() -> List[Dict[str, Any]]:
-    """Obtener lista de secuencias de prueba disponibles"""
-    # En producción esto vendría de la base de datos
-    return [
-        {
-            "id": "basic_power_test",
-            "name": "Prueba Básica de Alimentación",
-            "description": "Verifica voltajes de salida del DUT",
-            "duration_estimate": "30s",
-            "steps": 5
-        },
-        {
-            "id": "full_functional_test",
-            "name": "Prueba Funcional Completa",
-            "description": "Suite completa de pruebas funcionales",
-            "duration_estimate": "5m",
-            "steps": 25
-        }
-    ]
+async def get_test_sequences(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    tag: Optional[str] = None,
+    instrument: Optional[str] = None,
+    q: Optional[str] = None,
+    summary: bool = False,
+) -> List[Dict[str, Any]]:
+    """Obtener secuencias de prueba disponibles (paginadas; total en X-Total-Count)"""
+    total, sequences = sequence_repository.query(tag=tag, instrument=instrument, search=q,
+                                                 offset=offset, limit=limit, summary=summary)
+    response.headers["X-Total-Count"] = str(total)
+    return sequences
+
+@router.get("/sequences/library")
+async def get_sequence_library_stats() -> Dict[str, Any]:
+    """Estado de la biblioteca de secuencias (índices y ficheros con errores)"""
+    return sequence_repository.get_stats()
+
+@router.get("/sequences/{sequence_id}")
+async def get_test_sequence(sequence_id: str) -> Dict[str, Any]:
+    """Obtener una secuencia completa por id"""
+    sequence = sequence_repository.get(sequence_id)
+    if sequence is None:
+        raise HTTPException(status_code=404, detail="Secuencia no encontrada")
+    return sequence
 
 @router.post("/tests/start")
-async def start_test(request: TestStartRequest):
-    """Iniciar una secuencia de pruebas"""
+async def start_test(body: StartTestRequest, request: Request):
+    """Iniciar una secuencia de pruebas (en clúster, encolarla en el coordinador)"""
+    state = request.app.state
+    if state.coordinator is not None:
+        try:
+            job = await state.coordinator.submit(body)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Secuencia no encontrada")
+        except SequenceValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Secuencia inválida: {str(e)}")
+        return {
+            "test_id": job.test_id,
+            "job_id": job.job_id,
+            "status": job.state,
+            "message": "Prueba encolada, resultados vía WebSocket"
+        }
+    
+    if settings.CLUSTER_ROLE != "standalone":
+        # Coordinador en otro nodo: los errores llegan como test_error
+        test_id = state.supervisor.engine.new_test_id()
+        await state.event_bus.send_command(submit_job_command(test_id, body))
+        return {"test_id": test_id, "status": "queued", "message": "Prueba enviada al coordinador"}
+    
+    sequence = sequence_repository.get(body.sequence_id)
+    if sequence is None:
+        raise HTTPException(status_code=404, detail="Secuencia no encontrada")
     # Validar que los instrumentos necesarios estén conectados
-    if not instruments:
+    if not instrument_pool.names() and not state.supervisor.engine.simulate:
         raise HTTPException(status_code=400, detail="No hay instrumentos conectados")
     
+    test_id = state.supervisor.start(sequence, state.event_bus.publish)
     return {
-        "test_id": f"test_{request.sequence_id}_{int(time.time())}",
+        "test_id": test_id,
         "status": "started",
         "message": "Prueba iniciada, resultados vía WebSocket"
     }
 
+@router.get("/cluster")
+async def get_cluster_status(request: Request) -> Dict[str, Any]:
+    """Agentes, cola y trabajos del coordinador del clúster"""
+    coordinator = request.app.state.coordinator
+    if coordinator is None:
+        raise HTTPException(status_code=404, detail="Este nodo no es coordinador (CLUSTER_ROLE)")
+    return coordinator.get_status()
+
+@router.get("/tests")
+async def get_test_runs(request: Request) -> Dict[str, Any]:
+    """Obtener las ejecuciones activas y las últimas terminadas"""
+    return request.app.state.supervisor.get_runs()
+
 @router.post("/tests/{test_id}/stop")
-async def stop_test(test_id: str):
+async def stop_test(test_id: str, request: Request):
     """Detener una prueba en ejecución"""
-    return {"status": "stopped", "test_id": test_id}
+    cancelled = request.app.state.supervisor.cancel(test_id)
+    if settings.CLUSTER_ROLE != "standalone":
+        # Puede estar en cola o en otro banco: la orden llega a todos los nodos
+        await request.app.state.event_bus.send_command({"type": "stop_test", "test_id": test_id})
+        return {"status": "stopping", "test_id": test_id}
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="Prueba no encontrada o ya terminada")
+    return {"status": "stopping", "test_id": test_id}
+
+@router.get("/tests/{test_id}/trace")
+async def get_test_trace(test_id: str):
+    """Descargar la traza de una ejecución (formato Trace Event, chrome://tracing)"""
+    path = trace_path(settings.TRACE_DIR, test_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Traza no encontrada (¿TRACE_RUNS o \"trace\": true?)")
+    return FileResponse(path, media_type="application/json")
 
 @router.get("/results/{test_id}")
 async def get_test_results(test_id: str) -> TestResult:
     """Obtener resultados de una prueba específica"""
-    # En producción esto vendría de la base de datos
-    raise HTTPException(status_code=404, detail="Resultados no encontrados")
\ No newline at end of file
+    result = await results_store.get_test_result(test_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Resultados no encontrados")
+    return result
+
+@router.get("/archive/histogram")
+async def get_measurement_histogram(parameter: str, bins: int = Query(50, ge=1, le=1000),
+                                    days: Optional[float] = Query(None, gt=0)) -> Dict[str, Any]:
+    """Histograma de un parámetro sobre el archivo columnar de mediciones"""
+    since = time.time() - days * 86400 if days else None
+    return await asyncio.to_thread(measurement_archive.histogram, parameter, bins, since)
\ No newline at end of file
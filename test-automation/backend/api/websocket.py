@@ -1,52 +1,235 @@
 from fastapi import WebSocket
-from typing import List
+from collections import deque
+from typing import Dict, Any, Deque, List, Optional, Tuple
 import json
 import asyncio
+import time
+
+from config.settings import settings
+from monitoring.metrics import WS_QUEUE_DEPTH, WS_REPLAY_MESSAGES, WS_SEND_LATENCY
+from test_engine.step_record import json_default
+from .event_journal import EventJournal
+
+# Mensajes de alta frecuencia: solo interesa el último pendiente por clave
+COALESCE_KEYS = {
+    "sweep_point": "test_id",
+    "instrument_status": "instrument",
+    "test_progress": "test_id",
+}
+
+def coalesce_key(message: dict) -> Optional[Tuple[str, Any]]:
+    """Clave de agrupación de un mensaje, o None si no se puede descartar"""
+    message_type = message.get("type")
+    field = COALESCE_KEYS.get(message_type)
+    if field is None or message.get(field) is None:
+        return None  # Sin clave no se sabe de qué ejecución es: no se descarta
+    return (message_type, message.get(field))
+
+class ClientConnection:
+    """Cliente WebSocket con cola de salida acotada y tarea de envío propia
+    
+    El productor solo encola (nunca espera al cliente). Si la cola se
+    llena se descartan primero los mensajes agrupables más antiguos; si
+    aun así no hay sitio, el cliente se considera atascado y se desconecta.
+    """
+    
+    def __init__(self, websocket: WebSocket, max_queue: int):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.queue: Deque[list] = deque()  # Entradas [clave, texto, instante de encolado]
+        self._pending: Dict[Tuple[str, Any], list] = {}
+        self._wakeup = asyncio.Event()
+        self.sender_task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.connected_at = time.monotonic()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_send_latency = 0.0
+        self.max_send_latency = 0.0
+
+    def enqueue(self, text: str, key: Optional[Tuple[str, Any]] = None) -> bool:
+        """Encolar un mensaje ya serializado; False si el cliente está atascado"""
+        if self.closed:
+            return False
+        
+        if key is not None:
+            entry = self._pending.get(key)
+            if entry is not None:
+                # Sustituir en su posición el mensaje pendiente por el más reciente
+                entry[1] = text
+                self.coalesced += 1
+                return True
+        
+        if len(self.queue) >= self.max_queue and not self._drop_one():
+            return False
+        
+        entry = [key, text, time.monotonic()]
+        self.queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self.max_depth = max(self.max_depth, len(self.queue))
+        self._wakeup.set()
+        return True
+
+    def _drop_one(self) -> bool:
+        for entry in self.queue:
+            if entry[0] is not None:
+                self.queue.remove(entry)
+                del self._pending[entry[0]]
+                self.dropped += 1
+                return True
+        return False
+
+    async def run_sender(self, on_error):
+        """Enviar la cola al cliente hasta que se cierre la conexión"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                
+                WS_QUEUE_DEPTH.observe(len(self.queue))
+                key, text, queued_at = self.queue.popleft()
+                if key is not None:
+                    self._pending.pop(key, None)
+                await self.websocket.send_text(text)
+                self.sent += 1
+                self.last_send_latency = time.monotonic() - queued_at
+                self.max_send_latency = max(self.max_send_latency, self.last_send_latency)
+                WS_SEND_LATENCY.observe(self.last_send_latency)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Conexión cerrada, remover de la lista
+            on_error(self.websocket)
+
+    def lag(self) -> float:
+        """Antigüedad del mensaje pendiente más antiguo"""
+        return time.monotonic() - self.queue[0][2] if self.queue else 0.0
+
+    def get_stats(self) -> Dict[str, Any]:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "queue_depth": len(self.queue),
+            "max_queue_depth": self.max_depth,
+            "lag_seconds": self.lag(),
+            "last_send_latency": self.last_send_latency,
+            "max_send_latency": self.max_send_latency,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, max_queue: Optional[int] = None, telemetry=None, journal: Optional[EventJournal] = None,
+                 bus=None):
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.max_queue = max_queue or settings.WS_CLIENT_QUEUE_SIZE
+        self.telemetry = telemetry  # TelemetryPoller con la caché de lecturas
+        self.journal = journal or EventJournal()
+        self.bus = bus  # Bus de eventos: los broadcast llegan a los clientes de todos los nodos
+        self.slow_disconnects = 0
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.clients)
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"Cliente conectado. Total conexiones: {len(self.active_connections)}")
+        if len(self.clients) >= settings.WS_MAX_CONNECTIONS:
+            await websocket.close(code=1013, reason="Demasiadas conexiones")
+            return False
+        client = ClientConnection(websocket, self.max_queue)
+        client.sender_task = asyncio.create_task(client.run_sender(self.disconnect))
+        self.clients[websocket] = client
+        print(f"Cliente conectado. Total conexiones: {len(self.clients)}")
+        return True
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        print(f"Cliente desconectado. Total conexiones: {len(self.active_connections)}")
+        client = self.clients.pop(websocket, None)
+        if client is not None:
+            client.closed = True
+            if client.sender_task is not None and client.sender_task is not asyncio.current_task():
+                client.sender_task.cancel()
+        print(f"Cliente desconectado. Total conexiones: {len(self.clients)}")
 
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
+    def _deliver(self, client: ClientConnection, text: str, key: Optional[Tuple[str, Any]]):
+        if not client.enqueue(text, key):
+            # Cliente atascado: se desconecta en lugar de frenar al motor
+            self.slow_disconnects += 1
+            self.disconnect(client.websocket)
+            asyncio.ensure_future(self._close_quietly(client.websocket))
+
+    async def _close_quietly(self, websocket: WebSocket):
         try:
-            await websocket.send_text(json.dumps(message))
-        except:
-            # Conexión cerrada, remover de la lista
-            self.disconnect(websocket)
+            await websocket.close(code=1013, reason="Cliente demasiado lento")
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message: dict, websocket: WebSocket):
+        client = self.clients.get(websocket)
+        if client is not None:
+            self._deliver(client, json.dumps(message, default=json_default), coalesce_key(message))
 
     async def send_to_all(self, message: dict):
-        if self.active_connections:
-            # Enviar a todas las conexiones activas
-            disconnected = []
-            for connection in self.active_connections:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    disconnected.append(connection)
-            
-            # Limpiar conexiones muertas
-            for conn in disconnected:
-                self.disconnect(conn)
-
-    async def broadcast_instrument_status(self, instrument_name: str, status: dict):
-        """Broadcast del estado de un instrumento específico"""
+        # Los eventos de ejecución se numeran y guardan aunque no haya clientes
+        text = self.journal.record(message)
+        if self.clients:
+            # Serializar una sola vez y encolar para cada cliente
+            if text is None:
+                text = json.dumps(message, default=json_default)
+            key = coalesce_key(message)
+            for client in list(self.clients.values()):
+                self._deliver(client, text, key)
+
+    async def publish(self, message: dict):
+        """Enviar un evento a los clientes de todos los nodos (solo a los locales sin bus)"""
+        if self.bus is not None:
+            await self.bus.publish(message)
+        else:
+            await self.send_to_all(message)
+
+    async def resume(self, websocket: WebSocket, last_seen: Dict[str, int], include_active: bool = True) -> int:
+        """Reenviar a un cliente lo que se perdió desde ``{test_id: último seq}``"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return 0
+        # Un delta que no cabe holgadamente en la cola se sustituye por un snapshot completo
+        messages = self.journal.replay(last_seen, include_active, max_delta=self.max_queue // 2)
+        for text in messages:
+            self._deliver(client, text, None)
+        WS_REPLAY_MESSAGES.inc(amount=len(messages))
+        return len(messages)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de envío por cliente"""
+        return {
+            "connections": len(self.clients),
+            "max_queue": self.max_queue,
+            "slow_disconnects": self.slow_disconnects,
+            "replay": self.journal.get_stats(),
+            "clients": [client.get_stats() for client in self.clients.values()],
+        }
+
+    async def broadcast_instrument_status(self, instrument_name: str, status: Optional[dict] = None):
+        """Broadcast del estado de un instrumento específico (por defecto, el de la caché)"""
+        if status is None:
+            if self.telemetry is None:
+                return
+            status = self.telemetry.get(instrument_name)
+            if status is None:
+                return
         message = {
             "type": "instrument_status",
             "instrument": instrument_name,
             "data": status,
             "timestamp": asyncio.get_event_loop().time()
         }
-        await self.send_to_all(message)
+        await self.publish(message)
 
     async def broadcast_test_progress(self, test_id: str, step: str, progress: float):
         """Broadcast del progreso de una prueba"""
@@ -57,7 +240,7 @@ class ConnectionManager:
             "progress": progress,
             "timestamp": asyncio.get_event_loop().time()
         }
-        await self.send_to_all(message)
+        await self.publish(message)
 
     async def broadcast_test_result(self, test_id: str, step_name: str, result: dict):
         """Broadcast de resultado de un paso de prueba"""
@@ -68,4 +251,4 @@ class ConnectionManager:
             "result": result,
             "timestamp": asyncio.get_event_loop().time()
         }
-        await self.send_to_all(message)
\ No newline at end of file
+        await self.publish(message)
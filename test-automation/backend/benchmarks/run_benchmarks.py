@@ -0,0 +1,368 @@
+"""Benchmarks de rendimiento sobre instrumentos simulados
+
+Uso (desde ``backend/``):
+
+    python -m benchmarks.run_benchmarks --output benchmark_report.json
+    python -m benchmarks.run_benchmarks --baseline benchmark_report.json --max-regression 0.2
+
+Genera un informe JSON con sequences/hour, overhead por paso, latencia de
+broadcast con N clientes WebSocket, throughput de escritura del almacén
+de resultados y del pipeline de adquisición de la DAQ. Con ``--baseline`` compara contra un informe anterior y
+termina con código 1 si alguna métrica empeora más de lo permitido.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from api.websocket import ConnectionManager
+from hardware.daq_controller import Collector, RunningStats, ThresholdDetector, decimate, run_pipeline
+from hardware.instrument_pool import InstrumentPool
+from hardware.simulated import SimulatedDAQSource, SimulatedResourceManager
+from models.test_models import DAQConfig, InstrumentConfig
+from storage.results_store import ResultsStore
+from test_engine.engine import TestEngine
+
+# Sentido de cada métrica para detectar regresiones
+HIGHER_IS_BETTER = {"sequences_per_hour", "rows_per_second", "steps_per_second", "samples_per_second",
+                    "realtime_factor"}
+LOWER_IS_BETTER = {"overhead_per_step_ms", "p50_ms", "p95_ms", "max_ms", "step_p50_us", "step_p95_us",
+                   "allocated_bytes_per_step", "retained_bytes_per_step"}
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def power_sequence(index: int, steps: int, instrument: str) -> Dict[str, Any]:
+    """Secuencia típica: consignas de fuente y medición de tensión"""
+    sequence_steps = []
+    for step in range(steps):
+        voltage = 1.0 + (step % 10)
+        sequence_steps.append({
+            "type": "power_supply", "name": f"set_{step}", "instrument": instrument,
+            "voltage": voltage, "current_limit": 1.0, "stabilization_time_ms": 0
+        })
+        sequence_steps.append({
+            "type": "measurement", "name": f"meas_{step}", "instrument": instrument,
+            "measurement_type": "voltage", "expected_value": voltage, "tolerance": 0.1
+        })
+    return {"id": f"bench_{instrument}", "version": "1", "name": f"Benchmark {index}", "steps": sequence_steps}
+
+class BenchmarkClient:
+    """WebSocket en memoria que registra el instante de recepción"""
+
+    def __init__(self, index: int, send_delay: float = 0.0):
+        self.client = None
+        self.index = index
+        self.send_delay = send_delay
+        self.latencies: List[float] = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+    async def send_text(self, text: str):
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        sent_at = json.loads(text)["sent_at"]
+        self.latencies.append(time.perf_counter() - sent_at)
+
+async def bench_sequences(stations: int, runs: int, steps: int, latency_s: float) -> Dict[str, Any]:
+    """Ejecuciones completas en paralelo (una fuente simulada por estación)
+
+    Todas las estaciones ejecutan la misma secuencia, que nombra el
+    instrumento lógico ``power_supply``; el motor lo traduce a la fuente
+    ``power_supply@<estación>`` de cada una.
+    """
+    pool = InstrumentPool(resource_manager=SimulatedResourceManager(latency_s=latency_s))
+    for station in range(stations):
+        name = f"power_supply@{station}"
+        await pool.connect(name, InstrumentConfig(name=name, type="power_supply", resource_name=f"SIM::{name}"))
+    engine = TestEngine(pool=pool, max_parallel_runs=stations)
+
+    async def station_loop(station: int, count: int) -> List[float]:
+        durations = []
+        for run in range(count):
+            started = time.perf_counter()
+            status = await engine.run_sequence(power_sequence(run, steps, "power_supply"), station_id=str(station))
+            if status["status"] != "completed":
+                raise RuntimeError(f"Ejecución de benchmark fallida: {status}")
+            durations.append(time.perf_counter() - started)
+        return durations
+
+    per_station = max(1, runs // stations)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(station_loop(station, per_station) for station in range(stations)))
+    elapsed = time.perf_counter() - started
+    await pool.close_all()
+
+    durations = [duration for station in results for duration in station]
+    return {
+        "stations": stations,
+        "runs": len(durations),
+        "steps_per_run": steps * 2,
+        "instrument_latency_ms": latency_s * 1000,
+        "elapsed_s": elapsed,
+        "sequences_per_hour": len(durations) / elapsed * 3600,
+        "p50_ms": percentile(durations, 0.5) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+    }
+
+async def bench_step_overhead(steps: int) -> Dict[str, Any]:
+    """Coste del motor por paso con pasos que no hacen nada (delay de 0 ms)"""
+    engine = TestEngine(simulate=False)
+    sequence = {"id": "bench_overhead", "version": "1", "name": "Overhead",
+                "steps": [{"type": "delay", "name": f"d{index}", "delay_ms": 0} for index in range(steps)]}
+    engine.compile(sequence)  # El plan compilado no cuenta como overhead de ejecución
+
+    started = time.perf_counter()
+    await engine.run_sequence(sequence)
+    elapsed = time.perf_counter() - started
+    return {
+        "steps": steps,
+        "elapsed_s": elapsed,
+        "overhead_per_step_ms": elapsed / steps * 1000,
+        "steps_per_second": steps / elapsed,
+    }
+
+async def bench_step_results(steps: int) -> Dict[str, Any]:
+    """Memoria y latencia por paso del camino de resultados (registro, JSON, buffer de reenvío)
+
+    Pasos vacíos (delay de 0 ms) con la notificación por el ConnectionManager
+    (serialización y buffer de reenvío) para aislar el coste de representar
+    cada resultado. ``allocated_bytes_per_step`` es el pico de memoria
+    asignada entre step_started y el envío de step_completed (mediana);
+    ``retained_bytes_per_step`` la que queda viva al terminar la ejecución.
+    """
+    engine = TestEngine(simulate=False)
+    manager = ConnectionManager()
+    sequence = {"id": "bench_results", "version": "1", "name": "Results",
+                "steps": [{"type": "delay", "name": f"d{index}", "delay_ms": 0} for index in range(steps)]}
+    engine.compile(sequence)
+    await engine.run_sequence(sequence, manager.send_to_all)  # Calentamiento
+
+    latencies: List[float] = []
+    last = [time.perf_counter()]
+
+    async def callback(message: Dict[str, Any]):
+        if message.get("type") == "step_completed":
+            now = time.perf_counter()
+            latencies.append(now - last[0])
+            last[0] = now
+        await manager.send_to_all(message)
+
+    started = time.perf_counter()
+    await engine.run_sequence(sequence, callback)
+    elapsed = time.perf_counter() - started
+
+    # Segunda pasada con tracemalloc (más lenta): solo para medir memoria
+    peaks: List[float] = []
+    step_start = [0]
+
+    async def traced_callback(message: Dict[str, Any]):
+        if message.get("type") == "step_started":
+            tracemalloc.reset_peak()
+            step_start[0] = tracemalloc.get_traced_memory()[0]
+        await manager.send_to_all(message)
+        if message.get("type") == "step_completed":
+            peaks.append(tracemalloc.get_traced_memory()[1] - step_start[0])
+
+    engine.last_run = None
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    await engine.run_sequence(sequence, traced_callback)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        "steps": steps,
+        "elapsed_s": elapsed,
+        "step_p50_us": percentile(latencies, 0.5) * 1e6,
+        "step_p95_us": percentile(latencies, 0.95) * 1e6,
+        "allocated_bytes_per_step": percentile(peaks, 0.5) if peaks else 0.0,
+        "retained_bytes_per_step": retained / steps,
+    }
+
+async def bench_broadcast(clients: int, messages: int, slow_clients: int) -> Dict[str, Any]:
+    """Latencia de entrega de send_to_all con N clientes (algunos lentos)"""
+    manager = ConnectionManager(max_queue=max(messages, 1))
+    connections = []
+    for index in range(clients):
+        client = BenchmarkClient(index, send_delay=0.005 if index < slow_clients else 0.0)
+        await manager.connect(client)
+        connections.append(client)
+
+    started = time.perf_counter()
+    for index in range(messages):
+        await manager.send_to_all({"type": "test_result", "index": index, "sent_at": time.perf_counter()})
+        await asyncio.sleep(0)
+    enqueue_elapsed = time.perf_counter() - started
+
+    fast = [client for client in connections if not client.send_delay]
+    deadline = time.perf_counter() + 30
+    while any(len(client.latencies) < messages for client in fast) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+
+    latencies = [latency for client in fast for latency in client.latencies]
+    stats = manager.get_stats()
+    for client in connections:
+        manager.disconnect(client)
+    return {
+        "clients": clients,
+        "slow_clients": slow_clients,
+        "messages": messages,
+        "enqueue_per_message_ms": enqueue_elapsed / messages * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        "slow_disconnects": stats["slow_disconnects"],
+    }
+
+async def bench_results_store(runs: int, steps: int) -> Dict[str, Any]:
+    """Throughput de escritura de pasos y mediciones en SQLite"""
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultsStore(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        await asyncio.to_thread(store.start)
+        started = time.perf_counter()
+        rows = 0
+        for run in range(runs):
+            test_id = f"bench_{run}"
+            store.begin_run(test_id, {"id": "bench", "name": "Benchmark"})
+            for step in range(steps):
+                measurements = {"voltage_set": 5.0, "voltage_measured": 5.01, "current_measured": 0.1}
+                store.record_step(test_id, "power_supply", {
+                    "step_name": f"s{step}", "step_number": step + 1, "passed": True,
+                    "start_time": "2024-01-01T00:00:00", "end_time": "2024-01-01T00:00:01",
+                    "duration": 0.001, "measurements": measurements, "error": None
+                })
+                rows += 1 + len(measurements)
+            store.finish_run(test_id, "completed", True, 1.0)
+        await store.flush()
+        elapsed = time.perf_counter() - started
+        await asyncio.to_thread(store.stop)
+    return {
+        "runs": runs,
+        "steps": runs * steps,
+        "rows": rows,
+        "elapsed_s": elapsed,
+        "rows_per_second": rows / elapsed,
+    }
+
+async def bench_daq_pipeline(channels: int, sample_rate: float, seconds: float) -> Dict[str, Any]:
+    """Generación simulada + pipeline completo (estadísticos, umbral, diezmado) sin ritmo real"""
+    config = DAQConfig(device_name="SIM::BENCH", input_channels=[f"ai{i}" for i in range(channels)],
+                       sample_rate=sample_rate)
+    block_size = max(1, int(sample_rate * 0.01))
+    source = SimulatedDAQSource(signals={"ai0": {"offset": 1.0, "amplitude": 1.0, "frequency": 50.0}},
+                                seed=0, realtime=False)
+    source.open(config, block_size, block_size)
+    block = np.empty((channels, block_size))
+    n_blocks = int(seconds * sample_rate / block_size)
+
+    def blocks():
+        for index in range(n_blocks):
+            source.read_into(block)
+            yield index * block_size, block
+
+    stats = RunningStats(channels)
+    detector = ThresholdDetector(channels, 1.0, "both")
+    preview = Collector(channels, 2000)
+    factor = max(1, n_blocks * block_size // 2000)
+    started = time.perf_counter()
+    await asyncio.to_thread(run_pipeline, blocks(), stats, detector, partial(decimate, factor=factor), preview)
+    elapsed = time.perf_counter() - started
+    samples = stats.count * channels
+    return {
+        "channels": channels,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "elapsed_s": elapsed,
+        "samples_per_second": samples / elapsed,
+        "realtime_factor": stats.count / sample_rate / elapsed,
+    }
+
+async def run_all(args) -> Dict[str, Any]:
+    return {
+        "sequences": await bench_sequences(args.stations, args.runs, args.steps, args.latency_ms / 1000.0),
+        "step_overhead": await bench_step_overhead(args.overhead_steps),
+        "step_results": await bench_step_results(args.result_steps),
+        "broadcast": await bench_broadcast(args.clients, args.messages, args.slow_clients),
+        "results_store": await bench_results_store(args.store_runs, args.store_steps),
+        "daq_pipeline": await bench_daq_pipeline(args.daq_channels, args.daq_rate, args.daq_seconds),
+    }
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Métricas que han empeorado más de ``max_regression`` (fracción) respecto al baseline"""
+    regressions = []
+    for name, metrics in report["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name, {})
+        for metric, value in metrics.items():
+            old = previous.get(metric)
+            if not isinstance(old, (int, float)) or not old:
+                continue
+            if metric in HIGHER_IS_BETTER and value < old * (1 - max_regression):
+                regressions.append(f"{name}.{metric}: {value:.3f} < {old:.3f}")
+            elif metric in LOWER_IS_BETTER and value > old * (1 + max_regression):
+                regressions.append(f"{name}.{metric}: {value:.3f} > {old:.3f}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks del backend sobre instrumentos simulados")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--baseline", help="Informe anterior con el que comparar")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--stations", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=40)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--overhead-steps", type=int, default=200)
+    parser.add_argument("--result-steps", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--slow-clients", type=int, default=5)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--store-runs", type=int, default=20)
+    parser.add_argument("--store-steps", type=int, default=100)
+    parser.add_argument("--daq-channels", type=int, default=8)
+    parser.add_argument("--daq-rate", type=float, default=50000.0)
+    parser.add_argument("--daq-seconds", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    report = {
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "benchmarks": asyncio.run(run_all(args)),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for name, metrics in report["benchmarks"].items():
+        summary = ", ".join(f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                            for key, value in metrics.items())
+        print(f"{name}: {summary}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
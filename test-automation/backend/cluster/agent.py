@@ -0,0 +1,95 @@
+import asyncio
+from typing import Dict, Any, Optional
+
+from config.settings import settings
+
+class StationAgent:
+    """Agente de banco: anuncia sus instrumentos y ejecuta los trabajos que le asigna el coordinador
+
+    Cada ``heartbeat_interval`` envía por el bus un latido con los
+    instrumentos del pool, los que están reservados, la capacidad del motor
+    y los trabajos en curso. Los trabajos (``dispatch_job``) se ejecutan con
+    el ``RunSupervisor`` local y su plan compilado de la caché del motor;
+    los eventos de la ejecución se publican en el bus como cualquier otra.
+    Al terminar se avisa al coordinador con ``job_finished``.
+    """
+
+    def __init__(self, supervisor, bus, heartbeat_interval: Optional[float] = None):
+        self.supervisor = supervisor
+        self.engine = supervisor.engine
+        self.bus = bus
+        self.agent_id = bus.node_id
+        self.heartbeat_interval = heartbeat_interval or settings.CLUSTER_HEARTBEAT_INTERVAL
+        self.jobs: Dict[str, str] = {}  # job_id -> test_id de los trabajos en curso
+        self._task: Optional[asyncio.Task] = None
+        bus.on_command(self.handle_command)
+
+    @property
+    def capacity(self) -> int:
+        return self.engine.max_parallel_runs
+
+    def get_status(self) -> Dict[str, Any]:
+        """Contenido del latido"""
+        pool = self.engine.pool
+        return {
+            "agent": self.agent_id,
+            "instruments": pool.names() if pool is not None else [],
+            "busy": sorted(self.engine.arbiter.get_leases()),
+            "simulate": self.engine.simulate,
+            "capacity": self.capacity,
+            "load": len(self.supervisor.tasks),
+            "jobs": list(self.jobs),
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self.bus.send_command({"type": "agent_heartbeat", **self.get_status()})
+            except Exception as e:
+                print(f"Error enviando latido del agente {self.agent_id}: {str(e)}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    async def handle_command(self, command: Dict[str, Any]):
+        if command.get("target") != self.agent_id:
+            return
+        if command.get("type") == "dispatch_job":
+            await self._accept(command)
+
+    async def _accept(self, command: Dict[str, Any]):
+        job_id = command["job_id"]
+        if job_id in self.jobs:
+            return
+        if len(self.supervisor.tasks) >= self.capacity:
+            # El latido que vio el coordinador ya no es actual: que lo reasigne
+            await self._reply("job_rejected", job_id, command.get("test_id"), reason="Sin capacidad")
+            return
+        test_id = self.supervisor.start(command["sequence"], self.bus.publish,
+                                        station_id=command.get("station_id"), test_id=command.get("test_id"))
+        self.jobs[job_id] = test_id
+        await self._reply("job_accepted", job_id, test_id)
+        asyncio.create_task(self._watch(job_id, test_id))
+
+    async def _watch(self, job_id: str, test_id: str):
+        try:
+            await self.supervisor.wait(test_id)
+        finally:
+            self.jobs.pop(job_id, None)
+            summary = self.supervisor.history.get(test_id, {})
+            await self._reply("job_finished", job_id, test_id, status=summary.get("status", "unknown"))
+
+    async def _reply(self, message_type: str, job_id: str, test_id: Optional[str], **fields):
+        await self.bus.send_command({"type": message_type, "agent": self.agent_id,
+                                     "job_id": job_id, "test_id": test_id, **fields})
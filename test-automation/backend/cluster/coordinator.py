@@ -0,0 +1,354 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional, Set
+
+from config.settings import settings
+from models.test_models import StartTestRequest
+from test_engine.plan import SequenceValidationError
+
+class AgentInfo:
+    """Último estado conocido de un agente (según su latido)"""
+
+    __slots__ = ("agent_id", "instruments", "busy", "simulate", "capacity", "load", "jobs", "last_seen")
+
+    def __init__(self, agent_id: str):
+        self.agent_id = agent_id
+        self.instruments: Set[str] = set()
+        self.busy: Set[str] = set()
+        self.simulate = False
+        self.capacity = 1
+        self.load = 0
+        self.jobs: Set[str] = set()  # Trabajos asignados por el coordinador
+        self.last_seen = time.monotonic()
+
+    def update(self, heartbeat: Dict[str, Any]):
+        self.instruments = set(heartbeat.get("instruments", []))
+        self.busy = set(heartbeat.get("busy", []))
+        self.simulate = bool(heartbeat.get("simulate", False))
+        self.capacity = max(int(heartbeat.get("capacity", 1)), 1)
+        self.load = int(heartbeat.get("load", 0))
+        self.last_seen = time.monotonic()
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "agent": self.agent_id,
+            "instruments": sorted(self.instruments),
+            "busy": sorted(self.busy),
+            "simulate": self.simulate,
+            "capacity": self.capacity,
+            "load": self.load,
+            "jobs": sorted(self.jobs),
+            "last_seen_seconds": time.monotonic() - self.last_seen,
+        }
+
+class Job:
+    """Petición de prueba encolada en el coordinador"""
+
+    __slots__ = ("job_id", "request", "sequence", "instruments", "station_id", "state", "agent",
+                 "test_id", "attempts", "submitted_at", "dispatched_at", "status", "error")
+
+    def __init__(self, request: StartTestRequest, sequence: Dict[str, Any], instruments: List[str],
+                 station_id: Optional[str] = None):
+        self.job_id = f"job_{uuid.uuid4().hex[:12]}"
+        self.request = request
+        self.sequence = sequence
+        self.instruments = frozenset(instruments)
+        self.station_id = station_id
+        self.state = "queued"  # queued -> dispatched -> running -> finished
+        self.agent: Optional[str] = None
+        self.test_id: Optional[str] = None
+        self.attempts = 0
+        self.submitted_at = time.time()
+        self.dispatched_at: Optional[float] = None
+        self.status: Optional[str] = None  # Resultado final (completed, failed, stopped...)
+        self.error: Optional[str] = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "sequence_id": self.request.sequence_id,
+            "operator": self.request.operator,
+            "dut_serial_number": self.request.dut_serial_number,
+            "instruments": sorted(self.instruments),
+            "state": self.state,
+            "agent": self.agent,
+            "test_id": self.test_id,
+            "attempts": self.attempts,
+            "submitted_at": self.submitted_at,
+            "status": self.status,
+            "error": self.error,
+        }
+
+class Coordinator:
+    """Planificador central: cola de ``StartTestRequest`` repartida entre agentes de banco
+
+    Las peticiones se validan y compilan al encolarlas (los errores de la
+    secuencia se devuelven en el momento) y se asignan en orden de llegada
+    al agente vivo que tenga todos los instrumentos del plan libres y menos
+    carga relativa; una petición que aún no cabe en ningún agente no
+    bloquea a las siguientes. Los instrumentos asignados se descuentan al
+    instante, sin esperar al siguiente latido.
+
+    Un agente sin latido durante ``agent_timeout`` se da por muerto y sus
+    trabajos vuelven a la cola con un test_id nuevo (hasta
+    ``max_attempts``); la ejecución abandonada se cierra con un
+    ``test_error``. El estado vive en memoria: debe haber un solo
+    coordinador por bus.
+    """
+
+    def __init__(self, bus, compile: Callable, sequences: Callable[[str], Optional[Dict[str, Any]]],
+                 new_test_id: Callable[[], str], agent_timeout: Optional[float] = None,
+                 max_attempts: Optional[int] = None, history_size: int = 500):
+        self.bus = bus
+        self.compile = compile
+        self.sequences = sequences
+        self.new_test_id = new_test_id
+        self.agent_timeout = agent_timeout or settings.CLUSTER_AGENT_TIMEOUT
+        self.max_attempts = max_attempts or settings.CLUSTER_MAX_ATTEMPTS
+        self.history_size = history_size
+        self.agents: Dict[str, AgentInfo] = {}
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()  # Pendientes y en curso, en orden de llegada
+        self.history: "OrderedDict[str, Job]" = OrderedDict()
+        self.by_test_id: Dict[str, Job] = {}
+        self.reclaimed = 0
+        self._task: Optional[asyncio.Task] = None
+        bus.on_command(self.handle_command)
+
+    # Cola
+
+    async def submit(self, request: StartTestRequest, station_id: Optional[str] = None,
+                     sequence: Optional[Dict[str, Any]] = None, test_id: Optional[str] = None) -> Job:
+        """Encolar una petición (con la secuencia de la biblioteca o la indicada)
+
+        ``KeyError`` si la secuencia no existe y ``SequenceValidationError``
+        si no compila.
+        """
+        sequence = sequence or self.sequences(request.sequence_id)
+        if sequence is None:
+            raise KeyError(request.sequence_id)
+        plan = self.compile(sequence)
+        job = Job(request, sequence, list(plan.instruments), station_id)
+        job.test_id = test_id or self.new_test_id()
+        self.jobs[job.job_id] = job
+        self.by_test_id[job.test_id] = job
+        await self._publish_job("test_queued", job)
+        await self.schedule()
+        return job
+
+    async def cancel(self, test_id: Optional[str] = None) -> List[str]:
+        """Retirar de la cola los trabajos aún no asignados (todos sin ``test_id``)"""
+        targets = [job for job in self.jobs.values()
+                   if job.state == "queued" and (test_id is None or job.test_id == test_id)]
+        for job in targets:
+            job.status = "stopped"
+            self._finish(job)
+            await self._publish_job("test_stopped", job)
+        # Los ya asignados los detiene su agente (stop_test llega a todos los nodos)
+        if test_id is not None and test_id in self.by_test_id and not targets:
+            self.by_test_id[test_id].status = "stopped"
+        return [job.test_id for job in targets]
+
+    async def schedule(self) -> int:
+        """Asignar los trabajos en cola que quepan; devuelve cuántos se han asignado"""
+        dispatched = 0
+        for job in list(self.jobs.values()):
+            if job.state != "queued":
+                continue
+            agent = self._place(job)
+            if agent is None:
+                continue
+            await self._dispatch(job, agent)
+            dispatched += 1
+        return dispatched
+
+    def _place(self, job: Job) -> Optional[AgentInfo]:
+        best = None
+        for agent in self.agents.values():
+            if agent.load >= agent.capacity:
+                continue
+            if not agent.simulate and not job.instruments <= agent.instruments:
+                continue
+            if job.instruments & agent.busy:
+                continue
+            if best is None or agent.load / agent.capacity < best.load / best.capacity:
+                best = agent
+        return best
+
+    async def _dispatch(self, job: Job, agent: AgentInfo):
+        job.state = "dispatched"
+        job.agent = agent.agent_id
+        job.attempts += 1
+        job.dispatched_at = time.monotonic()
+        agent.jobs.add(job.job_id)
+        # Reservar en la vista local hasta que el latido lo confirme
+        agent.load += 1
+        agent.busy |= job.instruments
+        await self.bus.send_command({
+            "type": "dispatch_job",
+            "target": agent.agent_id,
+            "job_id": job.job_id,
+            "test_id": job.test_id,
+            "station_id": job.station_id,
+            "sequence": job.sequence,
+        })
+
+    def _finish(self, job: Job):
+        job.state = "finished"
+        self.jobs.pop(job.job_id, None)
+        self.by_test_id.pop(job.test_id, None)
+        agent = self.agents.get(job.agent) if job.agent else None
+        if agent is not None:
+            agent.jobs.discard(job.job_id)
+        self.history[job.job_id] = job
+        if len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+
+    async def _requeue(self, job: Job, reason: str):
+        """Devolver a la cola un trabajo cuyo agente lo rechazó o desapareció"""
+        agent = self.agents.get(job.agent) if job.agent else None
+        if agent is not None:
+            agent.jobs.discard(job.job_id)
+        previous = job.test_id
+        if job.state == "running":
+            # Cerrar en los clientes la ejecución que se queda a medias
+            await self.bus.publish({"type": "test_error", "test_id": previous, "station_id": job.station_id,
+                                    "error": reason})
+        self.by_test_id.pop(previous, None)
+        if job.status == "stopped" or job.attempts >= self.max_attempts:
+            job.status = job.status or "failed"
+            job.error = reason
+            self._finish(job)
+            return
+        job.state = "queued"
+        job.agent = None
+        job.test_id = self.new_test_id()
+        self.by_test_id[job.test_id] = job
+        await self._publish_job("test_queued", job, reason=reason, previous_test_id=previous)
+
+    async def _publish_job(self, message_type: str, job: Job, **fields):
+        await self.bus.publish({"type": message_type, "test_id": job.test_id, "job_id": job.job_id,
+                                "station_id": job.station_id, "queued": len(self.jobs), **fields})
+
+    # Mensajes de los agentes
+
+    async def handle_command(self, command: Dict[str, Any]):
+        command_type = command.get("type")
+        if command_type == "agent_heartbeat":
+            await self._heartbeat(command)
+        elif command_type in ("job_accepted", "job_rejected", "job_finished"):
+            job = self.jobs.get(command.get("job_id"))
+            if job is None or job.agent != command.get("agent"):
+                return  # Respuesta de una asignación ya reclamada
+            if command_type == "job_accepted":
+                job.state = "running"
+            elif command_type == "job_rejected":
+                await self._requeue(job, command.get("reason") or "Rechazado por el agente")
+                await self.schedule()
+            else:
+                job.status = command.get("status")
+                self._finish(job)
+                await self.schedule()
+        elif command_type == "submit_job":
+            await self._submit_command(command)
+        elif command_type == "stop_test" and command.get("test_id"):
+            await self.cancel(command["test_id"])
+
+    async def _submit_command(self, command: Dict[str, Any]):
+        """Petición llegada por el bus desde cualquier nodo (el test_id ya lo eligió el emisor)"""
+        try:
+            await self.submit(StartTestRequest(**command["request"]), command.get("station_id"),
+                              command.get("sequence"), command.get("test_id"))
+        except KeyError as e:
+            error = f"Secuencia no encontrada: {e.args[0]}"
+        except (SequenceValidationError, ValueError) as e:
+            error = f"Secuencia inválida: {str(e)}"
+        else:
+            return
+        await self.bus.publish({"type": "test_error", "test_id": command.get("test_id"),
+                                "station_id": command.get("station_id"), "error": error})
+
+    async def _heartbeat(self, heartbeat: Dict[str, Any]):
+        agent_id = heartbeat["agent"]
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            agent = self.agents[agent_id] = AgentInfo(agent_id)
+            print(f"Agente registrado: {agent_id}")
+        agent.update(heartbeat)
+        # Contar lo asignado que el agente aún no ha arrancado
+        running = set(heartbeat.get("jobs", []))
+        now = time.monotonic()
+        for job_id in list(agent.jobs):
+            job = self.jobs.get(job_id)
+            if job is None or job_id in running:
+                continue
+            if job.state == "dispatched" and now - job.dispatched_at > self.agent_timeout:
+                await self._requeue(job, f"El agente {agent_id} no aceptó el trabajo")
+            elif job.state == "dispatched":
+                agent.load += 1
+                agent.busy |= job.instruments
+            else:
+                # Terminado, pero su job_finished se perdió (pub/sub no garantiza entrega)
+                self._finish(job)
+        await self.schedule()
+
+    # Vigilancia de agentes
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.agent_timeout / 2)
+            try:
+                await self.reclaim()
+            except Exception as e:
+                print(f"Error revisando agentes: {str(e)}")
+
+    async def reclaim(self) -> int:
+        """Dar por muertos los agentes sin latido y devolver sus trabajos a la cola"""
+        now = time.monotonic()
+        reclaimed = 0
+        for agent in [agent for agent in self.agents.values() if now - agent.last_seen > self.agent_timeout]:
+            del self.agents[agent.agent_id]
+            print(f"Agente sin latido, se reclaman sus trabajos: {agent.agent_id}")
+            for job_id in list(agent.jobs):
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    await self._requeue(job, f"Agente {agent.agent_id} sin latido")
+                    reclaimed += 1
+        self.reclaimed += reclaimed
+        if reclaimed:
+            await self.schedule()
+        return reclaimed
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "agents": [agent.get_status() for agent in self.agents.values()],
+            "queued": sum(1 for job in self.jobs.values() if job.state == "queued"),
+            "jobs": [job.get_status() for job in self.jobs.values()],
+            "finished": [job.get_status() for job in reversed(self.history.values())],
+            "reclaimed": self.reclaimed,
+        }
+
+def submit_job_command(test_id: str, request: StartTestRequest, sequence: Optional[Dict[str, Any]] = None,
+                       station_id: Optional[str] = None) -> Dict[str, Any]:
+    """Orden ``submit_job`` para el coordinador, esté en este nodo o en otro"""
+    return {
+        "type": "submit_job",
+        "test_id": test_id,
+        "station_id": station_id,
+        "request": request.model_dump() if hasattr(request, "model_dump") else request.dict(),
+        "sequence": sequence,
+    }
@@ -0,0 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional
+
+class InstrumentArbiter:
+    """Arbitraje de acceso exclusivo a instrumentos entre ejecuciones concurrentes"""
+    
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._owners: Dict[str, str] = {}
+
+    def _get_lock(self, name: str) -> asyncio.Lock:
+        lock = self._locks.get(name)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[name] = lock
+        return lock
+
+    @asynccontextmanager
+    async def lease(self, names: Iterable[str], owner: str, timeout: Optional[float] = None):
+        """Reservar un conjunto de instrumentos para una ejecución
+        
+        Los bloqueos se adquieren siempre en orden alfabético para que dos
+        ejecuciones que piden instrumentos solapados no se bloqueen mutuamente.
+        Con ``timeout`` se lanza TimeoutError si no se consiguen todos a tiempo.
+        """
+        ordered: List[str] = sorted(set(names))
+        acquired: List[str] = []
+        deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+        try:
+            for name in ordered:
+                lock = self._get_lock(name)
+                if deadline is None:
+                    await lock.acquire()
+                else:
+                    remaining = max(deadline - asyncio.get_running_loop().time(), 0.0)
+                    try:
+                        await asyncio.wait_for(lock.acquire(), remaining)
+                    except asyncio.TimeoutError:
+                        raise TimeoutError(f"Instrumento {name} ocupado por {self._owners.get(name)}")
+                acquired.append(name)
+                self._owners[name] = owner
+            yield ordered
+        finally:
+            for name in reversed(acquired):
+                self._owners.pop(name, None)
+                self._locks[name].release()
+
+    def is_leased(self, name: str) -> bool:
+        """Verificar si un instrumento está reservado por alguna ejecución"""
+        lock = self._locks.get(name)
+        return lock is not None and lock.locked()
+
+    def owner_of(self, name: str) -> Optional[str]:
+        """Obtener el identificador de la ejecución que tiene reservado el instrumento"""
+        return self._owners.get(name)
+
+    def get_leases(self) -> Dict[str, str]:
+        """Obtener el mapa instrumento -> ejecución de las reservas activas"""
+        return dict(self._owners)
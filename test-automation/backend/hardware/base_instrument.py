@@ -1,13 +1,32 @@
+import asyncio
+import contextvars
+import functools
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, List, Optional
+
+from monitoring.metrics import timed_io
+from .deadline import clamp_timeout_ms
 
 class BaseInstrument(ABC):
-    """Clase base para todos los instrumentos de medida"""
+    """Clase base para todos los instrumentos de medida
+    
+    Cada instrumento tiene su propio ejecutor de E/S de un solo hilo: las
+    llamadas bloqueantes (pyvisa, nidaqmx...) se serializan ahí y nunca se
+    ejecutan en el event loop. Un instrumento lento o colgado solo detiene
+    su propia cola, no el servidor.
+    
+    Cada operación usa como timeout de E/S el menor entre el de la sesión
+    y el presupuesto que le quede al paso/secuencia en curso.
+    """
     
     def __init__(self, resource_name: str):
         self.resource_name = resource_name
         self.connected = False
         self.last_error = None
+        self.instrument = None  # Sesión de bajo nivel (p.ej. recurso pyvisa)
+        self._io_executor: Optional[ThreadPoolExecutor] = None
 
     @abstractmethod
     async def connect(self) -> bool:
@@ -39,4 +58,74 @@ class BaseInstrument(ABC):
 
     def get_last_error(self) -> str:
         """Obtener último error registrado"""
-        return self.last_error
\ No newline at end of file
+        return self.last_error
+
+    # E/S serializada fuera del event loop
+
+    def _get_io_executor(self) -> ThreadPoolExecutor:
+        if self._io_executor is None:
+            self._io_executor = ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f"io-{self.resource_name}"
+            )
+        return self._io_executor
+
+    async def run_io(self, func: Callable, *args, **kwargs):
+        """Ejecutar una operación bloqueante en la cola de E/S del instrumento"""
+        loop = asyncio.get_running_loop()
+        # Copiar el contexto para que la E/S quede asociada a la traza de la ejecución
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            self._get_io_executor(),
+            functools.partial(context.run, func, *args, **kwargs)
+        )
+
+    async def write(self, command: str):
+        """Enviar un comando sin respuesta"""
+        await self.run_io(self._write_sync, command)
+
+    async def query(self, command: str) -> str:
+        """Enviar una consulta y devolver la respuesta sin espacios finales"""
+        return await self.run_io(self._query_sync, command)
+
+    async def query_many(self, commands: List[str]) -> List[str]:
+        """Enviar varias consultas como una única tarea de la cola de E/S"""
+        return await self.run_io(self._query_many_sync, list(commands))
+
+    def shutdown_io(self):
+        """Liberar el ejecutor de E/S (tras cerrar la sesión)"""
+        if self._io_executor is not None:
+            self._io_executor.shutdown(wait=False)
+            self._io_executor = None
+
+    def _require_session(self):
+        if self.instrument is None:
+            raise RuntimeError(f"Instrumento {self.resource_name} sin sesión abierta")
+        return self.instrument
+
+    @contextmanager
+    def _io_budget(self, session):
+        """Recortar el timeout de la sesión al presupuesto restante durante una operación"""
+        base = getattr(session, "timeout", None)
+        clamped = clamp_timeout_ms(float("inf") if base is None else base)
+        if clamped == base or clamped == float("inf"):
+            yield
+            return
+        session.timeout = clamped
+        try:
+            yield
+        finally:
+            session.timeout = base
+
+    def _write_sync(self, command: str):
+        session = self._require_session()
+        with self._io_budget(session), timed_io(self.resource_name, command):
+            session.write(command)
+
+    def _query_sync(self, command: str) -> str:
+        session = self._require_session()
+        with self._io_budget(session), timed_io(self.resource_name, command):
+            return session.query(command).strip()
+
+    def _query_many_sync(self, commands: List[str]) -> List[str]:
+        return [self._query_sync(command) for command in commands]
@@ -0,0 +1,446 @@
+import asyncio
+import math
+import threading
+import time
+from functools import partial
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from models.test_models import DAQConfig
+from .base_instrument import BaseInstrument
+from .deadline import DeadlineExceeded, remaining
+
+try:
+    import nidaqmx
+    from nidaqmx.constants import AcquisitionType
+    from nidaqmx.stream_readers import AnalogMultiChannelReader
+except ImportError:  # Sin nidaqmx solo se puede usar una fuente simulada
+    nidaqmx = None
+
+# Bloque del flujo de muestras: (índice absoluto de la primera muestra, array canales x n)
+Block = Tuple[int, np.ndarray]
+Stage = Callable[[Iterator[Block]], Iterator[Block]]
+
+class BufferOverrun(RuntimeError):
+    """El lector se ha quedado atrás y el buffer circular ya ha sobrescrito sus muestras"""
+    pass
+
+class SampleRing:
+    """Buffer circular preasignado de bloques de muestras
+
+    Cada bloque ocupa una ranura contigua (canales x ``block_size``) en la
+    que la fuente escribe directamente, sin copias intermedias. El índice
+    de bloque es absoluto y crece indefinidamente; la ranura es
+    ``índice % n_blocks``.
+    """
+
+    def __init__(self, channels: int, block_size: int, n_blocks: int, dtype=np.float64):
+        self.block_size = block_size
+        self.n_blocks = n_blocks
+        self.blocks = np.zeros((n_blocks, channels, block_size), dtype=dtype)
+        self.written = 0  # Bloques completos publicados
+
+    @property
+    def total_samples(self) -> int:
+        return self.written * self.block_size
+
+    def slot(self) -> np.ndarray:
+        """Ranura donde la fuente escribe el siguiente bloque"""
+        return self.blocks[self.written % self.n_blocks]
+
+    def commit(self):
+        self.written += 1
+
+    def check(self, index: int):
+        # La ranura de ``index`` se reutiliza para el bloque index + n_blocks,
+        # que empieza a escribirse en cuanto se publica el anterior
+        if index <= self.written - self.n_blocks:
+            raise BufferOverrun(f"Bloque {index} sobrescrito (escritos: {self.written})")
+
+    def block(self, index: int) -> np.ndarray:
+        self.check(index)
+        return self.blocks[index % self.n_blocks]
+
+# Etapas del pipeline: generadores que reciben y devuelven bloques. Las
+# operaciones son vectorizadas por bloque; no hay bucles por muestra.
+
+def decimate(blocks: Iterable[Block], factor: int) -> Iterator[Block]:
+    """Promediar cada ``factor`` muestras (el resto pasa al bloque siguiente)"""
+    if factor <= 1:
+        yield from blocks
+        return
+    carry: Optional[np.ndarray] = None
+    for start, data in blocks:
+        if carry is not None:
+            start -= carry.shape[1]
+            data = np.concatenate((carry, data), axis=1)
+        usable = data.shape[1] // factor * factor
+        if usable:
+            yield start // factor, data[:, :usable].reshape(data.shape[0], -1, factor).mean(axis=2)
+        # Copia: ``data`` puede ser una vista del buffer circular
+        carry = data[:, usable:].copy() if usable < data.shape[1] else None
+
+class RunningStats:
+    """Media, RMS, mínimo y máximo por canal acumulados bloque a bloque"""
+
+    def __init__(self, channels: int):
+        self.count = 0
+        self.sum = np.zeros(channels)
+        self.sum_sq = np.zeros(channels)
+        self.min = np.full(channels, np.inf)
+        self.max = np.full(channels, -np.inf)
+
+    def __call__(self, blocks: Iterable[Block]) -> Iterator[Block]:
+        for start, data in blocks:
+            self.count += data.shape[1]
+            self.sum += data.sum(axis=1)
+            self.sum_sq += np.einsum("ij,ij->i", data, data)
+            np.minimum(self.min, data.min(axis=1), out=self.min)
+            np.maximum(self.max, data.max(axis=1), out=self.max)
+            yield start, data
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.sum / max(self.count, 1)
+
+    @property
+    def rms(self) -> np.ndarray:
+        return np.sqrt(self.sum_sq / max(self.count, 1))
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.maximum(self.rms ** 2 - self.mean ** 2, 0.0))
+
+class ThresholdDetector:
+    """Cruces de un nivel por canal (flanco ``rising``, ``falling`` o ``both``)"""
+
+    EDGES = ("rising", "falling", "both")
+
+    def __init__(self, channels: int, level: float, edge: str = "rising"):
+        if edge not in self.EDGES:
+            raise ValueError(f"Flanco desconocido: {edge}")
+        self.level = level
+        self.edge = edge
+        self.crossings = np.zeros(channels, dtype=np.int64)
+        self.first = np.full(channels, -1, dtype=np.int64)  # Índice absoluto del primer cruce
+        self._previous: Optional[np.ndarray] = None
+
+    def _select(self, changes: np.ndarray) -> np.ndarray:
+        if self.edge == "rising":
+            return changes > 0
+        if self.edge == "falling":
+            return changes < 0
+        return changes != 0
+
+    def __call__(self, blocks: Iterable[Block]) -> Iterator[Block]:
+        for start, data in blocks:
+            above = (data >= self.level).view(np.int8)
+            # Transición en la muestra k+1 (dentro del bloque) y en la frontera con el anterior
+            inner = self._select(np.diff(above, axis=1))
+            boundary = (self._select(above[:, 0] - self._previous) if self._previous is not None
+                        else np.zeros(above.shape[0], dtype=bool))
+            self.crossings += inner.sum(axis=1) + boundary
+
+            pending = self.first < 0
+            if pending.any():
+                found_inner = inner.any(axis=1)
+                first_inner = start + 1 + inner.argmax(axis=1)
+                first = np.where(boundary, start, np.where(found_inner, first_inner, -1))
+                self.first = np.where(pending, first, self.first)
+            self._previous = above[:, -1].copy()
+            yield start, data
+
+class Collector:
+    """Guardar el flujo (p.ej. ya diezmado) en un array preasignado de ``max_points``"""
+
+    def __init__(self, channels: int, max_points: int):
+        self.data = np.empty((channels, max_points))
+        self.size = 0
+        self.dropped = 0
+
+    def __call__(self, blocks: Iterable[Block]) -> Iterator[Block]:
+        for start, data in blocks:
+            n = min(data.shape[1], self.data.shape[1] - self.size)
+            if n:
+                self.data[:, self.size:self.size + n] = data[:, :n]
+                self.size += n
+            self.dropped += data.shape[1] - n
+            yield start, data
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.data[:, :self.size]
+
+def run_pipeline(blocks: Iterable[Block], *stages: Stage):
+    """Encadenar las etapas sobre el flujo y consumirlo"""
+    stream: Iterable[Block] = blocks
+    for stage in stages:
+        stream = stage(stream)
+    for _ in stream:
+        pass
+
+class Acquisition:
+    """Resultado de una ventana de adquisición procesada por el pipeline"""
+
+    __slots__ = ("channels", "sample_rate", "start_index", "samples", "stats", "threshold",
+                 "preview", "preview_dt")
+
+    def __init__(self, channels: List[str], sample_rate: float, start_index: int, samples: int,
+                 stats: RunningStats, threshold: Optional[ThresholdDetector], preview: np.ndarray,
+                 preview_dt: float):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.start_index = start_index
+        self.samples = samples
+        self.stats = stats
+        self.threshold = threshold
+        self.preview = preview
+        self.preview_dt = preview_dt
+
+    def measurements(self, channels: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Medidas escalares por canal (``ai0_mean``, ``ai0_rms``...)"""
+        measurements: Dict[str, Any] = {}
+        for channel in channels or self.channels:
+            i = self.channels.index(channel)
+            measurements.update({
+                f"{channel}_mean": float(self.stats.mean[i]),
+                f"{channel}_rms": float(self.stats.rms[i]),
+                f"{channel}_std": float(self.stats.std[i]),
+                f"{channel}_min": float(self.stats.min[i]),
+                f"{channel}_max": float(self.stats.max[i]),
+            })
+            if self.threshold is not None:
+                first = int(self.threshold.first[i])
+                measurements[f"{channel}_crossings"] = int(self.threshold.crossings[i])
+                measurements[f"{channel}_first_crossing_ms"] = (
+                    (first - self.start_index) / self.sample_rate * 1000 if first >= 0 else None)
+        return measurements
+
+    def preview_columns(self, channels: Optional[Iterable[str]] = None) -> Dict[str, np.ndarray]:
+        return {channel: self.preview[self.channels.index(channel)] for channel in channels or self.channels}
+
+class NidaqmxSource:
+    """Fuente de muestras de una tarjeta NI-DAQmx en adquisición continua"""
+
+    def __init__(self):
+        self.task = None
+        self.output_task = None
+        self.reader = None
+        self.output_channels: List[str] = []
+        self.output_values: List[float] = []
+        self.read_timeout = 10.0
+
+    def open(self, config: DAQConfig, block_size: int, buffer_samples: int):
+        if nidaqmx is None:
+            raise ImportError("nidaqmx no está instalado")
+        self.task = nidaqmx.Task()
+        for channel in config.input_channels:
+            self.task.ai_channels.add_ai_voltage_chan(
+                f"{config.device_name}/{channel}", min_val=-config.input_range, max_val=config.input_range)
+        self.task.timing.cfg_samp_clk_timing(
+            config.sample_rate, sample_mode=AcquisitionType.CONTINUOUS, samps_per_chan=buffer_samples)
+        self.reader = AnalogMultiChannelReader(self.task.in_stream)
+        self.read_timeout = max(10.0, 4 * block_size / config.sample_rate)
+        if config.output_channels:
+            self.output_task = nidaqmx.Task()
+            for channel in config.output_channels:
+                self.output_task.ao_channels.add_ao_voltage_chan(
+                    f"{config.device_name}/{channel}", min_val=-config.output_range, max_val=config.output_range)
+            self.output_channels = list(config.output_channels)
+            self.output_values = [0.0] * len(self.output_channels)
+        self.task.start()
+
+    def read_into(self, out: np.ndarray):
+        # Escribe directamente en la ranura (C-contigua) del buffer circular
+        self.reader.read_many_sample(out, number_of_samples_per_channel=out.shape[1], timeout=self.read_timeout)
+
+    def write(self, channel: str, value: float):
+        self.output_values[self.output_channels.index(channel)] = value
+        values = self.output_values if len(self.output_values) > 1 else self.output_values[0]
+        self.output_task.write(values, auto_start=True)
+
+    def close(self):
+        for task in (self.task, self.output_task):
+            if task is not None:
+                try:
+                    task.stop()
+                finally:
+                    task.close()
+        self.task = self.output_task = None
+
+class DAQController(BaseInstrument):
+    """Tarjeta de adquisición con adquisición continua y pipeline de procesado
+
+    Al conectar arranca un hilo de adquisición que escribe bloques de
+    ``DAQ_BLOCK_SECONDS`` directamente en un ``SampleRing`` preasignado de
+    ``DAQ_BUFFER_SECONDS``. Los pasos no copian muestras: ``acquire`` lee
+    una ventana del flujo a medida que llega y la pasa por el pipeline
+    (estadísticos, detección de umbral y diezmado para la vista previa).
+    Las salidas analógicas van por la cola de E/S del instrumento.
+    """
+
+    def __init__(self, config: DAQConfig, source=None):
+        super().__init__(config.device_name)
+        self.config = config
+        self.source = source if source is not None else NidaqmxSource()
+        self.channels = list(config.input_channels)
+        self.sample_rate = float(config.sample_rate)
+        self.block_size = max(1, int(round(self.sample_rate * settings.DAQ_BLOCK_SECONDS)))
+        n_blocks = max(4, math.ceil(settings.DAQ_BUFFER_SECONDS * self.sample_rate / self.block_size))
+        self.ring = SampleRing(len(self.channels), self.block_size, n_blocks)
+        self.outputs: Dict[str, float] = {channel: 0.0 for channel in config.output_channels}
+        self.overruns = 0
+        self.acquisition_errors = 0
+        self.started_at: Optional[float] = None
+        self._new_data = threading.Condition()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def acquiring(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    async def connect(self) -> bool:
+        """Abrir la tarjeta y arrancar la adquisición continua"""
+        try:
+            buffer_samples = self.ring.n_blocks * self.block_size
+            await self.run_io(self.source.open, self.config, self.block_size, buffer_samples)
+            self.connected = True
+            self._start_acquisition()
+            return True
+        except Exception as e:
+            self.connected = False
+            raise ConnectionError(f"Error conectando DAQ {self.resource_name}: {str(e)}")
+
+    async def disconnect(self):
+        """Detener la adquisición y cerrar la tarjeta"""
+        try:
+            await asyncio.to_thread(self._stop_acquisition)
+            await self.run_io(self.source.close)
+            self.connected = False
+            self.shutdown_io()
+        except Exception as e:
+            print(f"Error desconectando DAQ: {str(e)}")
+
+    def _start_acquisition(self):
+        self._stop.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._acquisition_loop, name=f"daq-{self.resource_name}",
+                                        daemon=True)
+        self._thread.start()
+
+    def _stop_acquisition(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        with self._new_data:
+            self._new_data.notify_all()
+
+    def _acquisition_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.source.read_into(self.ring.slot())
+            except Exception as e:
+                self.acquisition_errors += 1
+                self.last_error = str(e)
+                print(f"Error de adquisición en {self.resource_name}: {str(e)}")
+                break
+            with self._new_data:
+                self.ring.commit()
+                self._new_data.notify_all()
+        with self._new_data:
+            self._new_data.notify_all()
+
+    def _stream(self, start_block: int, n_samples: int) -> Iterator[Block]:
+        """Bloques de ``n_samples`` muestras desde ``start_block`` según se adquieren"""
+        block_period = self.block_size / self.sample_rate
+        index = start_block
+        while n_samples > 0:
+            with self._new_data:
+                while self.ring.written <= index:
+                    if not self.acquiring:
+                        raise RuntimeError(f"Adquisición detenida en {self.resource_name}: {self.last_error}")
+                    wait = remaining(default=None)
+                    if wait is not None and wait <= 0:
+                        raise DeadlineExceeded("Presupuesto de tiempo agotado durante la adquisición")
+                    timeout = 4 * block_period + 1.0 if wait is None else min(wait, 4 * block_period + 1.0)
+                    self._new_data.wait(timeout)
+            data = self.ring.block(index)
+            if n_samples < self.block_size:
+                data = data[:, :n_samples]
+            yield index * self.block_size, data
+            # Si el escritor ha alcanzado la ranura mientras se procesaba, los datos no son válidos
+            self.ring.check(index)
+            n_samples -= data.shape[1]
+            index += 1
+
+    def _acquire_sync(self, n_samples: int, threshold: Optional[float], edge: str, max_points: int,
+                      decimation: Optional[int]) -> Acquisition:
+        start_block = self.ring.written
+        n_channels = len(self.channels)
+        factor = decimation or max(1, math.ceil(n_samples / max_points))
+        stats = RunningStats(n_channels)
+        detector = ThresholdDetector(n_channels, threshold, edge) if threshold is not None else None
+        preview = Collector(n_channels, max(1, math.ceil(n_samples / factor)))
+        stages: List[Stage] = [stats]
+        if detector is not None:
+            stages.append(detector)
+        stages.extend([partial(decimate, factor=factor), preview])
+        try:
+            run_pipeline(self._stream(start_block, n_samples), *stages)
+        except BufferOverrun:
+            self.overruns += 1
+            raise
+        return Acquisition(self.channels, self.sample_rate, start_block * self.block_size, stats.count,
+                           stats, detector, preview.values, factor / self.sample_rate)
+
+    async def acquire(self, duration_s: float, threshold: Optional[float] = None, edge: str = "rising",
+                      max_points: int = 2000, decimation: Optional[int] = None) -> Acquisition:
+        """Procesar los próximos ``duration_s`` segundos del flujo de entrada"""
+        if not self.acquiring:
+            raise RuntimeError(f"DAQ {self.resource_name} sin adquisición en curso")
+        n_samples = max(1, int(round(duration_s * self.sample_rate)))
+        # Hilo propio: la cola de E/S queda libre para las salidas mientras se espera
+        return await asyncio.to_thread(self._acquire_sync, n_samples, threshold, edge, max_points, decimation)
+
+    def latest(self, n_samples: Optional[int] = None) -> np.ndarray:
+        """Último bloque completo (o sus últimas ``n_samples`` muestras)"""
+        if self.ring.written == 0:
+            raise RuntimeError(f"DAQ {self.resource_name} sin muestras todavía")
+        data = self.ring.block(self.ring.written - 1)
+        return data if n_samples is None else data[:, -n_samples:]
+
+    async def measure_voltage(self, channel: Optional[str] = None) -> float:
+        """Media del último bloque de un canal de entrada (el primero por defecto)"""
+        i = self.channels.index(channel) if channel else 0
+        return float(self.latest()[i].mean())
+
+    async def write_output(self, channel: str, value: float):
+        """Fijar una salida analógica"""
+        if channel not in self.outputs:
+            raise ValueError(f"Canal de salida desconocido: {channel}")
+        if abs(value) > self.config.output_range:
+            raise ValueError(f"{value} V fuera del rango de salida ±{self.config.output_range} V")
+        await self.run_io(self.source.write, channel, value)
+        self.outputs[channel] = value
+
+    async def get_status(self) -> Dict[str, Any]:
+        last = {}
+        if self.ring.written:
+            means = self.latest().mean(axis=1)
+            last = {channel: float(value) for channel, value in zip(self.channels, means)}
+        return {
+            "status": "connected" if self.connected and self.acquiring else "disconnected",
+            "device": self.resource_name,
+            "sample_rate": self.sample_rate,
+            "channels": self.channels,
+            "samples_acquired": self.ring.total_samples,
+            "buffer_seconds": self.ring.n_blocks * self.block_size / self.sample_rate,
+            "overruns": self.overruns,
+            "acquisition_errors": self.acquisition_errors,
+            "inputs": last,
+            "outputs": dict(self.outputs),
+        }
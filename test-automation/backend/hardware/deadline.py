@@ -0,0 +1,44 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Instante límite (time.monotonic) de la operación en curso; lo fijan el
+# motor (paso y secuencia) y lo consultan los drivers antes de cada E/S
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    """El presupuesto de tiempo del paso o de la secuencia se ha agotado"""
+    pass
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    """Segundos que quedan hasta el límite en curso (``default`` si no hay límite)"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return default
+    return deadline - time.monotonic()
+
+def clamp_timeout_ms(timeout_ms: float) -> float:
+    """Recortar un timeout de E/S al presupuesto restante; falla si ya no queda"""
+    left = remaining()
+    if left is None:
+        return timeout_ms
+    if left <= 0:
+        raise DeadlineExceeded("Presupuesto de tiempo agotado antes de la operación")
+    return min(timeout_ms, left * 1000.0)
+
+@contextmanager
+def deadline_scope(seconds: Optional[float]):
+    """Fijar un límite dentro del bloque (nunca más tarde que el ya vigente)"""
+    if seconds is None:
+        yield current_deadline.get()
+        return
+    deadline = time.monotonic() + seconds
+    outer = current_deadline.get()
+    if outer is not None:
+        deadline = min(deadline, outer)
+    token = current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        current_deadline.reset(token)
@@ -0,0 +1,262 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, Iterable, List, Optional
+
+from config.settings import settings
+from models.test_models import InstrumentConfig, InstrumentType
+from .arbiter import InstrumentArbiter
+from .base_instrument import BaseInstrument
+
+# Constructor de drivers: recibe la configuración y el pool (para el ResourceManager compartido)
+InstrumentFactory = Callable[[InstrumentConfig, "InstrumentPool"], BaseInstrument]
+
+def _power_supply_factory(config: InstrumentConfig, pool: "InstrumentPool") -> BaseInstrument:
+    if config.parameters.get("simulated"):
+        # Fuente simulada; ``simulation`` admite latencia, jitter y fallos
+        from .simulated import SimulatedInstrument
+        return SimulatedInstrument(config.resource_name or f"SIM::{config.name}",
+                                   **config.parameters.get("simulation", {}))
+    from .power_supply import PowerSupply
+    return PowerSupply(config.resource_name, resource_manager=pool.resource_manager)
+
+def _daq_factory(config: InstrumentConfig, pool: "InstrumentPool") -> BaseInstrument:
+    fields = {key: value for key, value in config.parameters.items()
+              if key in ("input_channels", "output_channels", "sample_rate", "input_range", "output_range")}
+    if config.parameters.get("simulated"):
+        # DAQ simulada; ``simulation`` admite señales por canal, ruido y semilla
+        from .simulated import simulated_daq
+        return simulated_daq(config.device_name or f"SIM::{config.name}",
+                             simulation=config.parameters.get("simulation"), **fields)
+    from models.test_models import DAQConfig
+    from .daq_controller import DAQController
+    return DAQController(DAQConfig(device_name=config.device_name or config.name, **fields))
+
+class PooledInstrument:
+    """Entrada del pool: sesión abierta y su historial de uso"""
+    
+    def __init__(self, name: str, config: InstrumentConfig, instrument: BaseInstrument):
+        self.name = name
+        self.config = config
+        self.instrument = instrument
+        self.connected_at = time.time()
+        self.last_used = time.monotonic()
+        self.last_health_check = time.monotonic()
+        self.reconnects = 0
+        self.leases = 0
+
+class InstrumentPool:
+    """Pool de instrumentos por nombre con sesiones persistentes
+    
+    - Un único ResourceManager VISA compartido por todos los drivers.
+    - Las sesiones se mantienen abiertas entre ejecuciones: cambiar de DUT
+      no vuelve a pagar la conexión ni el reset.
+    - ``lease`` reserva instrumentos para una ejecución (con timeout) a
+      través del ``InstrumentArbiter``.
+    - Como máximo ``MAX_CONCURRENT_INSTRUMENTS`` sesiones abiertas; al
+      llegar al límite se cierra la menos usada que no esté reservada.
+    - Comprobación de salud periódica de las sesiones libres y al reservar;
+      si falla se reconecta de forma transparente.
+    """
+    
+    def __init__(self, arbiter: Optional[InstrumentArbiter] = None, max_instruments: Optional[int] = None,
+                 resource_manager=None, health_check_interval: Optional[float] = None):
+        self.arbiter = arbiter or InstrumentArbiter()
+        self.max_instruments = max_instruments or settings.MAX_CONCURRENT_INSTRUMENTS
+        self.health_check_interval = health_check_interval or settings.INSTRUMENT_HEALTH_CHECK_INTERVAL
+        self._resource_manager = resource_manager
+        self._entries: Dict[str, PooledInstrument] = {}
+        self._connect_locks: Dict[str, asyncio.Lock] = {}
+        self._health_task: Optional[asyncio.Task] = None
+        self.factories: Dict[str, InstrumentFactory] = {
+            InstrumentType.POWER_SUPPLY.value: _power_supply_factory,
+            InstrumentType.DAQ.value: _daq_factory,
+        }
+
+    @property
+    def resource_manager(self):
+        """ResourceManager VISA compartido (se crea al primer uso)"""
+        if self._resource_manager is None:
+            import pyvisa
+            self._resource_manager = pyvisa.ResourceManager(settings.VISA_LIBRARY or "")
+        return self._resource_manager
+
+    def register_factory(self, instrument_type: str, factory: InstrumentFactory):
+        """Registrar el constructor de drivers para un tipo de instrumento"""
+        self.factories[instrument_type] = factory
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def items(self):
+        return [(name, entry.instrument) for name, entry in self._entries.items()]
+
+    def is_leased(self, name: str) -> bool:
+        return self.arbiter.is_leased(name)
+
+    # Conexión
+
+    def _create(self, config: InstrumentConfig) -> BaseInstrument:
+        instrument_type = config.type.value if hasattr(config.type, "value") else config.type
+        factory = self.factories.get(instrument_type)
+        if factory is None:
+            raise ValueError(f"Tipo de instrumento no soportado: {instrument_type}")
+        return factory(config, self)
+
+    async def connect(self, name: str, config: InstrumentConfig) -> BaseInstrument:
+        """Conectar un instrumento o reutilizar su sesión si ya está abierta"""
+        lock = self._connect_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                same = (entry.config.resource_name == config.resource_name
+                        and entry.config.device_name == config.device_name)
+                if same and entry.instrument.is_connected():
+                    entry.config = config
+                    return entry.instrument
+                await self._close(entry)
+                del self._entries[name]
+            
+            if len(self._entries) >= self.max_instruments:
+                await self._evict_idle()
+            
+            instrument = self._create(config)
+            await instrument.connect()
+            self._entries[name] = PooledInstrument(name, config, instrument)
+            return instrument
+
+    async def _evict_idle(self):
+        idle = [entry for entry in self._entries.values() if not self.is_leased(entry.name)]
+        if not idle:
+            raise RuntimeError(f"Límite de {self.max_instruments} instrumentos conectados alcanzado")
+        victim = min(idle, key=lambda entry: entry.last_used)
+        await self._close(victim)
+        del self._entries[victim.name]
+
+    async def _close(self, entry: PooledInstrument):
+        try:
+            await entry.instrument.disconnect()
+        except Exception as e:
+            print(f"Error desconectando {entry.name}: {str(e)}")
+
+    async def disconnect(self, name: str):
+        """Cerrar la sesión de un instrumento y retirarlo del pool"""
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            raise KeyError(name)
+        await self._close(entry)
+
+    async def close_all(self):
+        """Cerrar todas las sesiones (apagado del servidor)"""
+        await self.stop_health_checks()
+        for name in list(self._entries):
+            await self.disconnect(name)
+
+    async def get(self, name: str) -> BaseInstrument:
+        """Obtener un instrumento conectado y sano"""
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Instrumento no conectado: {name}")
+        await self._ensure_healthy(entry)
+        entry.last_used = time.monotonic()
+        return entry.instrument
+
+    # Salud y reconexión
+
+    async def _ensure_healthy(self, entry: PooledInstrument, force: bool = False) -> bool:
+        if not force and time.monotonic() - entry.last_health_check < self.health_check_interval:
+            return True
+        entry.last_health_check = time.monotonic()
+        if entry.instrument.is_connected() and await entry.instrument.self_test():
+            return True
+        return await self._reconnect(entry)
+
+    async def _reconnect(self, entry: PooledInstrument) -> bool:
+        async with self._connect_locks.setdefault(entry.name, asyncio.Lock()):
+            await self._close(entry)
+            try:
+                instrument = self._create(entry.config)
+                await instrument.connect()
+            except Exception as e:
+                entry.instrument.last_error = str(e)
+                return False
+            entry.instrument = instrument
+            entry.reconnects += 1
+            return True
+
+    def mark_suspect(self, name: str):
+        """Forzar la comprobación de salud en el próximo uso (p.ej. tras un timeout)"""
+        entry = self._entries.get(name)
+        if entry is not None:
+            entry.last_health_check = float("-inf")
+
+    async def health_check(self, name: str) -> bool:
+        """Comprobar un instrumento ahora, reconectando si hace falta"""
+        return await self._ensure_healthy(self._entries[name], force=True)
+
+    def start_health_checks(self):
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop_health_checks(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for entry in list(self._entries.values()):
+                # Los instrumentos reservados los está usando una prueba
+                if not self.is_leased(entry.name):
+                    try:
+                        await self._ensure_healthy(entry)
+                    except Exception as e:
+                        print(f"Error comprobando {entry.name}: {str(e)}")
+
+    # Reservas
+
+    @asynccontextmanager
+    async def lease(self, names: Iterable[str], owner: str, timeout: Optional[float] = None):
+        """Reservar instrumentos para una ejecución
+        
+        Devuelve un diccionario nombre -> driver con los instrumentos del
+        pool; los nombres sin instrumento conectado se reservan igualmente
+        (exclusión mutua) pero no aparecen en el diccionario.
+        """
+        async with self.arbiter.lease(names, owner, timeout) as leased:
+            instruments: Dict[str, BaseInstrument] = {}
+            for name in leased:
+                entry = self._entries.get(name)
+                if entry is None:
+                    continue
+                if not await self._ensure_healthy(entry):
+                    raise ConnectionError(f"Instrumento {name} no responde")
+                entry.leases += 1
+                entry.last_used = time.monotonic()
+                instruments[name] = entry.instrument
+            yield instruments
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        """Resumen de las sesiones del pool"""
+        return [{
+            "name": entry.name,
+            "type": entry.config.type,
+            "resource_name": entry.config.resource_name or entry.config.device_name,
+            "connected": entry.instrument.is_connected(),
+            "leased_by": self.arbiter.owner_of(entry.name),
+            "leases": entry.leases,
+            "reconnects": entry.reconnects,
+            "connected_at": entry.connected_at,
+            "last_error": entry.instrument.get_last_error(),
+        } for entry in self._entries.values()]
+
+# Instancia global del pool de instrumentos
+instrument_pool = InstrumentPool()
@@ -0,0 +1,311 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import settings
+from .scpi import ScpiInstrument, join_commands
+from .settling import SettleLearner, default_band, settle_learner, wait_until_stable
+
+try:
+    import pyvisa
+except ImportError:  # Permite usar el driver con un ResourceManager simulado
+    pyvisa = None
+
+class PowerSupply(ScpiInstrument):
+    """Driver para fuente de alimentación con interfaz VISA/SCPI"""
+    
+    # Puntos máximos por lista cargada en el equipo
+    max_list_points = 512
+
+    def __init__(self, resource_name: str, resource_manager=None, list_mode: Optional[bool] = None,
+                 learner: Optional[SettleLearner] = None):
+        super().__init__(resource_name)
+        if resource_manager is None:
+            if pyvisa is None:
+                raise ImportError("pyvisa no está instalado")
+            resource_manager = pyvisa.ResourceManager()
+        self.rm = resource_manager
+        self.voltage_set = 0.0
+        self.current_limit = 1.0
+        self.output_enabled = False
+        self.list_mode_supported = list_mode  # None = detectar al primer barrido
+        self.learner = learner if learner is not None else (settle_learner if settings.SETTLE_LEARNING else None)
+
+    async def connect(self):
+        """Conectar a la fuente de alimentación"""
+        try:
+            self.instrument = await self.run_io(self.rm.open_resource, self.resource_name)
+            self.instrument.timeout = 5000  # 5 segundos timeout
+            
+            # Configuración inicial
+            identity = await self.query("*IDN?")
+            self.connected = True
+            print(f"Conectado a fuente: {identity}")
+            
+            # Reset y configuración inicial
+            await self.reset()
+            return True
+            
+        except Exception as e:
+            self.connected = False
+            raise ConnectionError(f"Error conectando fuente {self.resource_name}: {str(e)}")
+
+    async def disconnect(self):
+        """Desconectar de la fuente"""
+        try:
+            if self.instrument:
+                await self.set_output(False)  # Apagar salida por seguridad
+                await self.run_io(self.instrument.close)
+            self.connected = False
+            self.shutdown_io()
+        except Exception as e:
+            print(f"Error desconectando fuente: {str(e)}")
+
+    async def reset(self):
+        """Reset de la fuente a valores seguros"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        # Reset y valores seguros por defecto en una sola transacción;
+        # *OPC? confirma que el equipo ha terminado de procesarla
+        await self.transaction(["*RST", "VOLT 0.0", "CURR 0.1", "OUTP OFF", "*OPC?"])
+        self.voltage_set = 0.0
+        self.current_limit = 0.1
+        self.output_enabled = False
+
+    async def set_voltage(self, voltage: float):
+        """Establecer voltaje de salida"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        self._check_voltage(voltage)
+        await self.write(f"VOLT {voltage}")
+        self.voltage_set = voltage
+
+    async def set_current_limit(self, current: float):
+        """Establecer límite de corriente"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        if current < 0 or current > 5:  # Límites de seguridad
+            raise ValueError("Corriente fuera de rango (0-5A)")
+        
+        await self.write(f"CURR {current}")
+        self.current_limit = current
+
+    async def set_output(self, enabled: bool):
+        """Habilitar/deshabilitar salida"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        state = "ON" if enabled else "OFF"
+        await self.write(f"OUTP {state}")
+        self.output_enabled = enabled
+
+    async def measure_voltage(self) -> float:
+        """Medir voltaje actual de salida"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        try:
+            voltage_str = await self.query("MEAS:VOLT?")
+            return float(voltage_str)
+        except Exception as e:
+            raise RuntimeError(f"Error midiendo voltaje: {str(e)}")
+
+    async def measure_voltage_current(self) -> Tuple[float, float]:
+        """Medir voltaje y corriente en una única consulta compuesta"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        try:
+            voltage_str, current_str = await self.query_many(["MEAS:VOLT?", "MEAS:CURR?"])
+            return float(voltage_str), float(current_str)
+        except Exception as e:
+            raise RuntimeError(f"Error midiendo voltaje/corriente: {str(e)}")
+
+    async def wait_settled(self, max_wait: float, band: Optional[float] = None) -> Tuple[float, float, float]:
+        """Esperar a que la salida se estabilice (como mucho ``max_wait`` segundos)
+        
+        Devuelve (voltaje, corriente, segundos hasta estabilizar). El tiempo
+        típico para la consigna actual se aprende y las esperas siguientes
+        no consultan el bus hasta acercarse a él.
+        """
+        band = band if band is not None else default_band(self.voltage_set)
+        hint = self.learner.hint(self.resource_name, self.voltage_set) if self.learner else 0.0
+        result = await wait_until_stable(self.measure_voltage_current, band, max_wait, min_wait=hint,
+                                         target=self.voltage_set)
+        # Solo se aprende de las esperas que llegaron a la consigna (no de las limitadas en corriente)
+        if self.learner and result.converged:
+            self.learner.record(self.resource_name, self.voltage_set, result.elapsed)
+        voltage, current = result.reading
+        return voltage, current, result.elapsed
+
+    async def measure_current(self) -> float:
+        """Medir corriente actual de salida"""
+        if not self.connected:
+            raise RuntimeError("Fuente no conectada")
+        
+        try:
+            current_str = await self.query("MEAS:CURR?")
+            return float(current_str)
+        except Exception as e:
+            raise RuntimeError(f"Error midiendo corriente: {str(e)}")
+
+    async def measure_power(self) -> float:
+        """Medir potencia de salida (voltaje por corriente en una consulta)"""
+        voltage, current = await self.measure_voltage_current()
+        return voltage * current
+
+    async def get_status(self) -> Dict[str, Any]:
+        """Obtener estado completo de la fuente"""
+        if not self.connected:
+            return {"status": "disconnected"}
+        
+        try:
+            voltage_measured, current_measured = await self.measure_voltage_current()
+            
+            return {
+                "status": "connected",
+                "output_enabled": self.output_enabled,
+                "voltage_set": self.voltage_set,
+                "current_limit": self.current_limit,
+                "readings": {
+                    "voltage": voltage_measured,
+                    "current": current_measured,
+                    "power": voltage_measured * current_measured
+                }
+            }
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+
+    def _check_voltage(self, voltage: float):
+        if voltage < 0 or voltage > 30:  # Límites de seguridad
+            raise ValueError("Voltaje fuera de rango (0-30V)")
+
+    async def supports_list_mode(self) -> bool:
+        """Detectar si el equipo admite secuencias LIST disparadas por trigger"""
+        if self.list_mode_supported is None:
+            # Un comando LIST desconocido deja un error en la cola; se consulta
+            # por separado porque el equipo descarta el resto del mensaje
+            await self.write("*CLS;:LIST:COUN 1")
+            error = await self.query("SYST:ERR?")
+            self.list_mode_supported = error.split(",", 1)[0].strip().lstrip("+") == "0"
+        return self.list_mode_supported
+
+    async def run_voltage_sweep(self, start_v: float, end_v: float, steps: int, callback=None,
+                                mode: str = "auto", dwell_ms: float = 50,
+                                settle_tolerance: Optional[float] = None, test_id: Optional[str] = None):
+        """Realizar un barrido de voltaje y reportar mediciones
+        
+        mode="list" carga todos los puntos en el equipo, los ejecuta por
+        trigger y lee las mediciones almacenadas en una sola transferencia.
+        mode="software" recorre los puntos desde aquí esperando solo hasta
+        que la lectura se estabiliza (``dwell_ms`` es el máximo por punto).
+        mode="auto" usa LIST si el equipo lo admite.
+        
+        ``callback`` recibe un ``sweep_point`` por punto en cuanto se mide: en
+        modo software al completar cada punto y en modo LIST al leer cada
+        bloque del equipo. Los mensajes llevan ``test_id`` para que el cliente
+        los agrupe por ejecución y el diario los conserve para reanudar.
+        """
+        if steps < 1:
+            raise ValueError("El barrido necesita al menos un punto")
+        if not self.output_enabled:
+            await self.set_output(True)
+        
+        voltage_step = (end_v - start_v) / (steps - 1) if steps > 1 else 0.0
+        voltages: List[float] = [start_v + (i * voltage_step) for i in range(steps)]
+        for voltage in voltages:
+            self._check_voltage(voltage)
+        
+        results = []
+
+        async def on_point(reading: Tuple[float, float]):
+            v_measured, i_measured = reading
+            result = {
+                "step": len(results) + 1,
+                "voltage_set": voltages[len(results)],
+                "voltage_measured": v_measured,
+                "current_measured": i_measured,
+                "power": v_measured * i_measured
+            }
+            results.append(result)
+            
+            # Callback para tiempo real
+            if callback:
+                await callback({
+                    "type": "sweep_point",
+                    "test_id": test_id,
+                    "data": result,
+                    "progress": (len(results) / steps) * 100
+                })
+        
+        use_list = mode == "list" or (mode == "auto" and await self.supports_list_mode())
+        try:
+            if use_list:
+                await self._run_list_sweep(voltages, dwell_ms / 1000.0, on_point)
+            else:
+                await self._run_software_sweep(voltages, dwell_ms / 1000.0, settle_tolerance, on_point)
+        finally:
+            if results:
+                self.voltage_set = results[-1]["voltage_set"]
+        
+        return results
+
+    async def _run_list_sweep(self, voltages: List[float], dwell_s: float, on_point=None) -> List[Tuple[float, float]]:
+        """Barrido temporizado por el equipo, en bloques de ``max_list_points``"""
+        readings: List[Tuple[float, float]] = []
+        for start in range(0, len(voltages), self.max_list_points):
+            chunk = voltages[start:start + self.max_list_points]
+            chunk_readings = await self.run_io(self._list_sweep_sync, chunk, dwell_s)
+            readings.extend(chunk_readings)
+            if on_point:
+                for reading in chunk_readings:
+                    await on_point(reading)
+        return readings
+
+    def _list_sweep_sync(self, voltages: List[float], dwell_s: float) -> List[Tuple[float, float]]:
+        session = self._require_session()
+        previous_timeout = session.timeout
+        # El *OPC? no responde hasta que termina la lista completa
+        session.timeout = previous_timeout + len(voltages) * dwell_s * 1000
+        try:
+            self._write_sync(join_commands([
+                "*CLS",
+                "VOLT:MODE LIST",
+                "LIST:VOLT " + ",".join(f"{v:.6g}" for v in voltages),
+                f"LIST:CURR {self.current_limit}",
+                f"LIST:DWEL {dwell_s:.6g}",
+                "LIST:COUN 1",
+                "TRIG:SOUR BUS",
+                "INIT"
+            ]))
+            self._query_sync("*TRG;*OPC?")
+            voltage_str, current_str = self._transaction_sync(["FETC:ARR:VOLT?", "FETC:ARR:CURR?"])
+        finally:
+            self._write_sync("VOLT:MODE FIX")
+            session.timeout = previous_timeout
+        
+        measured_v = [float(value) for value in voltage_str.split(",")]
+        measured_i = [float(value) for value in current_str.split(",")]
+        if len(measured_v) != len(voltages) or len(measured_i) != len(voltages):
+            raise RuntimeError(f"El equipo devolvió {len(measured_v)} lecturas para {len(voltages)} puntos")
+        self._write_sync(f"VOLT {voltages[-1]}")
+        return list(zip(measured_v, measured_i))
+
+    async def _run_software_sweep(self, voltages: List[float], max_settle_s: float,
+                                  settle_tolerance: Optional[float], on_point=None) -> List[Tuple[float, float]]:
+        """Barrido punto a punto con espera adaptativa a la estabilización"""
+        readings: List[Tuple[float, float]] = []
+        for voltage in voltages:
+            band = settle_tolerance if settle_tolerance is not None else default_band(voltage)
+            
+            # Consigna y primera lectura en la misma transacción
+            voltage_str, current_str = await self.transaction([f"VOLT {voltage}", "MEAS:VOLT?", "MEAS:CURR?"])
+            self.voltage_set = voltage
+            result = await wait_until_stable(self.measure_voltage_current, band, max_settle_s,
+                                             first_reading=(float(voltage_str), float(current_str)),
+                                             target=voltage)
+            readings.append(result.reading)
+            if on_point:
+                await on_point(result.reading)
+        return readings
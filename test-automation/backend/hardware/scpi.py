@@ -0,0 +1,98 @@
+from typing import List
+
+from .base_instrument import BaseInstrument
+
+def is_query(command: str) -> bool:
+    """Indicar si un comando SCPI espera respuesta (cabecera terminada en '?')"""
+    header = command.strip().split(" ", 1)[0]
+    return header.endswith("?")
+
+def join_commands(commands: List[str]) -> str:
+    """Unir comandos en un único mensaje SCPI
+    
+    Cada comando se prefija con ':' para que su ruta se resuelva desde la
+    raíz y no desde el subsistema del comando anterior.
+    """
+    parts = []
+    for i, command in enumerate(commands):
+        command = command.strip()
+        if i > 0 and not command.startswith((":", "*")):
+            command = ":" + command
+        parts.append(command)
+    return ";".join(parts)
+
+def split_response(response: str, expected: int) -> List[str]:
+    """Separar la respuesta de una consulta compuesta en sus partes"""
+    parts = [part.strip() for part in response.strip().split(";")]
+    if len(parts) != expected:
+        raise ValueError(f"Respuesta SCPI con {len(parts)} campos, se esperaban {expected}: {response!r}")
+    return parts
+
+class ScpiBatch:
+    """Constructor de transacciones SCPI agrupadas
+    
+    Uso::
+    
+        batch = instrument.batch().write("VOLT 5").query("MEAS:VOLT?").query("MEAS:CURR?")
+        voltage, current = await batch.execute()
+    """
+    
+    def __init__(self, instrument: "ScpiInstrument"):
+        self.instrument = instrument
+        self.commands: List[str] = []
+
+    def write(self, command: str) -> "ScpiBatch":
+        self.commands.append(command)
+        return self
+
+    def query(self, command: str) -> "ScpiBatch":
+        if not is_query(command):
+            raise ValueError(f"No es una consulta SCPI: {command}")
+        self.commands.append(command)
+        return self
+
+    async def execute(self) -> List[str]:
+        """Enviar la transacción y devolver las respuestas de las consultas en orden"""
+        return await self.instrument.transaction(self.commands)
+
+class ScpiInstrument(BaseInstrument):
+    """Instrumento SCPI con transacciones compuestas
+    
+    Varios comandos se envían como un único mensaje ``;``-separado y la
+    respuesta compuesta se separa de nuevo por consulta, de forma que N
+    lecturas cuestan un único viaje de ida y vuelta por GPIB/LAN.
+    """
+    
+    # Máximo de comandos por mensaje (limitado por el buffer de entrada del equipo)
+    max_batch_size = 16
+
+    async def self_test(self) -> bool:
+        """Comprobación ligera de la sesión: *OPC? debe responder 1"""
+        try:
+            return await self.query("*OPC?") == "1"
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def batch(self) -> ScpiBatch:
+        """Crear una nueva transacción agrupada"""
+        return ScpiBatch(self)
+
+    async def transaction(self, commands: List[str]) -> List[str]:
+        """Ejecutar varios comandos en una sola tarea de la cola de E/S"""
+        return await self.run_io(self._transaction_sync, list(commands))
+
+    def _transaction_sync(self, commands: List[str]) -> List[str]:
+        responses: List[str] = []
+        for start in range(0, len(commands), self.max_batch_size):
+            chunk = commands[start:start + self.max_batch_size]
+            n_queries = sum(1 for command in chunk if is_query(command))
+            message = join_commands(chunk)
+            if n_queries:
+                responses.extend(split_response(self._query_sync(message), n_queries))
+            else:
+                self._write_sync(message)
+        return responses
+
+    def _query_many_sync(self, commands: List[str]) -> List[str]:
+        return self._transaction_sync(commands)
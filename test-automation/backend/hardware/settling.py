@@ -0,0 +1,109 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from config.settings import settings
+
+def default_band(value: float, relative: float = 0.001, absolute: float = 0.001) -> float:
+    """Banda de estabilidad por defecto: 0,1 % del valor con un mínimo absoluto"""
+    return max(abs(value) * relative, absolute)
+
+class SettleResult:
+    """Resultado de una espera de estabilización"""
+
+    __slots__ = ("reading", "settled", "converged", "elapsed", "samples")
+
+    def __init__(self, reading: Any, settled: bool, elapsed: float, samples: int, converged: bool = False):
+        self.reading = reading
+        self.settled = settled
+        self.converged = converged  # Dentro de la banda alrededor de la consigna
+        self.elapsed = elapsed
+        self.samples = samples
+
+class SettleLearner:
+    """Tiempos de establecimiento típicos por instrumento y consigna
+
+    Guarda una media móvil exponencial del tiempo hasta estabilizar para
+    cada (instrumento, consigna redondeada). La espera siguiente puede
+    empezar a muestrear directamente cerca de ese tiempo en lugar de
+    consultar el bus desde el primer milisegundo.
+    """
+
+    def __init__(self, alpha: float = 0.2, resolution: float = 0.1, margin: float = 0.8):
+        self.alpha = alpha
+        self.resolution = resolution  # Agrupación de consignas (p.ej. 0,1 V)
+        self.margin = margin  # Fracción del tiempo típico que se espera sin muestrear
+        self._typical: Dict[Tuple[Hashable, float], float] = {}
+
+    def _key(self, instrument: Hashable, setpoint: float) -> Tuple[Hashable, float]:
+        return (instrument, round(setpoint / self.resolution) * self.resolution)
+
+    def hint(self, instrument: Hashable, setpoint: float) -> float:
+        """Tiempo que se puede esperar sin muestrear (0 si no hay historial)"""
+        typical = self._typical.get(self._key(instrument, setpoint))
+        return typical * self.margin if typical is not None else 0.0
+
+    def record(self, instrument: Hashable, setpoint: float, elapsed: float):
+        key = self._key(instrument, setpoint)
+        previous = self._typical.get(key)
+        self._typical[key] = elapsed if previous is None else previous + self.alpha * (elapsed - previous)
+
+    def get_stats(self):
+        return [{"instrument": instrument, "setpoint": setpoint, "typical_s": typical}
+                for (instrument, setpoint), typical in self._typical.items()]
+
+async def wait_until_stable(read: Callable[[], Awaitable[Any]], band: float, max_wait: float,
+                            poll_interval: Optional[float] = None, min_wait: float = 0.0,
+                            window: int = 3, value: Callable[[Any], float] = None,
+                            first_reading: Any = None, target: Optional[float] = None,
+                            min_window: Optional[float] = None) -> SettleResult:
+    """Muestrear ``read`` hasta que la lectura sea estable
+
+    La lectura es estable si está a menos de ``band`` de ``target`` (la
+    consigna) o si durante al menos ``min_window`` segundos, y ``window``
+    lecturas, max - min no supera ``band``. Comparar solo lecturas
+    consecutivas mide la pendiente: con 2 ms entre lecturas una rampa lenta
+    parecería estable a mitad de camino.
+
+    ``max_wait`` es solo el límite superior: se termina en cuanto la
+    lectura es estable. Si se agota, se devuelve la última lectura con
+    ``settled=False``. ``min_wait`` retrasa la primera lectura (p.ej. el
+    tiempo aprendido con ``SettleLearner``).
+    """
+    poll_interval = settings.SETTLE_POLL_INTERVAL if poll_interval is None else poll_interval
+    min_window = settings.SETTLE_MIN_WINDOW if min_window is None else min_window
+    value = value or (lambda reading: reading[0] if isinstance(reading, tuple) else reading)
+    start = time.monotonic()
+    deadline = start + max_wait
+
+    if min_wait > 0 and first_reading is None:
+        await asyncio.sleep(min(min_wait, max_wait))
+    reading = first_reading if first_reading is not None else await read()
+    samples = 1
+    history = deque([(time.monotonic(), value(reading))])
+
+    def converged() -> bool:
+        return target is not None and abs(history[-1][1] - target) <= band
+
+    def flat() -> bool:
+        now = history[-1][0]
+        # Conservar solo la lectura más reciente anterior al inicio de la ventana
+        while len(history) > 1 and history[1][0] <= now - min_window:
+            history.popleft()
+        if len(history) < window or now - history[0][0] < min_window:
+            return False
+        values = [v for _, v in history]
+        return max(values) - min(values) <= band
+
+    while not (converged() or flat()) and time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+        reading = await read()
+        samples += 1
+        history.append((time.monotonic(), value(reading)))
+
+    is_converged = converged()
+    return SettleResult(reading, is_converged or flat(), time.monotonic() - start, samples, is_converged)
+
+# Historial global de tiempos de establecimiento
+settle_learner = SettleLearner()
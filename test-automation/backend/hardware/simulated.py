@@ -0,0 +1,377 @@
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.settings import settings
+from .power_supply import PowerSupply
+
+class SimulatedTimeoutError(TimeoutError):
+    """Timeout de E/S inyectado (equivalente a VI_ERROR_TMO)"""
+
+class SimulatedPowerSupplyResource:
+    """Recurso VISA simulado de una fuente de alimentación SCPI
+    
+    Implementa la parte de la interfaz de ``pyvisa.Resource`` que usan los
+    drivers (write/read/query/close/timeout) y entiende mensajes compuestos
+    separados por ``;``. La salida alimenta una carga resistiva ideal y
+    tiende a la consigna con una constante de tiempo ``settle_tau_s``.
+    Con ``supports_list`` admite secuencias LIST disparadas por *TRG.
+    
+    Inyección de fallos: cada mensaje tarda ``latency_s`` más un jitter
+    uniforme de hasta ``jitter_s``; con probabilidad ``timeout_rate`` el
+    mensaje agota el timeout del recurso y con ``failure_rate`` falla la
+    comunicación. ``inject`` fuerza fallos concretos en los próximos mensajes.
+    """
+    
+    IDENTITY = "SIMULATED,PowerSupply,0,1.0"
+
+    def __init__(self, resource_name: str, load_ohms: float = 50.0, noise: float = 0.0,
+                 seed: Optional[int] = None, settle_tau_s: float = 0.0, supports_list: bool = True,
+                 latency_s: float = 0.0, jitter_s: float = 0.0, timeout_rate: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.resource_name = resource_name
+        self.load_ohms = load_ohms
+        self.noise = noise
+        self.settle_tau_s = settle_tau_s
+        self.supports_list = supports_list
+        self.timeout = 5000
+        self.voltage_set = 0.0
+        self.current_limit = 1.0
+        self.output_enabled = False
+        self.voltage_mode = "FIX"
+        self.trigger_source = "IMM"
+        self.list_voltages: List[float] = []
+        self.list_dwell = 0.0
+        self.initiated = False
+        self.buffer_voltage: List[float] = []
+        self.buffer_current: List[float] = []
+        self._previous_level = 0.0
+        self._set_time = 0.0
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.timeout_rate = timeout_rate
+        self.failure_rate = failure_rate
+        self.transactions = 0  # Mensajes recibidos (viajes de ida y vuelta)
+        self.injected_timeouts = 0
+        self.injected_failures = 0
+        self.errors: List[str] = []
+        self.closed = False
+        self._faults: List[str] = []
+        self._output: List[str] = []
+        self._random = random.Random(seed)
+
+    def inject(self, fault: str, count: int = 1):
+        """Forzar un fallo ("timeout" o "failure") en los próximos ``count`` mensajes"""
+        if fault not in ("timeout", "failure"):
+            raise ValueError(f"Fallo desconocido: {fault}")
+        self._faults.extend([fault] * count)
+
+    def _transport(self):
+        """Latencia del bus y fallos inyectados de un mensaje"""
+        delay = self.latency_s + (self._random.uniform(0.0, self.jitter_s) if self.jitter_s else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        
+        fault = self._faults.pop(0) if self._faults else None
+        if fault is None and self.timeout_rate and self._random.random() < self.timeout_rate:
+            fault = "timeout"
+        if fault is None and self.failure_rate and self._random.random() < self.failure_rate:
+            fault = "failure"
+        
+        if fault == "timeout":
+            self.injected_timeouts += 1
+            time.sleep(self.timeout / 1000.0)
+            raise SimulatedTimeoutError(f"{self.resource_name}: timeout de E/S")
+        if fault == "failure":
+            self.injected_failures += 1
+            raise ConnectionError(f"{self.resource_name}: fallo de comunicación")
+
+    # Interfaz pyvisa
+
+    def write(self, message: str):
+        if self.closed:
+            raise RuntimeError("Recurso cerrado")
+        self.transactions += 1
+        self._transport()
+        self._output = []
+        for command in message.strip().split(";"):
+            response = self._execute(command.strip().lstrip(":"))
+            if response is not None:
+                self._output.append(response)
+
+    def read(self) -> str:
+        response = ";".join(self._output)
+        self._output = []
+        return response + "\n"
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        return self.read()
+
+    def close(self):
+        self.closed = True
+
+    # Modelo del equipo
+
+    def _reset(self):
+        self._set_voltage(0.0)
+        self.current_limit = 1.0
+        self.output_enabled = False
+        self.voltage_mode = "FIX"
+        self.initiated = False
+
+    def _set_voltage(self, voltage: float, settled: bool = False):
+        self._previous_level = self.voltage_set if not settled else voltage
+        self._set_time = time.monotonic()
+        self.voltage_set = voltage
+
+    def _run_list(self):
+        self.buffer_voltage = []
+        self.buffer_current = []
+        for voltage in self.list_voltages:
+            self._set_voltage(voltage, settled=True)
+            reading = self._measure()
+            self.buffer_voltage.append(reading["voltage"])
+            self.buffer_current.append(reading["current"])
+        self.initiated = False
+
+    def _measure(self) -> Dict[str, float]:
+        if not self.output_enabled:
+            return {"voltage": 0.0, "current": 0.0}
+        target = self.voltage_set
+        if self.settle_tau_s > 0:
+            elapsed = time.monotonic() - self._set_time
+            target += (self._previous_level - target) * math.exp(-elapsed / self.settle_tau_s)
+        voltage = min(target, self.current_limit * self.load_ohms)
+        if self.noise:
+            voltage += self._random.gauss(0.0, self.noise)
+        return {"voltage": voltage, "current": voltage / self.load_ohms}
+
+    def _execute(self, command: str) -> Optional[str]:
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        argument = argument.strip()
+        
+        if header == "*IDN?":
+            return self.IDENTITY
+        if header == "*RST":
+            self._reset()
+            return None
+        if header == "*OPC?":
+            return "1"
+        if header == "*CLS":
+            self.errors = []
+            return None
+        if header in ("VOLT", "SOUR:VOLT"):
+            self._set_voltage(float(argument))
+            return None
+        if header in ("CURR", "SOUR:CURR"):
+            self.current_limit = float(argument)
+            return None
+        if header in ("OUTP", "OUTP:STAT"):
+            self.output_enabled = argument.upper() in ("ON", "1")
+            return None
+        if header == "VOLT?":
+            return f"{self.voltage_set:+.6E}"
+        if header == "CURR?":
+            return f"{self.current_limit:+.6E}"
+        if header == "OUTP?":
+            return "1" if self.output_enabled else "0"
+        if header == "MEAS:VOLT?":
+            return f"{self._measure()['voltage']:+.6E}"
+        if header == "MEAS:CURR?":
+            return f"{self._measure()['current']:+.6E}"
+        if self.supports_list:
+            response = self._execute_list(header, argument)
+            if response is not False:
+                return response
+        if header == "SYST:ERR?":
+            return self.errors.pop(0) if self.errors else '+0,"No error"'
+        
+        self.errors.append(f'-113,"Undefined header;{header}"')
+        return None
+
+    def _execute_list(self, header: str, argument: str):
+        """Subsistema LIST/TRIG; devuelve False si el comando no es de este subsistema"""
+        if header == "VOLT:MODE":
+            self.voltage_mode = argument.upper()
+            return None
+        if header == "LIST:VOLT":
+            self.list_voltages = [float(value) for value in argument.split(",")]
+            return None
+        if header in ("LIST:CURR", "LIST:COUN"):
+            return None
+        if header == "LIST:DWEL":
+            self.list_dwell = float(argument)
+            return None
+        if header == "TRIG:SOUR":
+            self.trigger_source = argument.upper()
+            return None
+        if header == "INIT":
+            self.initiated = True
+            if self.voltage_mode == "LIST" and self.trigger_source == "IMM":
+                self._run_list()
+            return None
+        if header == "*TRG":
+            if self.initiated and self.voltage_mode == "LIST":
+                self._run_list()
+            return None
+        if header == "FETC:ARR:VOLT?":
+            return ",".join(f"{value:+.6E}" for value in self.buffer_voltage)
+        if header == "FETC:ARR:CURR?":
+            return ",".join(f"{value:+.6E}" for value in self.buffer_current)
+        return False
+
+class SimulatedResourceManager:
+    """Sustituto de ``pyvisa.ResourceManager`` para pruebas sin hardware"""
+    
+    def __init__(self, **resource_options):
+        self.resource_options = resource_options
+        self.resources: Dict[str, SimulatedPowerSupplyResource] = {}
+
+    def open_resource(self, resource_name: str) -> SimulatedPowerSupplyResource:
+        resource = SimulatedPowerSupplyResource(resource_name, **self.resource_options)
+        self.resources[resource_name] = resource
+        return resource
+
+    def list_resources(self):
+        return tuple(self.resources)
+
+    def close(self):
+        for resource in self.resources.values():
+            resource.close()
+
+class SimulatedInstrument(PowerSupply):
+    """Fuente SCPI simulada completa (driver real sobre un recurso simulado)
+    
+    Implementa ``BaseInstrument`` con el mismo código que ``PowerSupply``,
+    de modo que las pruebas, el motor y los benchmarks ejercitan la pila de
+    drivers completa sin pyvisa ni hardware. Las opciones de
+    ``SimulatedPowerSupplyResource`` (latencia, jitter, fallos...) se pasan
+    tal cual.
+    """
+    
+    def __init__(self, resource_name: str = "SIM::INSTR", list_mode: Optional[bool] = None, **resource_options):
+        super().__init__(resource_name, resource_manager=SimulatedResourceManager(**resource_options),
+                         list_mode=list_mode)
+
+    @property
+    def resource(self) -> Optional[SimulatedPowerSupplyResource]:
+        """Recurso simulado de la sesión actual (para inyectar fallos)"""
+        return self.rm.resources.get(self.resource_name)
+
+    def apply_reference(self, parameter: str, value: float):
+        """Llevar la salida simulada al punto en que ``measure_<parameter>`` lee ``value``
+        
+        Lo usan los pasos de medición sin instrumento: la lectura recorre el
+        driver y el recurso SCPI como cualquier otra. Se programa el recurso
+        directamente, sin los límites de seguridad de la fuente real.
+        """
+        resource = self.resource
+        if resource is None:
+            raise RuntimeError("Fuente no conectada")
+        load = resource.load_ohms
+        if parameter == "voltage":
+            voltage = value
+        elif parameter == "current":
+            voltage = value * load
+        elif parameter == "power":
+            voltage = math.sqrt(abs(value) * load)
+        else:
+            raise ValueError(f"Medición simulada no disponible: {parameter}")
+        resource.current_limit = max(resource.current_limit, abs(voltage) / load)
+        resource._set_voltage(voltage, settled=True)
+        resource.output_enabled = True
+
+class SimulatedDAQSource:
+    """Fuente de muestras simulada para ``DAQController`` (sin nidaqmx)
+    
+    Cada canal de entrada genera ``offset + amplitude·sin(2π·frequency·t)``
+    más ruido gaussiano, calculado por bloques con NumPy. Con ``loopback``
+    la salida aoN se suma a la entrada aiN, de modo que un paso daq_write
+    se puede comprobar con un daq_read. Con ``realtime`` cada bloque se
+    entrega a la cadencia de la frecuencia de muestreo.
+    """
+    
+    def __init__(self, signals: Optional[Dict[str, Dict[str, float]]] = None, noise: float = 0.001,
+                 seed: Optional[int] = None, realtime: bool = True, loopback: bool = True):
+        self.signals = signals or {}
+        self.noise = noise
+        self.realtime = realtime
+        self.loopback = loopback
+        self.sample_rate = 1000.0
+        self.channels: List[str] = []
+        self.outputs: Dict[str, float] = {}
+        self.blocks_read = 0
+        self.closed = True
+        self._index = 0
+        self._t0 = 0.0
+        self._ramp = np.arange(0)
+        self._noise = np.empty((0, 0))
+        self._random = np.random.default_rng(seed)
+
+    def open(self, config, block_size: int, buffer_samples: int):
+        self.sample_rate = float(config.sample_rate)
+        self.channels = list(config.input_channels)
+        self.outputs = {channel: 0.0 for channel in config.output_channels}
+        self._ramp = np.arange(block_size, dtype=np.float64)
+        self._noise = np.empty((len(self.channels), block_size))
+        self._index = 0
+        self._t0 = time.monotonic()
+        self.closed = False
+
+    def _loopback_offset(self, channel: str) -> float:
+        if not self.loopback or not channel.startswith("ai"):
+            return 0.0
+        return self.outputs.get("ao" + channel[2:], 0.0)
+
+    def read_into(self, out):
+        if self.closed:
+            raise RuntimeError("Fuente DAQ cerrada")
+        n = out.shape[1]
+        if self.realtime:
+            delay = self._t0 + (self._index + n) / self.sample_rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        
+        t = (self._index + self._ramp[:n]) / self.sample_rate
+        for i, channel in enumerate(self.channels):
+            signal = self.signals.get(channel, {})
+            offset = signal.get("offset", 0.0) + self._loopback_offset(channel)
+            amplitude = signal.get("amplitude", 0.0)
+            if amplitude:
+                np.sin(2 * math.pi * signal.get("frequency", 50.0) * t + signal.get("phase", 0.0), out=out[i])
+                out[i] *= amplitude
+                out[i] += offset
+            else:
+                out[i] = offset
+        if self.noise:
+            noise = self._noise[:, :n]
+            self._random.standard_normal(out=noise)
+            noise *= self.noise
+            out += noise
+        self._index += n
+        self.blocks_read += 1
+
+    def write(self, channel: str, value: float):
+        self.outputs[channel] = value
+
+    def close(self):
+        self.closed = True
+
+def simulated_daq(resource_name: str = "SIM::DAQ", simulation: Optional[Dict] = None, **config_fields):
+    """``DAQController`` completo sobre una ``SimulatedDAQSource``
+    
+    ``config_fields`` son campos de ``DAQConfig`` y ``simulation`` las
+    opciones de la fuente (señales, ruido, semilla...).
+    """
+    from .daq_controller import DAQController
+    from models.test_models import DAQConfig
+    config_fields.setdefault("input_channels", ["ai0", "ai1", "ai2", "ai3"])
+    config_fields.setdefault("output_channels", ["ao0", "ao1"])
+    config_fields.setdefault("sample_rate", settings.DAQ_SIMULATED_RATE)
+    config = DAQConfig(device_name=resource_name, **config_fields)
+    return DAQController(config, source=SimulatedDAQSource(**(simulation or {})))
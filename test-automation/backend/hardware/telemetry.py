@@ -0,0 +1,164 @@
+import asyncio
+import time
+from typing import Dict, Any, Awaitable, Callable, List, Optional
+
+from config.settings import settings
+from .instrument_pool import instrument_pool
+
+# Callback de actualización: (nombre del instrumento, lectura en caché)
+TelemetryListener = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class TelemetryReading:
+    """Última lectura conocida de un instrumento"""
+
+    __slots__ = ("status", "timestamp", "monotonic", "error", "polls", "next_poll")
+
+    def __init__(self):
+        self.status: Dict[str, Any] = {}
+        self.timestamp: Optional[float] = None
+        self.monotonic: Optional[float] = None
+        self.error: Optional[str] = None
+        self.polls = 0
+        self.next_poll = 0.0
+
+    def age(self) -> Optional[float]:
+        """Segundos desde la última lectura (None si nunca se ha leído)"""
+        return time.monotonic() - self.monotonic if self.monotonic is not None else None
+
+class TelemetryPoller:
+    """Muestreo centralizado del estado de los instrumentos del pool
+
+    Cada instrumento se consulta cada ``interval`` segundos en su propia
+    tarea, de modo que uno que no responde (hasta ``poll_timeout``) no
+    retrasa a los demás; la API y el WebSocket sirven la última lectura en
+    caché en lugar de preguntar al instrumento en cada petición. Mientras
+    un instrumento está reservado por una prueba no se consulta (salvo que
+    ``leased_interval`` sea mayor que 0) para no competir con ella por el bus.
+    """
+
+    def __init__(self, pool, interval: Optional[float] = None, leased_interval: Optional[float] = None,
+                 poll_timeout: Optional[float] = None):
+        self.pool = pool
+        self.interval = interval or settings.TELEMETRY_POLL_INTERVAL
+        self.leased_interval = settings.TELEMETRY_LEASED_POLL_INTERVAL if leased_interval is None else leased_interval
+        self.poll_timeout = poll_timeout or settings.INSTRUMENT_TIMEOUT
+        self.readings: Dict[str, TelemetryReading] = {}
+        self.listeners: List[TelemetryListener] = []
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Dict[str, asyncio.Task] = {}  # Consultas en curso por instrumento
+
+    def add_listener(self, listener: TelemetryListener):
+        """Registrar un callback que recibe cada lectura nueva"""
+        self.listeners.append(listener)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                self._schedule()
+            except Exception as e:
+                print(f"Error en el muestreo de instrumentos: {str(e)}")
+            # Despertar para la próxima consulta pendiente (como mucho cada ``interval``)
+            now = time.monotonic()
+            next_poll = min((reading.next_poll for reading in self.readings.values()), default=now + self.interval)
+            await asyncio.sleep(min(max(next_poll - now, 0.01), self.interval))
+
+    def _schedule(self, force: bool = False) -> List[asyncio.Task]:
+        """Lanzar una tarea por cada instrumento que toca muestrear y no tiene consulta en curso"""
+        now = time.monotonic()
+        instruments = self.pool.items()
+        names = {name for name, _ in instruments}
+        for name in list(self.readings):
+            if name not in names:
+                del self.readings[name]
+
+        started = []
+        for name, instrument in instruments:
+            reading = self.readings.setdefault(name, TelemetryReading())
+            if name in self._inflight or not (force or now >= reading.next_poll):
+                continue
+            reading.next_poll = now + self.interval  # Hasta que termine la consulta
+            task = asyncio.create_task(self._poll(name, instrument, reading))
+            self._inflight[name] = task
+            task.add_done_callback(lambda _, name=name: self._inflight.pop(name, None))
+            started.append(task)
+        return started
+
+    async def poll_once(self, force: bool = False):
+        """Consultar en paralelo los instrumentos que toca muestrear y esperar a que terminen"""
+        tasks = self._schedule(force)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _poll(self, name: str, instrument, reading: TelemetryReading):
+        leased = self.pool.is_leased(name)
+        if leased and self.leased_interval <= 0:
+            # Sin consultas mientras la prueba tiene el instrumento
+            reading.next_poll = time.monotonic() + self.interval
+            return
+
+        try:
+            status = await asyncio.wait_for(instrument.get_status(), self.poll_timeout)
+            reading.error = status.get("error")
+        except asyncio.TimeoutError:
+            status = {"status": "error", "error": "Timeout consultando el instrumento"}
+            reading.error = status["error"]
+        except Exception as e:
+            status = {"status": "error", "error": str(e)}
+            reading.error = str(e)
+
+        reading.status = status
+        reading.timestamp = time.time()
+        reading.monotonic = time.monotonic()
+        reading.polls += 1
+        reading.next_poll = reading.monotonic + (self.leased_interval if leased else self.interval)
+
+        snapshot = self._snapshot(name, reading)
+        for listener in self.listeners:
+            try:
+                await listener(name, snapshot)
+            except Exception as e:
+                print(f"Error notificando telemetría de {name}: {str(e)}")
+
+    def _snapshot(self, name: str, reading: TelemetryReading) -> Dict[str, Any]:
+        return {
+            "name": name,
+            "status": reading.status.get("status", "unknown") if reading.status else "pending",
+            "readings": reading.status.get("readings", {}),
+            "data": reading.status,
+            "timestamp": reading.timestamp,
+            "age_seconds": reading.age(),
+            "leased_by": self.pool.arbiter.owner_of(name),
+            "error": reading.error,
+        }
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Última lectura en caché de un instrumento"""
+        reading = self.readings.get(name)
+        return self._snapshot(name, reading) if reading is not None else None
+
+    def get_snapshot(self) -> List[Dict[str, Any]]:
+        """Últimas lecturas de todos los instrumentos del pool"""
+        return [
+            self._snapshot(name, self.readings.get(name) or TelemetryReading())
+            for name in self.pool.names()
+        ]
+
+# Instancia global del muestreador de telemetría
+telemetry_poller = TelemetryPoller(instrument_pool)
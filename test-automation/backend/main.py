@@ -1,14 +1,28 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import asyncio
 import json
-from typing import List
+from typing import List, Dict, Any
 
 from api.routes import router as api_router
 from api.websocket import ConnectionManager
+from api.event_bus import create_event_bus
+from api.binary_stream import StreamManager
 from test_engine.engine import TestEngine
+from test_engine.supervisor import RunSupervisor
+from cluster.agent import StationAgent
+from cluster.coordinator import Coordinator, submit_job_command
+from models.test_models import StartTestRequest
+from config.settings import settings
+from storage.results_store import results_store
+from storage.measurement_archive import measurement_archive
+from storage.sequence_repository import sequence_repository
+from hardware.instrument_pool import instrument_pool
+from hardware.telemetry import telemetry_poller
+from monitoring.metrics import WS_REPLAY_BYTES, registry
 
 app = FastAPI(title="Test Automation System", version="1.0.0")
 
@@ -22,33 +36,171 @@ app.add_middleware(
 )
 
 # Instancia global del motor de pruebas y manager de conexiones
-test_engine = TestEngine()
-connection_manager = ConnectionManager()
+# Con EVENT_BUS=redis varios procesos/hosts comparten los eventos de las ejecuciones
+event_bus = create_event_bus()
+connection_manager = ConnectionManager(telemetry=telemetry_poller, bus=event_bus)
+event_bus.subscribe(connection_manager.send_to_all)
+telemetry_poller.add_listener(connection_manager.broadcast_instrument_status)
+WS_REPLAY_BYTES.set_function(connection_manager.journal.buffered_bytes)
+stream_manager = StreamManager()
+test_engine = TestEngine(results_store=results_store, stream=stream_manager, pool=instrument_pool)
+run_supervisor = RunSupervisor(test_engine)
+# Un fichero de secuencia modificado invalida su plan compilado
+sequence_repository.add_listener(test_engine.plan_cache.invalidate)
+app.state.supervisor = run_supervisor
+
+async def handle_bus_command(command: Dict[str, Any]):
+    """Órdenes del bus (de este u otro nodo): parar ejecuciones que corren en este"""
+    # Una orden sin test_id pararía todas las ejecuciones del nodo: se ignora
+    if command.get("type") == "stop_test" and command.get("test_id"):
+        run_supervisor.cancel(command["test_id"])
+
+event_bus.on_command(handle_bus_command)
+
+# Clúster de bancos: los agentes ejecutan, el coordinador reparte las peticiones
+cluster_roles = {"all": {"agent", "coordinator"}}.get(settings.CLUSTER_ROLE, {settings.CLUSTER_ROLE})
+station_agent = StationAgent(run_supervisor, event_bus) if "agent" in cluster_roles else None
+coordinator = (Coordinator(event_bus, test_engine.compile, sequence_repository.get, test_engine.new_test_id)
+               if "coordinator" in cluster_roles else None)
+app.state.event_bus = event_bus
+app.state.coordinator = coordinator
 
 # Incluir rutas de la API
 app.include_router(api_router, prefix="/api")
 
+@app.on_event("startup")
+async def startup():
+    instrument_pool.start_health_checks()
+    telemetry_poller.start()
+    sequence_repository.start()
+    try:
+        await event_bus.start()
+    except Exception as e:
+        print(f"Bus de eventos no disponible: {str(e)}")
+    if station_agent is not None:
+        station_agent.start()
+    if coordinator is not None:
+        coordinator.start()
+    await asyncio.to_thread(measurement_archive.open)
+    try:
+        await asyncio.to_thread(results_store.start)
+    except Exception as e:
+        print(f"Almacén de resultados no disponible: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown():
+    if coordinator is not None:
+        await coordinator.stop()
+    if station_agent is not None:
+        await station_agent.stop()
+    await run_supervisor.shutdown()
+    await event_bus.stop()
+    await telemetry_poller.stop()
+    await sequence_repository.stop()
+    await instrument_pool.close_all()
+    await asyncio.to_thread(results_store.stop)
+    await asyncio.to_thread(measurement_archive.close)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await connection_manager.connect(websocket)
+    if not await connection_manager.connect(websocket):
+        return
+    started: List[str] = []  # Ejecuciones lanzadas desde esta conexión
     try:
         while True:
             # Mantener conexión activa y escuchar mensajes del cliente
             data = await websocket.receive_text()
-            message = json.loads(data)
-            
-            if message["type"] == "start_test":
-                # Iniciar prueba y enviar resultados en tiempo real
-                await test_engine.run_sequence(
-                    message["sequence"], 
-                    connection_manager.send_to_all
-                )
-            elif message["type"] == "stop_test":
-                await test_engine.stop()
+            try:
+                message = json.loads(data)
                 
+                if message.get("type") == "start_test":
+                    # La secuencia puede venir completa o como referencia a la biblioteca
+                    sequence = message.get("sequence") or sequence_repository.get(message.get("sequence_id"))
+                    if sequence is None:
+                        await connection_manager.send_personal_message(
+                            {"type": "error", "message": f"Secuencia no encontrada: {message.get('sequence_id')}"}, websocket
+                        )
+                        continue
+                    if settings.CLUSTER_ROLE != "standalone":
+                        # El coordinador (en este nodo o en otro) la encola y elige el banco
+                        test_id = test_engine.new_test_id()
+                        request = StartTestRequest(
+                            sequence_id=sequence.get("id") or "inline",
+                            operator=message.get("operator"),
+                            dut_serial_number=message.get("dut_serial_number"),
+                        )
+                        await event_bus.send_command(
+                            submit_job_command(test_id, request, sequence, message.get("station_id"))
+                        )
+                    else:
+                        # Iniciar prueba en segundo plano; los resultados llegan en tiempo real
+                        test_id = run_supervisor.start(
+                            sequence, 
+                            event_bus.publish,
+                            station_id=message.get("station_id")
+                        )
+                    started.append(test_id)
+                    await connection_manager.send_personal_message(
+                        {"type": "command_ack", "command": "start_test", "test_id": test_id}, websocket
+                    )
+                elif message.get("type") == "resume":
+                    # Reconexión o incorporación tardía: eventos perdidos y snapshot por ejecución
+                    last_seen = {test_id: int(seq) for test_id, seq in (message.get("runs") or {}).items()}
+                    await connection_manager.resume(websocket, last_seen, message.get("include_active", True))
+                elif message.get("type") == "stop_test":
+                    # Sin test_id solo se paran las ejecuciones que lanzó esta conexión, nunca todas
+                    targets = [message["test_id"]] if message.get("test_id") else list(started)
+                    cancelled = []
+                    for test_id in targets:
+                        cancelled.extend(run_supervisor.cancel(test_id))
+                        # La ejecución puede estar en otro nodo
+                        await event_bus.send_command({"type": "stop_test", "test_id": test_id})
+                    started = [test_id for test_id in started if test_id not in targets]
+                    await connection_manager.send_personal_message(
+                        {"type": "command_ack", "command": "stop_test", "test_ids": cancelled}, websocket
+                    )
+                else:
+                    raise ValueError(f"Tipo de mensaje desconocido: {message.get('type')}")
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                # Un mensaje inválido se contesta con un error; la conexión sigue abierta
+                await connection_manager.send_personal_message(
+                    {"type": "error", "message": f"Mensaje inválido: {str(e)}"}, websocket
+                )
     except WebSocketDisconnect:
+        pass
+    finally:
         connection_manager.disconnect(websocket)
 
+@app.websocket("/ws/stream")
+async def stream_endpoint(websocket: WebSocket):
+    """Canal binario de datos de medida (suscripción por test_id y canal)"""
+    await stream_manager.connect(websocket)
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            await websocket.send_text(json.dumps(stream_manager.handle_control(websocket, message)))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # También si el control es inválido o falla el envío: no dejar la tarea emisora viva
+        stream_manager.disconnect(websocket)
+
+@app.post("/api/sequences/prewarm")
+async def prewarm_sequences(sequences: List[Dict[str, Any]]):
+    """Compilar secuencias por adelantado en la caché de planes del motor"""
+    errors = test_engine.prewarm(sequences)
+    return {"compiled": len(sequences) - len(errors), "errors": errors, "cache": test_engine.plan_cache.get_stats()}
+
+@app.get("/api/websocket/stats")
+async def websocket_stats():
+    """Métricas de las colas de salida de los clientes WebSocket"""
+    return {**connection_manager.get_stats(), "stream": stream_manager.get_stats(), "bus": event_bus.get_stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def read_root():
     return {"message": "Test Automation System API", "status": "running"}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Union
 from datetime import datetime
 from enum import Enum
 
@@ -60,6 +60,7 @@ class TestStep(BaseModel):
     timeout_seconds: float = 30.0
     required_instruments: List[str] = Field(default_factory=list)
     validation_criteria: Dict[str, Any] = Field(default_factory=dict)
+    depends_on: Optional[List[Union[int, str]]] = None  # Números o nombres de pasos anteriores
 
 class PowerSupplyStep(BaseModel):
     voltage: float = Field(ge=0, le=30)
@@ -70,10 +71,28 @@ class PowerSupplyStep(BaseModel):
 class MeasurementStep(BaseModel):
     measurement_type: str  # voltage, current, power, etc.
     expected_value: float
-    tolerance: float
-    tolerance_type: str = "absolute"  # absolute, percentage
+    tolerance: Optional[float] = None  # Sin tolerancia: la de DEFAULT_TOLERANCES para el parámetro
+    tolerance_type: Optional[str] = None  # absolute, percentage (absolute si se indica tolerance)
     channel: Optional[str] = None
 
+class DAQReadStep(BaseModel):
+    channels: List[str] = Field(default_factory=lambda: ["ai0"])
+    duration_ms: int = Field(default=100, ge=1, le=600000)
+    statistic: str = "mean"  # mean, rms, std, min, max: parámetro al que se aplican los límites
+    expected_value: Optional[float] = None
+    tolerance: Optional[float] = None
+    tolerance_type: Optional[str] = None  # absolute, percentage, minmax
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+    threshold: Optional[float] = None  # Nivel para contar cruces
+    threshold_edge: str = "rising"  # rising, falling, both
+    max_points: int = Field(default=2000, ge=1, le=100000)  # Puntos de la vista previa diezmada
+
+class DAQWriteStep(BaseModel):
+    channel: str = "ao0"
+    value: float
+    settle_ms: int = Field(default=0, ge=0, le=60000)
+
 class DelayStep(BaseModel):
     delay_ms: int = Field(ge=0, le=60000)  # Max 1 minuto
 
@@ -93,6 +112,8 @@ class TestSequence(BaseModel):
     required_instruments: List[str] = Field(default_factory=list)
     estimated_duration_seconds: Optional[float] = None
     tags: List[str] = Field(default_factory=list)
+    parallel: bool = False  # Ejecutar pasos independientes en paralelo (DAG)
+    timeout_seconds: Optional[float] = None  # Límite de la secuencia (DEFAULT_TEST_TIMEOUT si no se indica)
 
 # Modelos de resultados
 class MeasurementResult(BaseModel):
@@ -0,0 +1,250 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Callable, List, Optional, Sequence, Tuple
+
+from .tracing import current_trace
+
+# Límites de los histogramas de latencia (segundos): de 100 µs a 60 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Métrica con etiquetas; las series se crean al primer uso"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()  # Se observa también desde los hilos de E/S
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in items]
+
+class Gauge(Metric):
+    """Valor instantáneo; con ``set_function`` se calcula al exportar"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple, float]]] = None
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Calcular el valor al exportar (devuelve un número o {etiquetas: valor})"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._function is not None:
+            try:
+                computed = self._function()
+            except Exception:
+                computed = None
+            if isinstance(computed, dict):
+                values.update(computed)
+            elif computed is not None:
+                values[()] = computed
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in values.items()]
+
+class Histogram(Metric):
+    """Histograma de buckets fijos (acumulativos al exportar, como Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # etiquetas -> [cuentas por bucket, suma, total]
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues) -> int:
+        series = self._series.get(labelvalues)
+        return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, (list(series[0]), series[1], series[2])) for labels, series in self._series.items()]
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Registro de métricas exportables en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Registro global y métricas del camino crítico
+registry = MetricsRegistry()
+
+STEP_PHASE_SECONDS = registry.histogram(
+    "test_step_phase_seconds", "Duración de cada fase de un paso de prueba", ("step_type", "phase"))
+STEP_ERRORS = registry.counter(
+    "test_step_errors_total", "Pasos terminados con error", ("step_type",))
+STEP_TIMEOUTS = registry.counter(
+    "test_step_timeouts_total", "Pasos cancelados por agotar su límite de tiempo", ("step_type",))
+RUNS_TOTAL = registry.counter(
+    "test_runs_total", "Ejecuciones de secuencia terminadas por estado", ("status",))
+INSTRUMENT_IO_SECONDS = registry.histogram(
+    "instrument_io_seconds", "Ida y vuelta de cada operación de E/S con un instrumento", ("instrument", "command"))
+INSTRUMENT_IO_ERRORS = registry.counter(
+    "instrument_io_errors_total", "Operaciones de E/S con instrumentos fallidas", ("instrument", "command"))
+WS_SEND_LATENCY = registry.histogram(
+    "ws_send_latency_seconds", "Tiempo desde que se encola un mensaje WebSocket hasta que se envía")
+WS_QUEUE_DEPTH = registry.histogram(
+    "ws_client_queue_depth", "Mensajes pendientes en la cola del cliente WebSocket en cada envío",
+    buckets=DEPTH_BUCKETS)
+RESULTS_WRITE_SECONDS = registry.histogram(
+    "results_write_seconds", "Duración de cada transacción de volcado de resultados")
+RESULTS_ROWS = registry.counter(
+    "results_rows_written_total", "Filas escritas en el almacén de resultados")
+RESULTS_QUEUE_DEPTH = registry.gauge(
+    "results_queue_depth", "Operaciones pendientes en la cola del escritor de resultados")
+WS_REPLAY_BYTES = registry.gauge(
+    "ws_replay_buffer_bytes", "Bytes guardados en los buffers de reenvío de eventos por ejecución")
+WS_REPLAY_MESSAGES = registry.counter(
+    "ws_replay_messages_total", "Mensajes reenviados a clientes que reanudan")
+EVENT_BUS_MESSAGES = registry.counter(
+    "event_bus_messages_total", "Eventos escritos en el bus entre nodos o recibidos de otros nodos", ("direction",))
+EVENT_BUS_ERRORS = registry.counter(
+    "event_bus_errors_total", "Errores de comunicación con el bus de eventos", ("operation",))
+CALLBACK_ERRORS = registry.counter(
+    "callback_errors_total", "Errores al notificar mensajes a los clientes", ("component",))
+
+@contextmanager
+def phase(step_type: str, name: str):
+    """Medir una fase de un paso (histograma y, si hay traza activa, span)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        STEP_PHASE_SECONDS.observe(duration, step_type, name)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(name, start, duration, step_type=step_type)
+
+def command_label(message: str, max_headers: int = 4) -> str:
+    """Etiqueta de un mensaje SCPI: sus cabeceras sin argumentos (``VOLT;MEAS:VOLT?``)"""
+    headers = [part.strip().split(" ", 1)[0].lstrip(":") for part in message.split(";")]
+    if len(headers) > max_headers:
+        headers = headers[:max_headers] + ["..."]
+    return ";".join(headers)
+
+@contextmanager
+def timed_io(instrument: str, message: str):
+    """Medir una ida y vuelta con un instrumento (desde su hilo de E/S)"""
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        command = command_label(message)
+        INSTRUMENT_IO_SECONDS.observe(duration, instrument, command)
+        if error:
+            INSTRUMENT_IO_ERRORS.inc(instrument, command)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add(command, start, duration, instrument=instrument, error=error)
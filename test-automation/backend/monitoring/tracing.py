@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+class RunTrace:
+    """Traza de una ejecución: spans de fases de paso y E/S de instrumentos
+
+    Se exporta en formato Trace Event (``chrome://tracing`` / Perfetto):
+    cada hilo de E/S de instrumento aparece como una pista propia.
+    """
+
+    def __init__(self, test_id: str, max_spans: int = 100000):
+        self.test_id = test_id
+        self.max_spans = max_spans
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.dropped = 0
+
+    def add(self, name: str, start: float, duration: float, **args):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        step = current_step.get()
+        if step is not None:
+            args["step"] = step
+        self.spans.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": duration * 1e6,
+            "pid": 1,
+            "tid": threading.current_thread().name,
+            "args": args,
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceEvents": self.spans,
+            "displayTimeUnit": "ms",
+            "metadata": {"test_id": self.test_id, "started_at": self.started_at, "dropped_spans": self.dropped},
+        }
+
+    def dump(self, directory: str) -> str:
+        """Escribir la traza como ``<test_id>.trace.json`` y devolver la ruta"""
+        os.makedirs(directory, exist_ok=True)
+        path = trace_path(directory, self.test_id)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        return path
+
+# Traza de la ejecución en curso (propia de cada tarea y copiada a la E/S)
+current_trace: ContextVar[Optional[RunTrace]] = ContextVar("current_trace", default=None)
+# Paso en curso dentro de la tarea (los pasos en paralelo tienen cada uno el suyo)
+current_step: ContextVar[Optional[int]] = ContextVar("current_step", default=None)
+
+def trace_path(directory: str, test_id: str) -> str:
+    return os.path.join(directory, f"{os.path.basename(test_id)}.trace.json")
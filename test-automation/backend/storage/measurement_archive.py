@@ -0,0 +1,369 @@
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from config.settings import settings
+
+# Columnas del archivo y su tipo en disco
+STRING_COLUMNS = ("test_id", "step", "parameter")
+NUMERIC_COLUMNS = ("value", "expected", "tolerance", "timestamp")
+COLUMN_DTYPES = {
+    "test_id": np.int32,
+    "step": np.int32,
+    "parameter": np.int32,
+    "value": np.float64,
+    "expected": np.float64,
+    "tolerance": np.float64,
+    "timestamp": np.float64,
+}
+
+class ArchiveChunk:
+    """Bloque inmutable de mediciones: un .npy por columna más diccionarios"""
+    
+    def __init__(self, path: str, meta: Dict[str, Any]):
+        self.path = path
+        self.rows: int = meta["rows"]
+        self.min_timestamp: float = meta["min_timestamp"]
+        self.max_timestamp: float = meta["max_timestamp"]
+        self.dictionaries: Dict[str, List[str]] = meta["dictionaries"]
+        self.replaces: List[str] = meta.get("replaces", [])  # Bloques que sustituye (fusión)
+        self._codes = {name: {value: code for code, value in enumerate(values)}
+                       for name, values in self.dictionaries.items()}
+
+    def code_for(self, column: str, value: str) -> Optional[int]:
+        return self._codes[column].get(value)
+
+    def column(self, name: str) -> np.ndarray:
+        """Abrir una columna mapeada en memoria (sin copiar a Python)"""
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+class MeasurementArchive:
+    """Archivo columnar de mediciones para análisis de rendimiento (yield)
+    
+    Las mediciones se acumulan en arrays preasignados y se sellan en bloques
+    de ``chunk_rows`` filas, o antes si el bloque abierto tiene más de
+    ``seal_interval`` segundos (``seal_if_due``): una caída solo pierde lo
+    no sellado de ese intervalo. Cuando hay más de ``compact_threshold``
+    bloques pequeños, un hilo los fusiona en bloques de hasta ``chunk_rows``
+    filas, de modo que el número de bloques no crece con el tiempo. Cada bloque guarda una columna por fichero .npy;
+    las columnas de texto (test_id, step, parameter) se codifican como
+    enteros con un diccionario por bloque. La lectura usa ``mmap_mode="r"``
+    y filtra con máscaras vectorizadas, de modo que cargar un millón de
+    valores para un histograma no crea objetos Python por fila.
+    
+    La retención (``RESULTS_RETENTION_DAYS``) elimina bloques completos.
+    """
+    
+    def __init__(self, directory: Optional[str] = None, chunk_rows: Optional[int] = None,
+                 retention_days: Optional[int] = None, seal_interval: Optional[float] = None,
+                 compact_threshold: Optional[int] = None):
+        self.directory = directory or settings.ARCHIVE_DIR
+        self.chunk_rows = chunk_rows or settings.ARCHIVE_CHUNK_ROWS
+        self.seal_interval = seal_interval or settings.ARCHIVE_SEAL_INTERVAL
+        self.compact_threshold = compact_threshold or settings.ARCHIVE_COMPACT_THRESHOLD
+        self.retention_days = retention_days if retention_days is not None else settings.RESULTS_RETENTION_DAYS
+        self.chunks: List[ArchiveChunk] = []
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._retired: List[str] = []  # Bloques ya fusionados, pendientes de borrar
+        self._compactor: Optional[threading.Thread] = None
+        self._reset_buffer()
+
+    def open(self):
+        """Cargar el índice de bloques existentes y aplicar la retención"""
+        os.makedirs(self.directory, exist_ok=True)
+        chunks = []
+        sequence = 0
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            meta_path = os.path.join(path, "meta.json")
+            if not name.startswith("chunk_") or not os.path.exists(meta_path):
+                continue  # Bloques a medio escribir (.tmp) se ignoran
+            with open(meta_path, "r", encoding="utf-8") as f:
+                chunks.append(ArchiveChunk(path, json.load(f)))
+            sequence = max(sequence, int(name.rsplit("_", 1)[1]))
+        # Una fusión interrumpida deja también los bloques de origen: sobran
+        replaced = {name for chunk in chunks for name in chunk.replaces}
+        for chunk in chunks:
+            if os.path.basename(chunk.path) in replaced:
+                shutil.rmtree(chunk.path, ignore_errors=True)
+        with self._lock:
+            self.chunks = [chunk for chunk in chunks if os.path.basename(chunk.path) not in replaced]
+            self._sequence = sequence
+        self.apply_retention()
+
+    def close(self):
+        """Sellar las mediciones pendientes"""
+        self.flush()
+        if self._compactor is not None:
+            self._compactor.join()
+        self._remove_retired()
+
+    # Escritura
+
+    def _reset_buffer(self):
+        self._buffer = {name: np.empty(self.chunk_rows, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+        self._dictionaries: Dict[str, Dict[str, int]] = {name: {} for name in STRING_COLUMNS}
+        self._count = 0
+        self._opened_at = 0.0
+
+    def _encode(self, column: str, value: str) -> int:
+        codes = self._dictionaries[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def append(self, test_id: str, step: str, parameter: str, value: float,
+               expected: Optional[float] = None, tolerance: Optional[float] = None,
+               timestamp: Optional[float] = None):
+        """Añadir una medición al bloque abierto"""
+        with self._lock:
+            i = self._count
+            if i == 0:
+                self._opened_at = time.monotonic()
+            self._buffer["test_id"][i] = self._encode("test_id", test_id)
+            self._buffer["step"][i] = self._encode("step", step)
+            self._buffer["parameter"][i] = self._encode("parameter", parameter)
+            self._buffer["value"][i] = value
+            self._buffer["expected"][i] = np.nan if expected is None else expected
+            self._buffer["tolerance"][i] = np.nan if tolerance is None else tolerance
+            self._buffer["timestamp"][i] = time.time() if timestamp is None else timestamp
+            self._count += 1
+            full = self._count >= self.chunk_rows
+        if full:
+            self.flush()
+
+    def append_rows(self, rows: Iterable[Dict[str, Any]], step_name: Optional[str] = None):
+        """Añadir filas con el formato de la tabla ``measurements`` del almacén
+        
+        ``step_name`` es el nombre del paso al que pertenecen las filas; sin
+        él se archiva el número de paso.
+        """
+        for row in rows:
+            timestamp = row.get("timestamp")
+            step = step_name or str(row.get("step_number", ""))
+            self.append(
+                row["test_id"], step, row["parameter"], row["value"],
+                row.get("expected_value"), row.get("tolerance"),
+                timestamp.timestamp() if timestamp is not None else None
+            )
+
+    def seal_if_due(self):
+        """Sellar el bloque abierto si lleva más de ``seal_interval`` segundos"""
+        with self._lock:
+            due = self._count > 0 and time.monotonic() - self._opened_at >= self.seal_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Sellar el bloque abierto en disco"""
+        with self._lock:
+            if self._count == 0:
+                return
+            count = self._count
+            columns = {name: array[:count] for name, array in self._buffer.items()}
+            dictionaries = {name: list(codes) for name, codes in self._dictionaries.items()}
+            self._sequence += 1
+            sequence = self._sequence
+            self._reset_buffer()
+        
+        chunk = self._write_chunk(columns, dictionaries, sequence)
+        with self._lock:
+            self.chunks.append(chunk)
+        self.apply_retention()
+        self._maybe_compact()
+
+    def _write_chunk(self, columns: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]],
+                     sequence: int, replaces: Sequence[str] = ()) -> ArchiveChunk:
+        timestamps = columns["timestamp"]
+        meta = {
+            "rows": int(timestamps.size),
+            "min_timestamp": float(timestamps.min()),
+            "max_timestamp": float(timestamps.max()),
+            "dictionaries": dictionaries,
+            "replaces": list(replaces),
+        }
+        name = f"chunk_{int(meta['min_timestamp'] * 1000):015d}_{sequence:06d}"
+        final_path = os.path.join(self.directory, name)
+        tmp_path = final_path + ".tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        for column, array in columns.items():
+            np.save(os.path.join(tmp_path, f"{column}.npy"), array)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, final_path)  # El bloque aparece completo o no aparece
+        return ArchiveChunk(final_path, meta)
+
+    # Compactación
+
+    def _needs_compaction(self) -> bool:
+        with self._lock:
+            return sum(1 for chunk in self.chunks if chunk.rows < self.chunk_rows) > self.compact_threshold
+
+    def _maybe_compact(self):
+        if not self._needs_compaction():
+            return
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self._compact_background, name="archive-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compact_background(self):
+        try:
+            # Los bloques sellados durante una pasada se fusionan en la siguiente
+            while self.compact() and self._needs_compaction():
+                pass
+        except Exception as e:
+            print(f"Error compactando el archivo de mediciones: {str(e)}")
+
+    def compact(self) -> int:
+        """Fusionar bloques pequeños consecutivos en bloques de hasta ``chunk_rows`` filas
+        
+        El bloque fusionado enumera en ``replaces`` los de origen; estos se
+        retiran del índice al publicarlo y se borran en la siguiente
+        compactación (una lectura en curso puede seguir usándolos).
+        Devuelve el número de bloques fusionados.
+        """
+        self._remove_retired()
+        with self._lock:
+            small = sorted((chunk for chunk in self.chunks if chunk.rows < self.chunk_rows),
+                           key=lambda chunk: chunk.min_timestamp)
+        
+        groups: List[List[ArchiveChunk]] = [[]]
+        rows = 0
+        for chunk in small:
+            if groups[-1] and rows + chunk.rows > self.chunk_rows:
+                groups.append([])
+                rows = 0
+            groups[-1].append(chunk)
+            rows += chunk.rows
+        
+        merged = 0
+        for group in groups:
+            if len(group) < 2:
+                continue
+            columns: Dict[str, np.ndarray] = {}
+            dictionaries: Dict[str, List[str]] = {}
+            for name in STRING_COLUMNS:
+                # Recodificar cada bloque con el diccionario común
+                codes: Dict[str, int] = {}
+                parts = []
+                for chunk in group:
+                    mapping = np.array([codes.setdefault(value, len(codes)) for value in chunk.dictionaries[name]],
+                                       dtype=COLUMN_DTYPES[name])
+                    parts.append(mapping[chunk.column(name)])
+                columns[name] = np.concatenate(parts)
+                dictionaries[name] = list(codes)
+            for name in NUMERIC_COLUMNS:
+                columns[name] = np.concatenate([chunk.column(name) for chunk in group])
+            with self._lock:
+                self._sequence += 1
+                sequence = self._sequence
+            chunk = self._write_chunk(columns, dictionaries, sequence,
+                                      replaces=[os.path.basename(source.path) for source in group])
+            sources = {source.path for source in group}
+            with self._lock:
+                self.chunks = [existing for existing in self.chunks if existing.path not in sources] + [chunk]
+                self._retired.extend(sources)
+            merged += len(group)
+        return merged
+
+    def _remove_retired(self):
+        with self._lock:
+            retired, self._retired = self._retired, []
+        for path in retired:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def apply_retention(self, now: Optional[float] = None) -> int:
+        """Eliminar los bloques cuyo contenido es anterior a la retención"""
+        if not self.retention_days:
+            return 0
+        cutoff = (now or time.time()) - self.retention_days * 86400
+        with self._lock:
+            expired = [chunk for chunk in self.chunks if chunk.max_timestamp < cutoff]
+            self.chunks = [chunk for chunk in self.chunks if chunk.max_timestamp >= cutoff]
+        for chunk in expired:
+            shutil.rmtree(chunk.path, ignore_errors=True)
+        return len(expired)
+
+    # Lectura
+
+    def scan(self, columns: Sequence[str] = ("value",), parameter: Optional[str] = None,
+             test_id: Optional[str] = None, step: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             decode: bool = False) -> Dict[str, np.ndarray]:
+        """Leer columnas filtradas de todos los bloques sellados
+        
+        Las columnas de texto se devuelven como códigos enteros salvo que se
+        pida ``decode=True``.
+        """
+        filters = {"parameter": parameter, "test_id": test_id, "step": step}
+        with self._lock:
+            chunks = list(self.chunks)
+        
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in columns}
+        for chunk in chunks:
+            if since is not None and chunk.max_timestamp < since:
+                continue
+            if until is not None and chunk.min_timestamp > until:
+                continue
+            
+            mask = None
+            skip = False
+            for column, value in filters.items():
+                if value is None:
+                    continue
+                code = chunk.code_for(column, value)
+                if code is None:
+                    skip = True
+                    break
+                condition = chunk.column(column) == code
+                mask = condition if mask is None else mask & condition
+            if skip:
+                continue
+            if since is not None or until is not None:
+                timestamps = chunk.column("timestamp")
+                condition = np.ones(chunk.rows, dtype=bool)
+                if since is not None:
+                    condition &= timestamps >= since
+                if until is not None:
+                    condition &= timestamps <= until
+                mask = condition if mask is None else mask & condition
+            
+            for name in columns:
+                data = chunk.column(name)
+                if mask is not None:
+                    data = data[mask]
+                if decode and name in STRING_COLUMNS:
+                    data = np.asarray(chunk.dictionaries[name], dtype=object)[data]
+                parts[name].append(data)
+        
+        return {
+            name: np.concatenate(arrays) if arrays else np.empty(0, dtype=object if decode and name in STRING_COLUMNS else COLUMN_DTYPES[name])
+            for name, arrays in parts.items()
+        }
+
+    def histogram(self, parameter: str, bins: int = 50, since: Optional[float] = None) -> Dict[str, Any]:
+        """Histograma de los valores de un parámetro"""
+        values = self.scan(("value",), parameter=parameter, since=since)["value"]
+        if values.size == 0:
+            return {"parameter": parameter, "count": 0, "counts": [], "edges": []}
+        counts, edges = np.histogram(values, bins=bins)
+        return {
+            "parameter": parameter,
+            "count": int(values.size),
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            "counts": counts.tolist(),
+            "edges": edges.tolist(),
+        }
+
+# Instancia global del archivo de mediciones
+measurement_archive = MeasurementArchive()
@@ -0,0 +1,534 @@
+import asyncio
+import os
+import pickle
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, Integer, JSON, MetaData, String, Table, Text,
+    and_, bindparam, create_engine, event, or_, select, text, update
+)
+
+from config.settings import settings, get_database_url, get_node_id
+from monitoring.metrics import RESULTS_QUEUE_DEPTH, RESULTS_ROWS, RESULTS_WRITE_SECONDS
+from models.test_models import MeasurementResult, StepResult, TestResult, TestStatus
+from storage.measurement_archive import MeasurementArchive, measurement_archive
+
+metadata = MetaData()
+
+test_runs = Table(
+    "test_runs", metadata,
+    Column("test_id", String(64), primary_key=True),
+    Column("sequence_id", String(128)),
+    Column("sequence_name", String(256)),
+    Column("station_id", String(64)),
+    Column("status", String(16), nullable=False),
+    Column("start_time", DateTime, nullable=False),
+    Column("end_time", DateTime),
+    Column("duration_seconds", Float),
+    Column("overall_passed", Boolean, default=False),
+    Column("operator", String(128)),
+    Column("dut_serial_number", String(128)),
+    Column("notes", Text),
+    Column("node_id", String(128), index=True),  # Nodo que ejecuta la prueba
+    Column("heartbeat_at", DateTime),  # Último latido de ese nodo mientras está en curso
+)
+
+step_results = Table(
+    "step_results", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("test_id", String(64), nullable=False, index=True),
+    Column("step_number", Integer, nullable=False),
+    Column("step_name", String(256), nullable=False),
+    Column("step_type", String(32), nullable=False),
+    Column("start_time", DateTime, nullable=False),
+    Column("end_time", DateTime),
+    Column("duration_seconds", Float),
+    Column("passed", Boolean, nullable=False),
+    Column("error_message", Text),
+    Column("raw_data", JSON),
+)
+
+measurements = Table(
+    "measurements", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("test_id", String(64), nullable=False, index=True),
+    Column("step_number", Integer, nullable=False),
+    Column("parameter", String(128), nullable=False),
+    Column("value", Float, nullable=False),
+    Column("unit", String(16), nullable=False),
+    Column("expected_value", Float),
+    Column("tolerance", Float),
+    Column("within_tolerance", Boolean),
+    Column("timestamp", DateTime, nullable=False),
+)
+
+# Unidades por prefijo del nombre del parámetro
+UNITS = {
+    "voltage": "V",
+    "current": "A",
+    "power": "W",
+    "frequency": "Hz",
+    "temperature": "°C",
+    "resistance": "Ohm",
+}
+
+def unit_for(parameter: str) -> str:
+    """Deducir la unidad de un parámetro a partir de su nombre"""
+    name = parameter.lower()
+    if name.endswith("_ms"):
+        return "ms"
+    for prefix, unit in UNITS.items():
+        if name.startswith(prefix):
+            return unit
+    return ""
+
+def _parse_time(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+def step_rows(test_id: str, step_type: str, result: Any) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Convertir el resultado de un paso del motor (``StepRecord`` o dict) en filas de base de datos"""
+    if hasattr(result, "to_dict"):
+        result = result.to_dict()
+    values = result.get("measurements", {})
+    end_time = _parse_time(result.get("end_time")) or datetime.now()
+    # Veredicto por parámetro: el de los límites evaluados por el motor (LimitSpec)
+    limits = result.get("limits") or {}
+    
+    measurement_rows = []
+    raw_data = {}
+    for parameter, value in values.items():
+        if parameter in ("expected", "tolerance"):
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raw_data[parameter] = value
+            continue
+        summary = limits.get(parameter)
+        if summary is not None:
+            expected, tolerance, within = summary.get("expected"), summary.get("tolerance"), summary.get("passed")
+        else:
+            expected, tolerance, within = values.get("expected"), values.get("tolerance"), None
+        measurement_rows.append({
+            "test_id": test_id,
+            "step_number": result["step_number"],
+            "parameter": parameter,
+            "value": float(value),
+            "unit": unit_for(parameter),
+            "expected_value": expected,
+            "tolerance": tolerance,
+            "within_tolerance": within,
+            "timestamp": end_time,
+        })
+    
+    step_row = {
+        "test_id": test_id,
+        "step_number": result["step_number"],
+        "step_name": result["step_name"],
+        "step_type": step_type,
+        "start_time": _parse_time(result.get("start_time")) or end_time,
+        "end_time": end_time,
+        "duration_seconds": result.get("duration"),
+        "passed": bool(result.get("passed", False)),
+        "error_message": result.get("error"),
+        "raw_data": raw_data,
+    }
+    return step_row, measurement_rows
+
+class ResultsStore:
+    """Almacén persistente de resultados con escrituras agrupadas
+    
+    El motor solo encola operaciones (``begin_run``, ``record_step``,
+    ``finish_run``), sin bloquear. Un hilo escritor las agrupa y las vuelca
+    en una única transacción con inserciones masivas cada ``batch_size``
+    filas o ``flush_interval`` segundos. La ejecución se registra como
+    ``running`` al empezar, con el nodo que la ejecuta; si el proceso cae
+    a mitad de secuencia, los pasos ya volcados se conservan y la ejecución
+    se marca como ``failed`` al arrancar ese nodo o cuando cualquier otro
+    ve que su latido tiene más de ``RESULTS_RUN_LEASE`` segundos. Las
+    ejecuciones en curso de otros nodos vivos no se tocan.
+    
+    Si la escritura falla, el lote se conserva y se reintenta con espera
+    exponencial; tras ``RESULTS_WRITE_RETRIES`` fallos (o al detenerse) se
+    guarda en ``RESULTS_SPILL_DIR``. Los lotes guardados se aplican, en
+    orden, antes de escribir cualquier lote nuevo; uno que sigue fallando
+    con la base de datos disponible se aparta como ``.failed``.
+    
+    ``DATABASE_URL`` admite PostgreSQL o SQLite (``sqlite:///./results.db``).
+    Si se indica ``archive``, cada paso recibido se copia también al
+    archivo columnar desde el mismo hilo escritor, con independencia de
+    que su escritura en la base de datos tenga éxito; el hilo sella el
+    bloque abierto cada ``ARCHIVE_SEAL_INTERVAL`` segundos y al detenerse.
+    """
+    
+    _STOP = object()
+
+    def __init__(self, database_url: Optional[str] = None, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, archive: Optional[MeasurementArchive] = None):
+        self.database_url = database_url or get_database_url()
+        self.batch_size = batch_size or settings.RESULTS_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.RESULTS_FLUSH_INTERVAL
+        self.archive = archive
+        self.node_id = get_node_id()
+        self.spill_dir = settings.RESULTS_SPILL_DIR
+        self.run_lease = settings.RESULTS_RUN_LEASE
+        self.max_retries = settings.RESULTS_WRITE_RETRIES
+        self.enabled = False
+        self.rows_written = 0
+        self.flush_count = 0
+        self.last_error: Optional[str] = None
+        self.spilled_batches = 0
+        self._spill_pending = True  # Puede haber lotes de un proceso anterior
+        self._spill_failures: Dict[str, int] = {}
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._engine = None
+
+    def start(self):
+        """Conectar a la base de datos, crear tablas y arrancar el hilo escritor"""
+        if self.enabled:
+            return
+        self._engine = create_engine(self.database_url, pool_pre_ping=True)
+        if self._engine.dialect.name == "sqlite":
+            event.listen(self._engine, "connect", _configure_sqlite)
+        metadata.create_all(self._engine)
+        self._replay_spilled()
+        self._recover_interrupted_runs(own=True)
+        
+        self.enabled = True
+        self._thread = threading.Thread(target=self._writer_loop, name="results-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Volcar lo pendiente y detener el hilo escritor"""
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self._engine.dispose()
+
+    # Operaciones no bloqueantes para el motor
+
+    def begin_run(self, test_id: str, sequence: Dict[str, Any], station_id: Optional[str] = None,
+                  operator: Optional[str] = None, dut_serial_number: Optional[str] = None):
+        if self.enabled:
+            self._queue.put(("begin", {
+                "test_id": test_id,
+                "sequence_id": sequence.get("id"),
+                "sequence_name": sequence.get("name", "Unknown"),
+                "station_id": station_id,
+                "status": TestStatus.RUNNING.value,
+                "start_time": datetime.now(),
+                "node_id": self.node_id,
+                "heartbeat_at": datetime.now(),
+                "overall_passed": False,
+                "operator": operator,
+                "dut_serial_number": dut_serial_number,
+            }))
+
+    def record_step(self, test_id: str, step_type: str, result: Any):
+        if self.enabled:
+            self._queue.put(("step", (test_id, step_type, result)))
+
+    def finish_run(self, test_id: str, status: str, passed: bool, duration: float):
+        if self.enabled:
+            self._queue.put(("finish", {
+                "b_test_id": test_id,
+                "status": status,
+                "overall_passed": passed,
+                "duration_seconds": duration,
+                "end_time": datetime.now(),
+            }))
+
+    def pending(self) -> int:
+        """Operaciones encoladas aún sin procesar por el hilo escritor"""
+        return self._queue.qsize()
+
+    async def flush(self):
+        """Esperar a que todo lo encolado hasta ahora esté escrito"""
+        if not self.enabled:
+            return
+        done: Future = Future()
+        self._queue.put(("flush", done))
+        try:
+            # Acotado: con la base de datos caída el escritor puede estar esperando para reintentar
+            await asyncio.wait_for(asyncio.wrap_future(done), settings.RESULTS_FLUSH_TIMEOUT)
+        except asyncio.TimeoutError:
+            pass
+
+    # Lectura
+
+    async def get_test_result(self, test_id: str) -> Optional[TestResult]:
+        """Obtener el resultado completo de una prueba"""
+        if not self.enabled:
+            return None
+        await self.flush()
+        return await asyncio.to_thread(self._load_test_result, test_id)
+
+    def _load_test_result(self, test_id: str) -> Optional[TestResult]:
+        with self._engine.connect() as conn:
+            run = conn.execute(select(test_runs).where(test_runs.c.test_id == test_id)).mappings().first()
+            if run is None:
+                return None
+            steps = conn.execute(
+                select(step_results).where(step_results.c.test_id == test_id).order_by(step_results.c.step_number)
+            ).mappings().all()
+            rows = conn.execute(
+                select(measurements).where(measurements.c.test_id == test_id).order_by(measurements.c.id)
+            ).mappings().all()
+        
+        by_step: Dict[int, List[MeasurementResult]] = {}
+        for row in rows:
+            by_step.setdefault(row["step_number"], []).append(MeasurementResult(
+                parameter=row["parameter"],
+                value=row["value"],
+                unit=row["unit"],
+                expected_value=row["expected_value"],
+                tolerance=row["tolerance"],
+                within_tolerance=row["within_tolerance"],
+                timestamp=row["timestamp"],
+            ))
+        
+        return TestResult(
+            test_id=run["test_id"],
+            sequence_id=run["sequence_id"] or "",
+            sequence_name=run["sequence_name"] or "",
+            status=run["status"],
+            start_time=run["start_time"],
+            end_time=run["end_time"],
+            duration_seconds=run["duration_seconds"],
+            overall_passed=bool(run["overall_passed"]),
+            operator=run["operator"],
+            dut_serial_number=run["dut_serial_number"],
+            notes=run["notes"],
+            step_results=[StepResult(
+                step_name=step["step_name"],
+                step_number=step["step_number"],
+                step_type=step["step_type"],
+                start_time=step["start_time"],
+                end_time=step["end_time"],
+                duration_seconds=step["duration_seconds"],
+                passed=step["passed"],
+                measurements=by_step.get(step["step_number"], []),
+                error_message=step["error_message"],
+                raw_data=step["raw_data"] or {},
+            ) for step in steps],
+        )
+
+    # Hilo escritor
+
+    def _recover_interrupted_runs(self, own: bool = False):
+        """Marcar como fallidas las ejecuciones cuyo nodo ya no está vivo"""
+        stale = or_(test_runs.c.heartbeat_at.is_(None),
+                    test_runs.c.heartbeat_at < datetime.now() - timedelta(seconds=self.run_lease))
+        if own:
+            # Al arrancar, las del propio nodo son de un proceso anterior
+            stale = or_(stale, test_runs.c.node_id == self.node_id)
+        with self._engine.begin() as conn:
+            conn.execute(
+                update(test_runs)
+                .where(and_(test_runs.c.status == TestStatus.RUNNING.value, stale))
+                .values(status=TestStatus.FAILED.value, notes="Ejecución interrumpida (reinicio del servidor)")
+            )
+
+    def _maintain_runs(self):
+        """Latido de las ejecuciones de este nodo y recuperación de las de nodos caídos"""
+        try:
+            with self._engine.begin() as conn:
+                conn.execute(
+                    update(test_runs)
+                    .where(and_(test_runs.c.node_id == self.node_id,
+                                test_runs.c.status == TestStatus.RUNNING.value))
+                    .values(heartbeat_at=datetime.now())
+                )
+            self._recover_interrupted_runs()
+            self._replay_spilled()
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error manteniendo ejecuciones: {str(e)}")
+
+    def _writer_loop(self):
+        runs: List[Dict[str, Any]] = []
+        steps: List[Dict[str, Any]] = []
+        rows: List[Dict[str, Any]] = []
+        finished: List[Dict[str, Any]] = []
+        waiters: List[Future] = []
+        deadline = time.monotonic() + self.flush_interval
+        failures = 0
+        retry_at = 0.0
+        maintain_interval = self.run_lease / 3
+        next_maintenance = time.monotonic() + maintain_interval
+        stopping = False
+        
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                item = None
+            
+            if item is self._STOP:
+                stopping = True
+            elif item is not None:
+                kind, payload = item
+                if kind == "begin":
+                    runs.append(payload)
+                elif kind == "step":
+                    step_row, measurement_rows = step_rows(*payload)
+                    steps.append(step_row)
+                    rows.extend(measurement_rows)
+                    self._archive(measurement_rows, step_row["step_name"])
+                elif kind == "finish":
+                    finished.append(payload)
+                elif kind == "flush":
+                    waiters.append(payload)
+            
+            if self.archive is not None:
+                try:
+                    if stopping:
+                        self.archive.flush()
+                    else:
+                        self.archive.seal_if_due()
+                except Exception as e:
+                    print(f"Error sellando el archivo de mediciones: {str(e)}")
+            
+            pending = len(runs) + len(steps) + len(rows) + len(finished)
+            now = time.monotonic()
+            if not stopping and now < retry_at:
+                # Esperando para reintentar un lote fallido
+                deadline = retry_at
+                continue
+            if stopping or waiters or pending >= self.batch_size or now >= deadline:
+                if pending:
+                    # Los lotes guardados van antes: un "finish" no debe adelantarse a su "begin"
+                    if self._replay_spilled() and self._write_batch(runs, steps, rows, finished):
+                        failures = 0
+                    else:
+                        failures += 1
+                        if stopping or failures >= self.max_retries:
+                            self._spill(runs, steps, rows, finished)
+                            failures = 0
+                        else:
+                            retry_at = now + min(self.flush_interval * 2 ** failures, 30.0)
+                            continue  # El lote se conserva para el reintento
+                    runs, steps, rows, finished = [], [], [], []
+                for waiter in waiters:
+                    waiter.set_result(None)
+                waiters = []
+                deadline = time.monotonic() + self.flush_interval
+            
+            if not stopping and now >= next_maintenance:
+                self._maintain_runs()
+                next_maintenance = time.monotonic() + maintain_interval
+
+    def _write_batch(self, runs, steps, rows, finished) -> bool:
+        start = time.perf_counter()
+        try:
+            with self._engine.begin() as conn:
+                if runs:
+                    conn.execute(test_runs.insert(), runs)
+                if steps:
+                    conn.execute(step_results.insert(), steps)
+                if rows:
+                    conn.execute(measurements.insert(), rows)
+                if finished:
+                    conn.execute(
+                        update(test_runs).where(test_runs.c.test_id == bindparam("b_test_id")),
+                        finished
+                    )
+            written = len(runs) + len(steps) + len(rows)
+            self.rows_written += written
+            self.flush_count += 1
+            RESULTS_WRITE_SECONDS.observe(time.perf_counter() - start)
+            RESULTS_ROWS.inc(amount=written)
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error escribiendo resultados: {str(e)}")
+            return False
+        return True
+
+    def _archive(self, rows: List[Dict[str, Any]], step_name: str):
+        if self.archive is None or not rows:
+            return
+        try:
+            self.archive.append_rows(rows, step_name)
+        except Exception as e:
+            print(f"Error archivando mediciones: {str(e)}")
+
+    def _spill(self, runs, steps, rows, finished):
+        """Guardar en disco un lote que no se pudo escribir"""
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            self.spilled_batches += 1
+            path = os.path.join(self.spill_dir, f"batch_{time.time_ns()}_{self.spilled_batches:06d}.pkl")
+            with open(path + ".tmp", "wb") as f:
+                pickle.dump((runs, steps, rows, finished), f)
+            os.replace(path + ".tmp", path)
+            self._spill_pending = True
+            print(f"Lote de resultados guardado en {path}")
+        except Exception as e:
+            print(f"Error guardando lote de resultados: {str(e)}")
+
+    def _replay_spilled(self) -> bool:
+        """Escribir los lotes guardados por ``_spill`` (en orden) y borrarlos
+        
+        Devuelve True si no queda ninguno pendiente.
+        """
+        if not self._spill_pending:
+            return True
+        names = sorted(os.listdir(self.spill_dir)) if os.path.isdir(self.spill_dir) else []
+        for name in names:
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            try:
+                with open(path, "rb") as f:
+                    batch = pickle.load(f)
+            except Exception as e:
+                self._quarantine(path, e)
+                continue
+            if self._write_batch(*batch):
+                os.remove(path)
+                self._spill_failures.pop(name, None)
+                continue
+            if not self._database_available():
+                return False  # La base de datos sigue sin responder: se reintenta más tarde
+            # La base de datos responde pero rechaza el lote: tras varios intentos se aparta
+            failures = self._spill_failures[name] = self._spill_failures.get(name, 0) + 1
+            if failures < self.max_retries:
+                return False
+            self._spill_failures.pop(name, None)
+            self._quarantine(path, self.last_error)
+        self._spill_pending = False
+        return True
+
+    def _quarantine(self, path: str, reason: Any):
+        try:
+            os.replace(path, path[:-len(".pkl")] + ".failed")
+            print(f"Lote de resultados apartado ({reason}): {path}")
+        except OSError as e:
+            print(f"Error apartando lote de resultados {path}: {str(e)}")
+
+    def _database_available(self) -> bool:
+        try:
+            with self._engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL: los lectores no bloquean al escritor y un corte no corrompe la base
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+# Instancia global del almacén de resultados
+results_store = ResultsStore(archive=measurement_archive)
+RESULTS_QUEUE_DEPTH.set_function(results_store.pending)
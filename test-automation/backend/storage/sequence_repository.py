@@ -0,0 +1,282 @@
+import asyncio
+import json
+import os
+from bisect import bisect_left, insort
+from typing import Dict, Any, Callable, Iterable, List, Optional, Set, Tuple
+
+from pydantic import ValidationError
+
+from config.settings import settings
+from models.test_models import TestSequence
+
+try:
+    from watchfiles import awatch
+except ImportError:  # Sin watchfiles se comprueba el directorio periódicamente
+    awatch = None
+
+SEQUENCE_EXTENSIONS = (".json",)
+
+def _dump(sequence: TestSequence) -> Dict[str, Any]:
+    if hasattr(sequence, "model_dump"):
+        return sequence.model_dump(mode="json")
+    return json.loads(sequence.json())
+
+def sequence_instruments(sequence: TestSequence) -> Set[str]:
+    """Instrumentos que usa una secuencia (declarados y los de sus pasos)"""
+    instruments = set(sequence.required_instruments)
+    for step in sequence.steps:
+        instruments.update(step.required_instruments)
+        if step.parameters.get("instrument"):
+            instruments.add(step.parameters["instrument"])
+    return instruments
+
+class SequenceEntry:
+    """Secuencia cargada con su resumen y claves de índice precalculados"""
+
+    __slots__ = ("id", "path", "version", "data", "summary", "tags", "instruments", "search_text")
+
+    def __init__(self, path: str, sequence: TestSequence):
+        self.id = sequence.id
+        self.path = path
+        self.version = sequence.version
+        self.data = _dump(sequence)
+        self.tags = frozenset(sequence.tags)
+        self.instruments = frozenset(sequence_instruments(sequence))
+        self.search_text = f"{sequence.id} {sequence.name} {sequence.description or ''}".lower()
+        self.summary = {
+            "id": sequence.id,
+            "name": sequence.name,
+            "description": sequence.description,
+            "version": sequence.version,
+            "author": sequence.author,
+            "tags": sorted(self.tags),
+            "required_instruments": sorted(self.instruments),
+            "steps": len(sequence.steps),
+            "estimated_duration_seconds": sequence.estimated_duration_seconds,
+        }
+
+class SequenceRepository:
+    """Biblioteca de secuencias cargadas desde ``SEQUENCE_DIR``
+
+    Cada fichero ``*.json`` contiene una secuencia que se valida contra
+    ``TestSequence``. Se mantienen índices en memoria por id, etiqueta e
+    instrumento, y una lista ordenada de ids para paginar sin ordenar en
+    cada petición. Los cambios se aplican de forma incremental: solo se
+    vuelven a leer los ficheros cuyo (mtime, tamaño) ha cambiado, avisados
+    por ``watchfiles`` o, si no está instalado, por un sondeo ligero de
+    metadatos cada ``poll_interval`` segundos. La lectura y validación se
+    hacen en un hilo; los índices solo se modifican desde el bucle.
+    """
+
+    def __init__(self, directory: Optional[str] = None, poll_interval: Optional[float] = None):
+        self.directory = directory or settings.SEQUENCE_DIR
+        self.poll_interval = poll_interval or settings.SEQUENCE_POLL_INTERVAL
+        self.entries: Dict[str, SequenceEntry] = {}
+        self.by_tag: Dict[str, Set[str]] = {}
+        self.by_instrument: Dict[str, Set[str]] = {}
+        self.errors: Dict[str, str] = {}  # Fichero -> motivo por el que no se cargó
+        self.listeners: List[Callable[[str], None]] = []
+        self._ids: List[str] = []  # Ids ordenados (paginación estable)
+        self._files: Dict[str, Tuple[int, int, Optional[str]]] = {}  # ruta -> (mtime_ns, tamaño, id)
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """Registrar un callback que recibe el id de cada secuencia añadida, cambiada o borrada"""
+        self.listeners.append(listener)
+
+    # Carga: lectura y validación en un hilo, actualización de índices en el bucle
+
+    def load(self) -> int:
+        """Sincronizar con el directorio; devuelve el número de secuencias afectadas"""
+        return self._apply(*self._scan())
+
+    async def reload(self, paths: Optional[Iterable[str]] = None) -> int:
+        """Como ``load`` (o solo para ``paths``) sin bloquear el bucle de eventos"""
+        if paths is None:
+            loaded, removed = await asyncio.to_thread(self._scan)
+        else:
+            loaded, removed = await asyncio.to_thread(self._read_paths, paths)
+        return self._apply(loaded, removed)
+
+    def _scan(self) -> Tuple[List[tuple], List[str]]:
+        """Releer los ficheros cuyo (mtime, tamaño) ha cambiado y detectar los borrados"""
+        os.makedirs(self.directory, exist_ok=True)
+        seen = set()
+        loaded = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(SEQUENCE_EXTENSIONS):
+                    continue
+                seen.add(entry.path)
+                stat = entry.stat()
+                known = self._files.get(entry.path)
+                if known is None or known[:2] != (stat.st_mtime_ns, stat.st_size):
+                    loaded.append(self._read(entry.path, stat))
+        removed = [path for path in list(self._files) if path not in seen]
+        return loaded, removed
+
+    def _read_paths(self, paths: Iterable[str]) -> Tuple[List[tuple], List[str]]:
+        """Releer solo los ficheros indicados (eventos del watcher)"""
+        loaded = []
+        removed = []
+        for path in paths:
+            if not path.endswith(SEQUENCE_EXTENSIONS):
+                continue
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                removed.append(path)
+                continue
+            loaded.append(self._read(path, stat))
+        return loaded, removed
+
+    def _read(self, path: str, stat: os.stat_result) -> tuple:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return path, stat, TestSequence(**json.load(f)), None
+        except (OSError, ValueError, TypeError, ValidationError) as e:
+            return path, stat, None, str(e)
+
+    def _apply(self, loaded: List[tuple], removed: List[str]) -> int:
+        changed: Set[str] = set()
+        for path in removed:
+            if path in self._files:
+                changed.update(self._remove_file(path))
+        for path, stat, sequence, error in loaded:
+            changed.update(self._load_file(path, stat, sequence, error))
+        for sequence_id in sorted(changed):
+            self._notify(sequence_id)
+        return len(changed)
+
+    def _load_file(self, path: str, stat: os.stat_result, sequence: Optional[TestSequence],
+                   error: Optional[str]) -> List[str]:
+        previous_id = self._files.get(path, (0, 0, None))[2]
+        if sequence is not None:
+            owner = self.entries.get(sequence.id)
+            if owner is not None and owner.path != path:
+                error = f"Id duplicado: {sequence.id} ya está definido en {owner.path}"
+        if error is not None:
+            # Se conserva la versión anterior válida (si la hubo) hasta que se corrija
+            self.errors[path] = error
+            self._files[path] = (stat.st_mtime_ns, stat.st_size, previous_id)
+            return []
+
+        changed = [sequence.id]
+        self.errors.pop(path, None)
+        if previous_id is not None and previous_id != sequence.id:
+            self._unindex(previous_id)
+            changed.append(previous_id)
+        self._index(SequenceEntry(path, sequence))
+        self._files[path] = (stat.st_mtime_ns, stat.st_size, sequence.id)
+        return changed
+
+    def _remove_file(self, path: str) -> List[str]:
+        _, _, sequence_id = self._files.pop(path)
+        self.errors.pop(path, None)
+        if sequence_id is not None and sequence_id in self.entries and self.entries[sequence_id].path == path:
+            self._unindex(sequence_id)
+            return [sequence_id]
+        return []
+
+    def _index(self, entry: SequenceEntry):
+        if entry.id in self.entries:
+            self._unindex(entry.id)
+        self.entries[entry.id] = entry
+        insort(self._ids, entry.id)
+        for tag in entry.tags:
+            self.by_tag.setdefault(tag, set()).add(entry.id)
+        for instrument in entry.instruments:
+            self.by_instrument.setdefault(instrument, set()).add(entry.id)
+
+    def _unindex(self, sequence_id: str):
+        entry = self.entries.pop(sequence_id)
+        del self._ids[bisect_left(self._ids, sequence_id)]
+        for index, keys in ((self.by_tag, entry.tags), (self.by_instrument, entry.instruments)):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(sequence_id)
+                    if not ids:
+                        del index[key]
+
+    def _notify(self, sequence_id: str):
+        for listener in self.listeners:
+            try:
+                listener(sequence_id)
+            except Exception as e:
+                print(f"Error notificando cambio de secuencia {sequence_id}: {str(e)}")
+
+    # Consulta
+
+    def get(self, sequence_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(sequence_id)
+        return entry.data if entry is not None else None
+
+    def query(self, tag: Optional[str] = None, instrument: Optional[str] = None, search: Optional[str] = None,
+              offset: int = 0, limit: int = 100, summary: bool = False) -> Tuple[int, List[Dict[str, Any]]]:
+        """Filtrar y paginar; devuelve (total que cumple el filtro, página)"""
+        candidates: Optional[Set[str]] = None
+        for index, key in ((self.by_tag, tag), (self.by_instrument, instrument)):
+            if key is not None:
+                ids = index.get(key, set())
+                candidates = ids if candidates is None else candidates & ids
+
+        if candidates is None:
+            ids = self._ids
+        else:
+            ids = sorted(candidates)
+        if search:
+            needle = search.lower()
+            ids = [sequence_id for sequence_id in ids if needle in self.entries[sequence_id].search_text]
+
+        page = ids[offset:offset + limit]
+        field = "summary" if summary else "data"
+        return len(ids), [getattr(self.entries[sequence_id], field) for sequence_id in page]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "sequences": len(self.entries),
+            "files": len(self._files),
+            "tags": len(self.by_tag),
+            "instruments": len(self.by_instrument),
+            "errors": dict(self.errors),
+            "watcher": "watchfiles" if awatch is not None else "polling",
+        }
+
+    # Vigilancia del directorio
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        try:
+            await self.reload()
+        except Exception as e:
+            print(f"Error cargando secuencias de {self.directory}: {str(e)}")
+        if awatch is not None:
+            async for changes in awatch(self.directory):
+                try:
+                    await self.reload({path for _, path in changes})
+                except Exception as e:
+                    print(f"Error recargando secuencias: {str(e)}")
+        else:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    await self.reload()
+                except Exception as e:
+                    print(f"Error recargando secuencias: {str(e)}")
+
+# Instancia global de la biblioteca de secuencias
+sequence_repository = SequenceRepository()
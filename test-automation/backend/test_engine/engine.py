@@ -1,194 +1,562 @@
 import asyncio
 import time
-from typing import Dict, Any, Callable, Optional
-from datetime import datetime
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Callable, List, Mapping, Optional
+
+from config.settings import settings
+from hardware.arbiter import InstrumentArbiter
+from hardware.deadline import deadline_scope
+from hardware.simulated import SimulatedInstrument, simulated_daq
+from monitoring.metrics import CALLBACK_ERRORS, RUNS_TOTAL, STEP_ERRORS, STEP_TIMEOUTS, phase
+from monitoring.tracing import RunTrace, current_step, current_trace
+from test_engine.run_context import RunContext
+from test_engine.step_record import StepRecord, new_clock
+from models.test_models import InstrumentType, TestStepType
+from test_engine.limits import LimitSpec, evaluate_limits
+from test_engine.plan import (
+    REFERENCE_INSTRUMENT, ExecutionPlan, PlanCache, PlannedStep, SequenceValidationError, compile_sequence
+)
 
 class TestEngine:
-    """Motor principal de ejecución de pruebas"""
+    """Motor principal de ejecución de pruebas
+    
+    Cada llamada a ``run_sequence`` se ejecuta en su propio ``RunContext``,
+    de modo que varias fixtures pueden probar DUTs en paralelo. El acceso a
+    los instrumentos se arbitra con ``InstrumentArbiter``: dos ejecuciones
+    nunca manejan el mismo instrumento a la vez.
+    
+    Las secuencias se compilan una vez en un ``ExecutionPlan`` (validado,
+    con valores por defecto y handlers resueltos) que se guarda en caché
+    por (id, version).
     
-    def __init__(self):
-        self.running = False
-        self.current_test_id = None
-        self.current_sequence = None
-        self.results = []
+    Las secuencias con ``"parallel": true`` se ejecutan como un DAG: los
+    pasos sin dependencias pendientes corren a la vez, pero los resultados
+    se registran y notifican siempre en el orden de la secuencia.
+    
+    Cada paso se cancela al superar ``timeout_seconds`` y la secuencia al
+    superar su límite; la E/S con los instrumentos recibe como timeout el
+    presupuesto que le quede al paso.
+    """
+    
+    def __init__(self, arbiter: Optional[InstrumentArbiter] = None, max_parallel_runs: Optional[int] = None,
+                 results_store=None, stream=None, pool=None, simulate: Optional[bool] = None):
+        self.pool = pool  # InstrumentPool con los drivers conectados (opcional)
+        self.simulate = settings.SIMULATE_INSTRUMENTS if simulate is None else simulate
+        self.arbiter = arbiter or (pool.arbiter if pool is not None else InstrumentArbiter())
+        self.results_store = results_store
+        self.stream = stream  # StreamManager del canal binario (opcional)
+        self.max_parallel_runs = max_parallel_runs or settings.MAX_PARALLEL_RUNS
+        self._run_slots = asyncio.Semaphore(self.max_parallel_runs)
+        self.runs: Dict[str, RunContext] = {}
+        self.last_run: Optional[RunContext] = None
+        self._handlers: Dict[str, Callable] = {
+            TestStepType.POWER_SUPPLY.value: self._execute_power_step,
+            TestStepType.MEASUREMENT.value: self._execute_measurement_step,
+            TestStepType.DELAY.value: self._execute_delay_step,
+            TestStepType.VALIDATION.value: self._execute_validation_step,
+            TestStepType.DAQ_READ.value: self._execute_daq_read_step,
+            TestStepType.DAQ_WRITE.value: self._execute_daq_write_step,
+        }
+        self.plan_cache = PlanCache(lambda sequence: compile_sequence(sequence, self._handlers))
+
+    @property
+    def running(self) -> bool:
+        return bool(self.runs)
+
+    @property
+    def current_test_id(self) -> Optional[str]:
+        return self.last_run.test_id if self.last_run else None
+
+    @property
+    def current_sequence(self) -> Optional[Dict[str, Any]]:
+        return self.last_run.sequence if self.last_run else None
+
+    @property
+    def results(self) -> List[StepRecord]:
+        return list(self.last_run.results) if self.last_run else []
+
+    def new_test_id(self) -> str:
+        return f"test_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+
+    def compile(self, sequence: Dict[str, Any]) -> ExecutionPlan:
+        """Obtener el plan de ejecución de una secuencia (desde caché si existe)"""
+        return self.plan_cache.get(sequence)
+
+    def prewarm(self, sequences: List[Dict[str, Any]]) -> List[str]:
+        """Compilar secuencias por adelantado; devuelve los errores encontrados"""
+        return self.plan_cache.prewarm(sequences)
         
-    async def run_sequence(self, sequence: Dict[str, Any], callback: Callable = None):
-        """Ejecutar una secuencia de pruebas completa"""
-        if self.running:
-            raise RuntimeError("Ya hay una prueba ejecutándose")
+    async def run_sequence(self, sequence: Dict[str, Any], callback: Callable = None,
+                           station_id: Optional[str] = None, test_id: Optional[str] = None) -> Dict[str, Any]:
+        """Ejecutar una secuencia de pruebas completa en un contexto aislado"""
+        ctx = RunContext(test_id or self.new_test_id(), sequence, station_id)
+        try:
+            ctx.plan = self.compile(sequence)
+        except SequenceValidationError as e:
+            ctx.status = "failed"
+            await self._send_callback(callback, {
+                "type": "test_error",
+                "test_id": ctx.test_id,
+                "station_id": ctx.station_id,
+                "error": f"Secuencia inválida: {str(e)}"
+            })
+            return ctx.get_status()
         
-        self.running = True
-        self.current_test_id = f"test_{int(time.time())}"
-        self.current_sequence = sequence
-        self.results = []
+        ctx.instrument_map = self._station_instruments(ctx)
+        ctx.instruments = sorted(set(ctx.instrument_map.values()))
+        self.runs[ctx.test_id] = ctx
+        self.last_run = ctx
+        if settings.TRACE_RUNS or sequence.get("trace"):
+            ctx.trace = RunTrace(ctx.test_id)
+        trace_token = current_trace.set(ctx.trace)
+        
+        try:
+            # Primero los instrumentos y después el turno: una ejecución que espera
+            # a su estación no ocupa un hueco que podría usar otra estación
+            async with self._lease_instruments(ctx) as leased:
+                async with self._run_slots:
+                    ctx.leased = {logical: leased[physical] for logical, physical in ctx.instrument_map.items()
+                                  if physical in leased}
+                    await self._run_steps(ctx, callback)
+        except asyncio.CancelledError:
+            if ctx.status == "pending":
+                # Cancelada mientras esperaba turno o instrumentos
+                ctx.status = "stopped"
+                await self._send_stopped(ctx, callback)
+            raise
+        finally:
+            self.runs.pop(ctx.test_id, None)
+            current_trace.reset(trace_token)
+            RUNS_TOTAL.inc(ctx.status)
+            if ctx.trace is not None:
+                try:
+                    await asyncio.to_thread(ctx.trace.dump, settings.TRACE_DIR)
+                except Exception as e:
+                    print(f"Error guardando traza de {ctx.test_id}: {str(e)}")
+        
+        return ctx.get_status()
+
+    def _station_instruments(self, ctx: RunContext) -> Dict[str, str]:
+        """Traducir los nombres lógicos del plan a los instrumentos de la estación
+
+        Sin estación se usa el nombre tal cual (instrumento compartido). Con
+        estación: el mapa de ``STATION_INSTRUMENTS`` o, si no, ``nombre@estación``
+        cuando existe en el pool o el instrumento no es real (simulado).
+        """
+        if ctx.station_id is None:
+            return {name: name for name in ctx.plan.instruments}
+        mapping = settings.STATION_INSTRUMENTS.get(str(ctx.station_id), {})
+        resolved = {}
+        for name in ctx.plan.instruments:
+            physical = mapping.get(name)
+            if physical is None:
+                scoped = f"{name}@{ctx.station_id}"
+                in_pool = self.pool is not None and name in self.pool
+                physical = scoped if (self.pool is not None and scoped in self.pool) or not in_pool else name
+            resolved[name] = physical
+        return resolved
+
+    @asynccontextmanager
+    async def _lease_instruments(self, ctx: RunContext):
+        """Reservar los instrumentos de la ejecución (y obtener sus drivers del pool)"""
+        timeout = settings.INSTRUMENT_LEASE_TIMEOUT
+        if self.pool is not None:
+            async with self.pool.lease(ctx.instruments, ctx.test_id, timeout) as instruments:
+                yield instruments
+        else:
+            async with self.arbiter.lease(ctx.instruments, ctx.test_id, timeout):
+                yield {}
+
+    async def _get_instrument(self, ctx: RunContext, name: Optional[str],
+                              kind: str = InstrumentType.POWER_SUPPLY.value):
+        """Driver de un instrumento: el reservado del pool o, si se permite, uno simulado"""
+        instrument = ctx.leased.get(name)
+        if instrument is not None or name is None or not self.simulate:
+            return instrument
+        
+        instrument = ctx.simulated.get(name)
+        if instrument is None:
+            if kind == InstrumentType.DAQ.value:
+                instrument = simulated_daq(f"SIM::{name}")
+            else:
+                instrument = SimulatedInstrument(f"SIM::{name}", list_mode=True)
+            await instrument.connect()
+            ctx.simulated[name] = instrument
+        return instrument
+
+    async def _release_simulated(self, ctx: RunContext):
+        for instrument in ctx.simulated.values():
+            await instrument.disconnect()
+        ctx.simulated.clear()
+
+    async def _run_steps(self, ctx: RunContext, callback: Callable = None):
+        """Ejecutar los pasos de una ejecución ya con instrumentos reservados"""
+        ctx.status = "running"
+        ctx.clock = new_clock()
+        ctx.start_time = ctx.clock[0]
+        if self.results_store:
+            self.results_store.begin_run(ctx.test_id, ctx.sequence, ctx.station_id)
         
         try:
             await self._send_callback(callback, {
                 "type": "test_started",
-                "test_id": self.current_test_id,
-                "sequence": sequence.get("name", "Unknown"),
-                "total_steps": len(sequence.get("steps", []))
+                "test_id": ctx.test_id,
+                "station_id": ctx.station_id,
+                "sequence": ctx.sequence.get("name", "Unknown"),
+                "total_steps": ctx.total_steps
             })
             
-            # Ejecutar cada paso de la secuencia
-            for i, step in enumerate(sequence.get("steps", [])):
-                if not self.running:
-                    break
-                
-                step_result = await self._execute_step(step, i + 1, callback)
-                self.results.append(step_result)
-                
-                # Pequeña pausa entre pasos
-                await asyncio.sleep(0.01)
+            ctx.deadline = time.monotonic() + ctx.plan.timeout_seconds
+            with deadline_scope(ctx.plan.timeout_seconds):
+                if ctx.plan.parallel:
+                    await self._run_dag(ctx, callback)
+                else:
+                    # Ejecutar cada paso de la secuencia
+                    for step in ctx.plan.steps:
+                        if ctx.stop_requested or ctx.deadline_exceeded:
+                            break
+                        
+                        step_result = await self._run_step(ctx, step, callback)
+                        await self._complete_step(ctx, step, step_result, callback)
             
             # Evaluar resultado final
-            passed_steps = sum(1 for r in self.results if r.get("passed", False))
-            total_steps = len(self.results)
-            overall_result = passed_steps == total_steps
+            if ctx.deadline_exceeded and ctx.completed_steps < ctx.total_steps:
+                ctx.timed_out = True
+            passed_steps = ctx.passed_steps
+            total_steps = ctx.completed_steps
+            overall_result = passed_steps == total_steps and not ctx.timed_out
+            ctx.status = "stopped" if ctx.stop_requested else ("completed" if overall_result else "failed")
             
             await self._send_callback(callback, {
                 "type": "test_completed",
-                "test_id": self.current_test_id,
+                "test_id": ctx.test_id,
+                "station_id": ctx.station_id,
                 "passed": overall_result,
                 "steps_passed": passed_steps,
                 "total_steps": total_steps,
-                "duration": time.time() - int(self.current_test_id.split("_")[1])
+                "timed_out": ctx.timed_out,
+                "duration": ctx.elapsed()
             })
             
+        except asyncio.CancelledError:
+            ctx.status = "stopped"
+            await self._send_stopped(ctx, callback)
+            raise
         except Exception as e:
+            ctx.status = "failed"
             await self._send_callback(callback, {
                 "type": "test_error",
-                "test_id": self.current_test_id,
+                "test_id": ctx.test_id,
+                "station_id": ctx.station_id,
                 "error": str(e)
             })
         finally:
-            self.running = False
+            await self._release_simulated(ctx)
+            if self.results_store:
+                passed = ctx.status == "completed"
+                self.results_store.finish_run(ctx.test_id, ctx.status, passed, ctx.elapsed())
             
-    async def _execute_step(self, step: Dict[str, Any], step_number: int, callback: Callable = None):
+    async def _run_dag(self, ctx: RunContext, callback: Callable = None):
+        """Ejecutar los pasos en paralelo respetando ``depends_on``
+        
+        Un paso se lanza cuando han terminado todos sus dependencias (hasta
+        ``max_parallel_steps`` a la vez). Los resultados se registran en
+        orden de paso a medida que se completa el prefijo, de modo que el
+        informe es idéntico al de una ejecución secuencial.
+        """
+        steps = ctx.plan.steps
+        limit = ctx.plan.max_parallel_steps or settings.MAX_PARALLEL_STEPS
+        pending = list(steps)
+        running: Dict[asyncio.Task, PlannedStep] = {}
+        done: Dict[int, StepRecord] = {}
+        reported = 0
+        
+        try:
+            while pending or running:
+                if not ctx.stop_requested and not ctx.deadline_exceeded:
+                    for step in list(pending):
+                        if len(running) >= limit:
+                            break
+                        if all(dependency in done for dependency in step.depends_on):
+                            pending.remove(step)
+                            task = asyncio.create_task(self._run_step(ctx, step, callback))
+                            running[task] = step
+                if not running:
+                    break
+                
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    step = running.pop(task)
+                    result = task.result()
+                    # Visible ya para las validaciones que dependen de este paso
+                    ctx.publish_result(result)
+                    done[step.number] = result
+                
+                while reported < len(steps) and steps[reported].number in done:
+                    step = steps[reported]
+                    await self._complete_step(ctx, step, done[step.number], callback, publish=False)
+                    reported += 1
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        
+        # Tras una parada pueden quedar pasos terminados fuera del prefijo
+        for step in steps[reported:]:
+            if step.number in done:
+                await self._complete_step(ctx, step, done[step.number], callback, publish=False)
+
+    async def _run_step(self, ctx: RunContext, step: PlannedStep, callback: Callable = None) -> StepRecord:
+        """Ejecutar un paso y la pausa posterior que pida (``gap_ms``)"""
+        result = await self._execute_step(ctx, step, callback)
+        gap_ms = step.get("gap_ms")
+        if gap_ms:
+            await asyncio.sleep(gap_ms / 1000.0)
+        return result
+
+    async def _complete_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord,
+                             callback: Callable = None, publish: bool = True):
+        """Registrar, guardar y notificar el resultado de un paso"""
+        ctx.record_result(result, publish=publish)
+        if self.results_store:
+            with phase(step.type, "store"):
+                self.results_store.record_step(ctx.test_id, step.type, result)
+        
+        with phase(step.type, "broadcast"):
+            await self._send_callback(callback, {
+                "type": "step_completed",
+                "test_id": ctx.test_id,
+                "step": step.name,
+                "result": result
+            })
+
+    async def _execute_step(self, ctx: RunContext, step: PlannedStep, callback: Callable = None):
         """Ejecutar un paso individual de la prueba"""
-        step_name = step.get("name", f"Step {step_number}")
-        step_type = step.get("type", "unknown")
+        step_name = step.name
+        step_number = step.number
+        current_step.set(step_number)
         
-        await self._send_callback(callback, {
-            "type": "step_started",
-            "test_id": self.current_test_id,
-            "step": step_name,
-            "step_number": step_number
-        })
+        with phase(step.type, "broadcast"):
+            await self._send_callback(callback, {
+                "type": "step_started",
+                "test_id": ctx.test_id,
+                "step": step_name,
+                "step_number": step_number
+            })
         
-        start_time = time.time()
-        result = {
-            "step_name": step_name,
-            "step_number": step_number,
-            "start_time": datetime.now().isoformat(),
-            "passed": False,
-            "measurements": {},
-            "error": None
-        }
+        result = StepRecord(step_name, step_number, step.type, ctx.clock)
         
+        # El paso tiene como mucho su timeout y lo que le quede a la secuencia
+        timeout = max(min(step.timeout_seconds, ctx.remaining()), 0.0)
         try:
-            # Ejecutar según el tipo de paso
-            if step_type == "power_supply":
-                result = await self._execute_power_step(step, result)
-            elif step_type == "measurement":
-                result = await self._execute_measurement_step(step, result)
-            elif step_type == "delay":
-                result = await self._execute_delay_step(step, result)
-            elif step_type == "validation":
-                result = await self._execute_validation_step(step, result)
-            else:
-                result["error"] = f"Tipo de paso desconocido: {step_type}"
+            # Handler enlazado al compilar el plan
+            with phase(step.type, "execute"), deadline_scope(timeout):
+                result = await asyncio.wait_for(step.handler(ctx, step, result), timeout)
                 
+        except (asyncio.TimeoutError, TimeoutError):
+            # Se conservan las mediciones que el handler llegó a registrar
+            limit = "de la secuencia" if ctx.deadline_exceeded else f"del paso ({step.timeout_seconds}s)"
+            result.error = f"Timeout: se superó el límite {limit}"
+            result.timed_out = True
+            result.passed = False
+            STEP_TIMEOUTS.inc(step.type)
+            if ctx.deadline_exceeded:
+                ctx.timed_out = True
+            if self.pool is not None:
+                # El pool usa nombres físicos (los de la estación)
+                for name in step.instruments:
+                    self.pool.mark_suspect(ctx.instrument_map.get(name, name))
         except Exception as e:
-            result["error"] = str(e)
-            result["passed"] = False
+            result.error = str(e)
+            result.passed = False
+            STEP_ERRORS.inc(step.type)
         
-        result["duration"] = time.time() - start_time
-        result["end_time"] = datetime.now().isoformat()
-        
-        await self._send_callback(callback, {
-            "type": "step_completed",
-            "test_id": self.current_test_id,
-            "step": step_name,
-            "result": result
-        })
+        result.finish()
         
         return result
     
-    async def _execute_power_step(self, step: Dict[str, Any], result: Dict[str, Any]):
+    async def _execute_power_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord):
         """Ejecutar paso relacionado con fuente de alimentación"""
-        # Aquí integrarías con tus drivers reales
-        voltage = step.get("voltage", 0)
-        current_limit = step.get("current_limit", 1.0)
-        
-        # Simular configuración de fuente
-        await asyncio.sleep(0.05)  # Simular tiempo de establecimiento
-        
-        # Simular medición
-        result["measurements"] = {
-            "voltage_set": voltage,
-            "voltage_measured": voltage + (voltage * 0.01),  # Simular pequeña diferencia
-            "current_measured": 0.1,
-            "power": voltage * 0.1
-        }
+        voltage = step.params["voltage"]
+        current_limit = step.params["current_limit"]
+        name = step.get("instrument", "power_supply")
+        instrument = await self._get_instrument(ctx, name)
+        if instrument is None:
+            raise RuntimeError(f"Instrumento {name} no conectado")
+        
+        with phase(step.type, "instrument"):
+            await instrument.set_current_limit(current_limit)
+            await instrument.set_voltage(voltage)
+            if instrument.output_enabled != step.params["output_enabled"]:
+                await instrument.set_output(step.params["output_enabled"])
+        # Registrado ya por si el paso no llega a medir (timeout)
+        result.measurements["voltage_set"] = voltage
+        # stabilization_time_ms es solo el máximo: se mide en cuanto la salida es estable
+        max_settle = step.params["stabilization_time_ms"] / 1000.0
+        with phase(step.type, "settle"):
+            if hasattr(instrument, "wait_settled"):
+                voltage_measured, current_measured, settle_time = await instrument.wait_settled(max_settle)
+            else:
+                await asyncio.sleep(max_settle)
+                voltage_measured, current_measured = await instrument.measure_voltage_current()
+                settle_time = max_settle
+        result.set("settle_time_ms", settle_time * 1000)
+        result.measurements.update({
+            "voltage_measured": voltage_measured,
+            "current_measured": current_measured,
+            "power": voltage_measured * current_measured
+        })
+        
+        self._publish_block(ctx, step.get("instrument", "power_supply"), {
+            "voltage_set": [voltage],
+            "voltage_measured": [voltage_measured],
+            "current_measured": [current_measured]
+        })
         
-        # Validar que el voltaje esté dentro de tolerancia (1%)
-        voltage_error = abs(result["measurements"]["voltage_measured"] - voltage) / voltage if voltage > 0 else 0
-        result["passed"] = voltage_error < 0.01
+        # Validar el voltaje medido contra la consigna (tolerancia del paso o por defecto)
+        with phase(step.type, "validation"):
+            self._apply_limits(result, step.limits)
         
         return result
     
-    async def _execute_measurement_step(self, step: Dict[str, Any], result: Dict[str, Any]):
+    async def _execute_measurement_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord):
         """Ejecutar paso de medición"""
-        measurement_type = step.get("measurement_type", "voltage")
-        expected_value = step.get("expected_value", 0)
-        tolerance = step.get("tolerance", 0.05)
+        measurement_type = step.params["measurement_type"]
+        expected_value = step.params["expected_value"]
+        tolerance = step.limits[measurement_type].tolerance  # La del paso o la del parámetro por defecto
+        name = step.params["instrument"]  # Obligatorio (compile_sequence)
+        instrument = await self._get_instrument(ctx, name)
+        if name == REFERENCE_INSTRUMENT and isinstance(instrument, SimulatedInstrument):
+            # Referencia simulada pedida por el paso: lee el valor esperado
+            instrument.apply_reference(measurement_type, expected_value)
+        if instrument is None:
+            raise RuntimeError(f"Instrumento {name} no conectado")
+        measure = getattr(instrument, f"measure_{measurement_type}", None)
+        if measure is None:
+            raise ValueError(f"El instrumento {name} no mide {measurement_type}")
         
-        # Simular medición
-        await asyncio.sleep(0.02)
+        with phase(step.type, "instrument"):
+            measured_value = await measure()
         
-        # Simular valor medido con pequeña variación
-        import random
-        measured_value = expected_value + random.uniform(-tolerance/2, tolerance/2)
-        
-        result["measurements"] = {
+        result.measurements = {
             measurement_type: measured_value,
             "expected": expected_value,
             "tolerance": tolerance
         }
         
-        # Validar tolerancia
-        error = abs(measured_value - expected_value)
-        result["passed"] = error <= tolerance
+        # Validar tolerancia (absoluta salvo que el paso indique otro tipo)
+        with phase(step.type, "validation"):
+            self._apply_limits(result, step.limits)
         
         return result
     
-    async def _execute_delay_step(self, step: Dict[str, Any], result: Dict[str, Any]):
+    async def _get_daq(self, ctx: RunContext, step: PlannedStep):
+        name = step.get("instrument", "daq")
+        daq = await self._get_instrument(ctx, name, InstrumentType.DAQ.value)
+        if daq is None or not hasattr(daq, "acquire"):
+            raise RuntimeError(f"DAQ {name} no conectada")
+        return name, daq
+    
+    async def _execute_daq_read_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord):
+        """Adquirir una ventana del flujo de la DAQ y medir sobre ella
+        
+        Las medidas (media, RMS, mín/máx, cruces de umbral) salen del
+        pipeline de la DAQ; solo la vista previa diezmada se publica en el
+        canal binario.
+        """
+        name, daq = await self._get_daq(ctx, step)
+        channels = list(step.params["channels"])
+        unknown = [channel for channel in channels if channel not in daq.channels]
+        if unknown:
+            raise ValueError(f"Canales no disponibles en {name}: {', '.join(unknown)}")
+        
+        with phase(step.type, "instrument"):
+            acquisition = await daq.acquire(
+                step.params["duration_ms"] / 1000.0,
+                threshold=step.params["threshold"],
+                edge=step.params["threshold_edge"],
+                max_points=step.params["max_points"]
+            )
+        result.measurements = acquisition.measurements(channels)
+        result.set("samples", acquisition.samples)
+        result.set("sample_rate", acquisition.sample_rate)
+        
+        self._publish_block(ctx, name, acquisition.preview_columns(channels), dt=acquisition.preview_dt)
+        
+        with phase(step.type, "validation"):
+            if step.limits:
+                self._apply_limits(result, step.limits)
+            else:
+                result.passed = True
+        
+        return result
+    
+    async def _execute_daq_write_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord):
+        """Fijar una salida analógica de la DAQ"""
+        _, daq = await self._get_daq(ctx, step)
+        channel = step.params["channel"]
+        value = step.params["value"]
+        
+        with phase(step.type, "instrument"):
+            await daq.write_output(channel, value)
+        if step.params["settle_ms"]:
+            await asyncio.sleep(step.params["settle_ms"] / 1000.0)
+        
+        result.measurements = {f"{channel}_set": value}
+        result.passed = True
+        
+        return result
+    
+    def _publish_block(self, ctx: RunContext, channel: str, columns: Dict[str, Any], dt: float = 0.0):
+        """Publicar un bloque de medidas en el canal binario si hay suscriptores"""
+        if self.stream is not None:
+            self.stream.publish(ctx.test_id, channel, columns, dt=dt)
+    
+    def _apply_limits(self, result: StepRecord, specs: Mapping[str, LimitSpec]):
+        """Evaluar los límites del paso y guardar veredicto y márgenes"""
+        evaluations = evaluate_limits(result.measurements, specs)
+        result.limits = {name: evaluation.summary() for name, evaluation in evaluations.items()}
+        result.passed = bool(evaluations) and all(evaluation.all_passed for evaluation in evaluations.values())
+    
+    async def _execute_delay_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord):
         """Ejecutar paso de retardo/espera"""
-        delay_ms = step.get("delay_ms", 100)
+        delay_ms = step.params["delay_ms"]
         
         await asyncio.sleep(delay_ms / 1000.0)
         
-        result["measurements"] = {"delay_applied_ms": delay_ms}
-        result["passed"] = True
+        result.measurements = {"delay_applied_ms": delay_ms}
+        result.passed = True
         
         return result
     
-    async def _execute_validation_step(self, step: Dict[str, Any], result: Dict[str, Any]):
-        """Ejecutar paso de validación lógica"""
-        condition = step.get("condition", "True")
+    async def _execute_validation_step(self, ctx: RunContext, step: PlannedStep, result: StepRecord):
+        """Ejecutar paso de validación lógica
+        
+        La condición se evalúa sobre las mediciones de pasos anteriores
+        (``step3.voltage_measured / step2.current > 10``) y las variables
+        del paso. Se compila una sola vez por versión de secuencia.
+        """
+        condition = step.params["condition"]
         
-        # En una implementación real, aquí evaluarías condiciones complejas
-        # basadas en mediciones anteriores o estado del sistema
+        variables = step.get("variables")
+        namespace = {**ctx.namespace, **variables} if variables else ctx.namespace
+        with phase(step.type, "validation"):
+            value = step.condition(namespace)
         
-        result["measurements"] = {"condition_evaluated": condition}
-        result["passed"] = True  # Simplificado
+        result.measurements = {"condition_evaluated": condition, "value": value}
+        result.passed = bool(value)
         
         return result
     
-    async def stop(self):
-        """Detener la prueba en ejecución"""
-        self.running = False
+    async def stop(self, test_id: Optional[str] = None):
+        """Detener una prueba en ejecución (o todas si no se indica test_id)"""
+        if test_id is None:
+            for ctx in self.runs.values():
+                ctx.request_stop()
+        elif test_id in self.runs:
+            self.runs[test_id].request_stop()
         
     async def get_current_status(self) -> Dict[str, Any]:
         """Obtener estado actual del motor de pruebas"""
@@ -196,14 +564,28 @@ class TestEngine:
             "running": self.running,
             "test_id": self.current_test_id,
             "sequence": self.current_sequence.get("name") if self.current_sequence else None,
-            "completed_steps": len(self.results),
-            "total_steps": len(self.current_sequence.get("steps", [])) if self.current_sequence else 0
+            "completed_steps": self.last_run.completed_steps if self.last_run else 0,
+            "total_steps": len(self.current_sequence.get("steps", [])) if self.current_sequence else 0,
+            "max_parallel_runs": self.max_parallel_runs,
+            "active_runs": [ctx.get_status() for ctx in self.runs.values()],
+            "instrument_leases": self.arbiter.get_leases()
         }
     
+    async def _send_stopped(self, ctx: RunContext, callback: Callable = None):
+        await self._send_callback(callback, {
+            "type": "test_stopped",
+            "test_id": ctx.test_id,
+            "station_id": ctx.station_id,
+            "completed_steps": ctx.completed_steps,
+            "total_steps": ctx.total_steps,
+            "duration": ctx.elapsed()
+        })
+    
     async def _send_callback(self, callback: Callable, message: Dict[str, Any]):
         """Enviar mensaje a través del callback si está disponible"""
         if callback:
             try:
                 await callback(message)
             except Exception as e:
-                print(f"Error enviando callback: {str(e)}")
\ No newline at end of file
+                CALLBACK_ERRORS.inc("engine")
+                print(f"Error enviando callback: {str(e)}")
@@ -0,0 +1,271 @@
+import ast
+import operator
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Set, Tuple
+
+class ExpressionError(ValueError):
+    """Error de sintaxis o de evaluación en una condición de validación"""
+    pass
+
+Evaluator = Callable[[Dict[str, Any]], Any]
+
+# Las condiciones se evalúan en el bucle de eventos sin posibilidad de
+# interrumpirlas: los operadores que pueden crecer sin límite se acotan
+MAX_EXPONENT = 64
+MAX_INT_BITS = 4096
+
+def _check_number(value: Any, op_name: str):
+    if not isinstance(value, (int, float)):
+        raise ExpressionError(f"Operando no numérico en '{op_name}': {type(value).__name__}")
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ExpressionError(f"Entero demasiado grande en '{op_name}'")
+
+def safe_mul(left: Any, right: Any) -> Any:
+    """Producto solo entre números (sin repetir cadenas ni listas) y con enteros acotados"""
+    _check_number(left, "*")
+    _check_number(right, "*")
+    if isinstance(left, int) and isinstance(right, int) and left.bit_length() + right.bit_length() > MAX_INT_BITS:
+        raise ExpressionError("Resultado demasiado grande en '*'")
+    return left * right
+
+def safe_pow(base: Any, exponent: Any) -> Any:
+    """Potencia con exponente acotado (``9**9**9`` no terminaría nunca)"""
+    _check_number(base, "**")
+    _check_number(exponent, "**")
+    if abs(exponent) > MAX_EXPONENT:
+        raise ExpressionError(f"Exponente fuera de rango (máximo {MAX_EXPONENT}): {exponent}")
+    if isinstance(base, int) and isinstance(exponent, int) and base.bit_length() * exponent > MAX_INT_BITS:
+        raise ExpressionError("Resultado demasiado grande en '**'")
+    return base ** exponent
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: safe_mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: safe_pow,
+}
+
+UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: operator.not_,
+}
+
+COMPARE_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+FUNCTIONS = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+}
+
+class CompiledCondition:
+    """Condición compilada a un árbol de closures (sin eval)"""
+    
+    def __init__(self, source: str, evaluator: Evaluator, references: Set[str]):
+        self.source = source
+        self.references = frozenset(references)  # Nombres usados: step3, limite...
+        self._evaluator = evaluator
+
+    def __call__(self, namespace: Dict[str, Any]) -> Any:
+        try:
+            return self._evaluator(namespace)
+        except ExpressionError:
+            raise
+        except Exception as e:
+            raise ExpressionError(f"Error evaluando '{self.source}': {str(e)}")
+
+class _Compiler:
+    """Traduce un AST restringido a closures de Python"""
+    
+    def __init__(self):
+        self.references: Set[str] = set()
+
+    def compile(self, node: ast.AST) -> Evaluator:
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise ExpressionError(f"Construcción no permitida: {type(node).__name__}")
+        return method(node)
+
+    def _compile_Expression(self, node: ast.Expression) -> Evaluator:
+        return self.compile(node.body)
+
+    def _compile_Constant(self, node: ast.Constant) -> Evaluator:
+        if not isinstance(node.value, (int, float, str, bool, type(None))):
+            raise ExpressionError(f"Constante no permitida: {node.value!r}")
+        value = node.value
+        return lambda namespace: value
+
+    def _compile_Name(self, node: ast.Name) -> Evaluator:
+        name = node.id
+        self.references.add(name)
+        
+        def lookup(namespace):
+            try:
+                return namespace[name]
+            except KeyError:
+                raise ExpressionError(f"Referencia no disponible: {name}")
+        return lookup
+
+    def _compile_Attribute(self, node: ast.Attribute) -> Evaluator:
+        # Solo se permite acceso a claves de resultados: step3.voltage_measured
+        if node.attr.startswith("_"):
+            raise ExpressionError(f"Atributo no permitido: {node.attr}")
+        base = self.compile(node.value)
+        attr = node.attr
+        path = ast.unparse(node)
+        
+        def lookup(namespace):
+            container = base(namespace)
+            try:
+                return container[attr]
+            except (KeyError, TypeError):
+                raise ExpressionError(f"Referencia no disponible: {path}")
+        return lookup
+
+    def _compile_Subscript(self, node: ast.Subscript) -> Evaluator:
+        base = self.compile(node.value)
+        key = self.compile(node.slice)
+        path = ast.unparse(node)
+        
+        def lookup(namespace):
+            try:
+                return base(namespace)[key(namespace)]
+            except (KeyError, IndexError, TypeError):
+                raise ExpressionError(f"Referencia no disponible: {path}")
+        return lookup
+
+    def _compile_BinOp(self, node: ast.BinOp) -> Evaluator:
+        op = BINARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Operador no permitido: {type(node.op).__name__}")
+        left, right = self.compile(node.left), self.compile(node.right)
+        if isinstance(node.op, (ast.Mult, ast.Pow)):
+            # Con operandos constantes los límites se comprueban ya al compilar
+            constants = [side for side in (node.left, node.right) if isinstance(side, ast.Constant)]
+            for constant in constants:
+                _check_number(constant.value, ast.unparse(node))
+            if len(constants) == 2:
+                value = op(node.left.value, node.right.value)
+                return lambda namespace: value
+        return lambda namespace: op(left(namespace), right(namespace))
+
+    def _compile_UnaryOp(self, node: ast.UnaryOp) -> Evaluator:
+        op = UNARY_OPERATORS.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Operador no permitido: {type(node.op).__name__}")
+        operand = self.compile(node.operand)
+        return lambda namespace: op(operand(namespace))
+
+    def _compile_BoolOp(self, node: ast.BoolOp) -> Evaluator:
+        values = tuple(self.compile(value) for value in node.values)
+        if isinstance(node.op, ast.And):
+            def evaluate(namespace):
+                result = True
+                for value in values:
+                    result = value(namespace)
+                    if not result:
+                        return result
+                return result
+        else:
+            def evaluate(namespace):
+                result = False
+                for value in values:
+                    result = value(namespace)
+                    if result:
+                        return result
+                return result
+        return evaluate
+
+    def _compile_Compare(self, node: ast.Compare) -> Evaluator:
+        left = self.compile(node.left)
+        comparisons = []
+        for op_node, comparator in zip(node.ops, node.comparators):
+            op = COMPARE_OPERATORS.get(type(op_node))
+            if op is None:
+                raise ExpressionError(f"Comparación no permitida: {type(op_node).__name__}")
+            comparisons.append((op, self.compile(comparator)))
+        comparisons = tuple(comparisons)
+        
+        def evaluate(namespace):
+            current = left(namespace)
+            for op, comparator in comparisons:
+                other = comparator(namespace)
+                if not op(current, other):
+                    return False
+                current = other
+            return True
+        return evaluate
+
+    def _compile_IfExp(self, node: ast.IfExp) -> Evaluator:
+        test, body, orelse = self.compile(node.test), self.compile(node.body), self.compile(node.orelse)
+        return lambda namespace: body(namespace) if test(namespace) else orelse(namespace)
+
+    def _compile_Tuple(self, node: ast.Tuple) -> Evaluator:
+        items = tuple(self.compile(item) for item in node.elts)
+        return lambda namespace: tuple(item(namespace) for item in items)
+
+    _compile_List = _compile_Tuple
+
+    def _compile_Call(self, node: ast.Call) -> Evaluator:
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+            raise ExpressionError(f"Llamada no permitida: {ast.unparse(node.func)}")
+        function = FUNCTIONS[node.func.id]
+        args = tuple(self.compile(arg) for arg in node.args)
+        return lambda namespace: function(*(arg(namespace) for arg in args))
+
+def compile_condition(source: str) -> CompiledCondition:
+    """Analizar y compilar una condición de validación"""
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Sintaxis inválida en '{source}': {e.msg}")
+    compiler = _Compiler()
+    evaluator = compiler.compile(tree)
+    return CompiledCondition(source, evaluator, compiler.references)
+
+class ConditionCache:
+    """Caché LRU de condiciones compiladas por (sequence.id, version)"""
+    
+    def __init__(self, max_sequences: int = 256):
+        self.max_sequences = max_sequences
+        self._entries: "OrderedDict[Tuple[Optional[str], Optional[str]], Dict[str, CompiledCondition]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sequence_key: Tuple[Optional[str], Optional[str]], source: str) -> CompiledCondition:
+        """Obtener la condición compilada, compilándola solo la primera vez"""
+        conditions = self._entries.get(sequence_key)
+        if conditions is None:
+            conditions = self._entries[sequence_key] = {}
+            if len(self._entries) > self.max_sequences:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(sequence_key)
+        
+        compiled = conditions.get(source)
+        if compiled is None:
+            self.misses += 1
+            compiled = conditions[source] = compile_condition(source)
+        else:
+            self.hits += 1
+        return compiled
+
+    def invalidate(self, sequence_key: Tuple[Optional[str], Optional[str]]):
+        self._entries.pop(sequence_key, None)
+
+# Caché global compartida por todas las ejecuciones
+condition_cache = ConditionCache()
@@ -0,0 +1,147 @@
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.settings import get_tolerance, get_tolerance_floor, get_tolerance_type
+
+TOLERANCE_TYPES = ("absolute", "percentage", "minmax")
+
+def _base_parameter(parameter: str) -> str:
+    # voltage_measured -> voltage, para buscar las tolerancias por defecto
+    return parameter.split("_", 1)[0]
+
+class LimitSpec:
+    """Límites de aceptación de un parámetro
+    
+    - absolute: expected ± tolerance
+    - percentage: expected ± |expected| * tolerance (0.05 = 5%, como en
+      ``DEFAULT_TOLERANCES``), nunca más estrecho que ``tolerance_floor``
+      (``DEFAULT_TOLERANCE_FLOORS``) para que un esperado de 0 no dé [0, 0]
+    - minmax: [min_value, max_value], cualquiera de los dos puede faltar
+    
+    Si no se indica tolerancia se usa la de ``DEFAULT_TOLERANCES`` para el
+    parámetro.
+    """
+    
+    def __init__(self, parameter: str, expected: Optional[float] = None, tolerance: Optional[float] = None,
+                 tolerance_type: Optional[str] = None, min_value: Optional[float] = None,
+                 max_value: Optional[float] = None, tolerance_floor: Optional[float] = None):
+        if tolerance_type is None:
+            tolerance_type = "minmax" if expected is None else get_tolerance_type(_base_parameter(parameter))
+        if tolerance_type not in TOLERANCE_TYPES:
+            raise ValueError(f"Tipo de tolerancia desconocido: {tolerance_type}")
+        if tolerance_type != "minmax" and expected is None:
+            raise ValueError(f"Falta el valor esperado para {parameter}")
+        if tolerance_type != "minmax" and tolerance is None:
+            tolerance = get_tolerance(_base_parameter(parameter))
+        if tolerance_floor is None:
+            tolerance_floor = get_tolerance_floor(_base_parameter(parameter))
+        
+        self.parameter = parameter
+        self.expected = expected
+        self.tolerance = tolerance
+        self.tolerance_type = tolerance_type
+        self.min_value = min_value
+        self.max_value = max_value
+        self.tolerance_floor = tolerance_floor
+
+    @classmethod
+    def from_step(cls, parameter: str, step: Dict[str, Any], expected: Optional[float] = None) -> "LimitSpec":
+        """Construir los límites a partir de la definición de un paso"""
+        return cls(
+            parameter,
+            expected=step.get("expected_value") if expected is None else expected,
+            tolerance=step.get("tolerance"),
+            tolerance_type=step.get("tolerance_type"),
+            min_value=step.get("min_value"),
+            max_value=step.get("max_value"),
+            tolerance_floor=step.get("tolerance_floor")
+        )
+
+    def bounds(self) -> Tuple[float, float]:
+        """Límites inferior y superior (±inf si no hay límite)"""
+        if self.tolerance_type == "minmax":
+            low = -np.inf if self.min_value is None else self.min_value
+            high = np.inf if self.max_value is None else self.max_value
+            return float(low), float(high)
+        if self.tolerance_type == "percentage":
+            half_width = max(abs(self.expected) * self.tolerance, self.tolerance_floor)
+        else:
+            half_width = self.tolerance
+        return self.expected - half_width, self.expected + half_width
+
+    def to_dict(self) -> Dict[str, Any]:
+        low, high = self.bounds()
+        return {
+            "expected": self.expected,
+            "tolerance": self.tolerance,
+            "tolerance_type": self.tolerance_type,
+            "low": low,
+            "high": high
+        }
+
+class LimitEvaluation:
+    """Veredictos y márgenes por punto de un parámetro"""
+    
+    def __init__(self, spec: LimitSpec, values: np.ndarray, passed: np.ndarray, margin: np.ndarray):
+        self.spec = spec
+        self.values = values
+        self.passed = passed
+        self.margin = margin  # > 0 dentro de límites, < 0 fuera
+
+    @property
+    def all_passed(self) -> bool:
+        return bool(self.passed.all())
+
+    @property
+    def failures(self) -> int:
+        return int(self.passed.size - np.count_nonzero(self.passed))
+
+    def summary(self) -> Dict[str, Any]:
+        """Resumen compacto para resultados y mensajes"""
+        summary = self.spec.to_dict()
+        summary.update({
+            "points": int(self.values.size),
+            "failures": self.failures,
+            "passed": self.all_passed,
+            "worst_margin": float(self.margin.min()) if self.margin.size else None
+        })
+        return summary
+
+def evaluate_limits(measurements: Dict[str, Any], specs: Dict[str, LimitSpec]) -> Dict[str, LimitEvaluation]:
+    """Evaluar todos los parámetros de un paso (o barrido) en una sola pasada
+    
+    ``measurements`` asocia cada parámetro con un valor o una secuencia de
+    valores. Todos se concatenan en un único array junto con sus límites,
+    de modo que miles de muestras se comparan sin bucles en Python.
+    """
+    names: List[str] = []
+    arrays: List[np.ndarray] = []
+    for name, spec in specs.items():
+        if name not in measurements:
+            continue
+        names.append(name)
+        arrays.append(np.atleast_1d(np.asarray(measurements[name], dtype=np.float64)))
+    if not arrays:
+        return {}
+    
+    sizes = [array.size for array in arrays]
+    bounds = np.array([specs[name].bounds() for name in names], dtype=np.float64)
+    values = np.concatenate(arrays)
+    low = np.repeat(bounds[:, 0], sizes)
+    high = np.repeat(bounds[:, 1], sizes)
+    
+    margin = np.minimum(values - low, high - values)
+    passed = margin >= 0
+    
+    evaluations = {}
+    offsets = np.cumsum([0] + sizes)
+    for i, name in enumerate(names):
+        section = slice(offsets[i], offsets[i + 1])
+        evaluations[name] = LimitEvaluation(specs[name], values[section], passed[section], margin[section])
+    return evaluations
+
+def evaluate_records(records: Sequence[Dict[str, Any]], specs: Dict[str, LimitSpec]) -> Dict[str, LimitEvaluation]:
+    """Evaluar una lista de puntos (p.ej. el resultado de un barrido)"""
+    columns = {name: [record[name] for record in records] for name in specs if records and name in records[0]}
+    return evaluate_limits(columns, specs)
\ No newline at end of file
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Any, Callable, Iterable, List, Mapping, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from config.settings import settings
+
+from models.test_models import (
+    DAQReadStep, DAQWriteStep, DelayStep, MeasurementStep, PowerSupplyStep, TestStep, TestStepType, ValidationStep
+)
+from test_engine.expressions import CompiledCondition, ExpressionError, condition_cache
+from test_engine.limits import LimitSpec
+
+PlanKey = Tuple[Optional[str], Optional[str]]
+
+class SequenceValidationError(ValueError):
+    """La secuencia no supera la validación previa a la ejecución"""
+    pass
+
+# Modelo de parámetros y valores por defecto de cada tipo de paso
+STEP_PARAMETER_MODELS: Dict[str, type] = {
+    TestStepType.POWER_SUPPLY.value: PowerSupplyStep,
+    TestStepType.MEASUREMENT.value: MeasurementStep,
+    TestStepType.DELAY.value: DelayStep,
+    TestStepType.VALIDATION.value: ValidationStep,
+    TestStepType.DAQ_READ.value: DAQReadStep,
+    TestStepType.DAQ_WRITE.value: DAQWriteStep,
+}
+
+STEP_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    # La salida de la fuente se valida al 1 % de la consigna salvo que el paso indique otra tolerancia
+    TestStepType.POWER_SUPPLY.value: {"voltage": 0.0, "current_limit": 1.0, "tolerance": 0.01, "tolerance_type": "percentage"},
+    # Sin "tolerance" se aplican DEFAULT_TOLERANCES / DEFAULT_TOLERANCE_TYPES del parámetro
+    TestStepType.MEASUREMENT.value: {"measurement_type": "voltage", "expected_value": 0.0},
+    TestStepType.DELAY.value: {"delay_ms": 100},
+    TestStepType.VALIDATION.value: {"condition": "True"},
+    TestStepType.DAQ_WRITE.value: {"value": 0.0},
+}
+
+# Instrumento por defecto de los tipos de paso que necesitan uno
+DEFAULT_INSTRUMENTS: Dict[str, str] = {
+    TestStepType.POWER_SUPPLY.value: "power_supply",
+    TestStepType.DAQ_READ.value: "daq",
+    TestStepType.DAQ_WRITE.value: "daq",
+}
+
+# Instrumento simulado que lee el valor esperado: solo si el paso lo pide
+# explícitamente y SIMULATE_INSTRUMENTS está activo. No se reserva (es propio
+# de cada ejecución)
+REFERENCE_INSTRUMENT = "reference"
+
+DAQ_STATISTICS = ("mean", "rms", "std", "min", "max")
+
+# Claves del paso que no son parámetros
+STEP_FIELDS = ("name", "type", "description", "parameters", "timeout_seconds",
+               "required_instruments", "validation_criteria", "depends_on")
+
+# Referencia a resultados de otro paso en una condición (step3.voltage_measured)
+STEP_REFERENCE = re.compile(r"^step(\d+)$")
+
+class PlannedStep:
+    """Paso compilado: parámetros resueltos, límites y handler ya enlazados"""
+    
+    __slots__ = ("number", "name", "type", "params", "handler", "instruments",
+                 "limits", "condition", "timeout_seconds", "depends_on")
+
+    def __init__(self, number: int, name: str, step_type: str, params: Mapping[str, Any],
+                 handler: Callable, instruments: Tuple[str, ...], limits: Mapping[str, LimitSpec],
+                 condition: Optional[CompiledCondition], timeout_seconds: float,
+                 depends_on: Tuple[int, ...] = ()):
+        self.number = number
+        self.name = name
+        self.type = step_type
+        self.params = params
+        self.handler = handler
+        self.instruments = instruments
+        self.limits = limits
+        self.condition = condition
+        self.timeout_seconds = timeout_seconds
+        self.depends_on = depends_on  # Números de los pasos que deben terminar antes
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.params.get(key, default)
+
+class ExecutionPlan:
+    """Plan de ejecución inmutable de una versión de secuencia
+    
+    Con ``parallel`` los pasos se ejecutan como un DAG según ``depends_on``;
+    sin él, uno tras otro en orden.
+    """
+    
+    def __init__(self, key: PlanKey, sequence: Dict[str, Any], steps: Tuple[PlannedStep, ...],
+                 instruments: Tuple[str, ...]):
+        self.key = key
+        self.sequence_id = sequence.get("id")
+        self.name = sequence.get("name", "Unknown")
+        self.version = sequence.get("version")
+        self.steps = steps
+        self.instruments = instruments
+        self.parallel = bool(sequence.get("parallel", False))
+        self.max_parallel_steps = sequence.get("max_parallel_steps")
+        # Límite de la secuencia completa, nunca por encima de MAX_TEST_DURATION
+        self.timeout_seconds = min(sequence.get("timeout_seconds") or settings.DEFAULT_TEST_TIMEOUT,
+                                   settings.MAX_TEST_DURATION)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+def plan_key(sequence: Dict[str, Any]) -> PlanKey:
+    """Clave de caché: (id, version), o un hash del contenido si no hay id"""
+    if sequence.get("id"):
+        return (sequence["id"], str(sequence.get("version", "1.0")))
+    digest = hashlib.sha1(json.dumps(sequence, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return (f"sha1:{digest}", None)
+
+def _dump(model: BaseModel) -> Dict[str, Any]:
+    return model.model_dump() if hasattr(model, "model_dump") else model.dict()
+
+def _step_dependencies(number: int, name: str, depends_on: Optional[List[Any]], step_instruments: List[str],
+                       condition: Optional[CompiledCondition], previous: List[PlannedStep],
+                       barrier: Optional[int]) -> Tuple[Tuple[int, ...], bool]:
+    """Dependencias de un paso sobre los anteriores; devuelve (dependencias, es_barrera)
+    
+    - Las declaradas en ``depends_on`` (número o nombre de un paso anterior).
+    - Los pasos anteriores que usan alguno de sus instrumentos.
+    - Los pasos cuyos resultados lee su condición (``stepN``).
+    - Un paso sin instrumentos ni referencias y sin ``depends_on``
+      (p.ej. un retardo) es una barrera: espera a todos los anteriores y
+      todos los posteriores esperan a él.
+    """
+    names = {step.name: step.number for step in previous}
+    deps = set()
+    for reference in depends_on or ():
+        target = reference if isinstance(reference, int) else names.get(reference)
+        if target is None or not 1 <= target < number:
+            raise SequenceValidationError(
+                f"Paso {number} ({name}): depends_on solo admite pasos anteriores ({reference!r})")
+        deps.add(target)
+    
+    references = set()
+    if condition is not None:
+        for reference in condition.references:
+            match = STEP_REFERENCE.match(reference)
+            if match and int(match.group(1)) < number:
+                references.add(int(match.group(1)))
+    deps.update(references)
+    
+    shared = set(step_instruments)
+    deps.update(step.number for step in previous if shared.intersection(step.instruments))
+    
+    is_barrier = depends_on is None and not step_instruments and not references
+    if is_barrier:
+        deps.update(step.number for step in previous)
+    elif barrier is not None:
+        deps.add(barrier)
+    return tuple(sorted(deps)), is_barrier
+
+def compile_sequence(sequence: Dict[str, Any], handlers: Dict[str, Callable]) -> ExecutionPlan:
+    """Validar una secuencia y compilarla en un ExecutionPlan"""
+    key = plan_key(sequence)
+    steps: List[PlannedStep] = []
+    instruments = set(sequence.get("required_instruments", []))
+    barrier: Optional[int] = None
+    
+    for i, raw in enumerate(sequence.get("steps", [])):
+        number = i + 1
+        name = raw.get("name", f"Step {number}")
+        step_type = raw.get("type", "unknown")
+        
+        # Los parámetros pueden venir en "parameters" (TestStep) o en el propio paso
+        params = {k: v for k, v in raw.items() if k not in STEP_FIELDS}
+        params.update(raw.get("parameters", {}))
+        
+        try:
+            step_model = TestStep(
+                name=name,
+                type=step_type,
+                description=raw.get("description"),
+                parameters=params,
+                timeout_seconds=raw.get("timeout_seconds", 30.0),
+                required_instruments=raw.get("required_instruments", []),
+                validation_criteria=raw.get("validation_criteria", {}),
+                depends_on=raw.get("depends_on")
+            )
+            step_type = step_model.type.value
+            if step_type not in handlers:
+                raise SequenceValidationError(f"Paso {number} ({name}): tipo no soportado: {step_type}")
+            
+            resolved = dict(STEP_DEFAULTS.get(step_type, {}))
+            resolved.update(params)
+            model = STEP_PARAMETER_MODELS.get(step_type)
+            if model is not None:
+                resolved.update(_dump(model(**resolved)))
+        except ValidationError as e:
+            raise SequenceValidationError(f"Paso {number} ({name}): {str(e)}")
+        
+        step_instruments = list(step_model.required_instruments)
+        if step_type == TestStepType.MEASUREMENT.value:
+            if not resolved.get("instrument"):
+                raise SequenceValidationError(
+                    f"Paso {number} ({name}): el paso de medición necesita \"instrument\" "
+                    f"(\"{REFERENCE_INSTRUMENT}\" para una referencia simulada)")
+            if resolved["instrument"] == REFERENCE_INSTRUMENT and not settings.SIMULATE_INSTRUMENTS:
+                raise SequenceValidationError(
+                    f"Paso {number} ({name}): \"{REFERENCE_INSTRUMENT}\" necesita SIMULATE_INSTRUMENTS")
+        if resolved.get("instrument"):
+            if resolved["instrument"] != REFERENCE_INSTRUMENT:  # La referencia es de la ejecución: no se reserva
+                step_instruments.append(resolved["instrument"])
+        elif step_type in DEFAULT_INSTRUMENTS:
+            step_instruments.append(DEFAULT_INSTRUMENTS[step_type])
+        instruments.update(step_instruments)
+        
+        limits: Dict[str, LimitSpec] = {}
+        condition = None
+        try:
+            if step_type == TestStepType.POWER_SUPPLY.value:
+                limits["voltage_measured"] = LimitSpec.from_step("voltage_measured", resolved, expected=resolved["voltage"])
+            elif step_type == TestStepType.MEASUREMENT.value:
+                limits_params = dict(resolved)
+                if resolved.get("tolerance") is not None and not resolved.get("tolerance_type"):
+                    limits_params["tolerance_type"] = "absolute"  # Tolerancia explícita: absoluta, como siempre
+                limits[resolved["measurement_type"]] = LimitSpec.from_step(resolved["measurement_type"], limits_params)
+            elif step_type == TestStepType.VALIDATION.value:
+                condition = condition_cache.get(key, resolved["condition"])
+            elif step_type == TestStepType.DAQ_READ.value:
+                if resolved["statistic"] not in DAQ_STATISTICS:
+                    raise ValueError(f"Estadístico desconocido: {resolved['statistic']}")
+                if resolved["threshold_edge"] not in ("rising", "falling", "both"):
+                    raise ValueError(f"Flanco desconocido: {resolved['threshold_edge']}")
+                if any(resolved.get(field) is not None for field in ("expected_value", "min_value", "max_value")):
+                    # Los mismos límites para el estadístico elegido de cada canal
+                    for channel in resolved["channels"]:
+                        parameter = f"{channel}_{resolved['statistic']}"
+                        limits[parameter] = LimitSpec.from_step(parameter, resolved)
+        except (ValueError, ExpressionError) as e:
+            raise SequenceValidationError(f"Paso {number} ({name}): {str(e)}")
+        
+        timeout_seconds = step_model.timeout_seconds
+        if "timeout_seconds" not in raw:
+            # Un retardo o una adquisición larga no deben agotar el timeout por defecto del paso
+            if step_type == TestStepType.DELAY.value:
+                timeout_seconds = max(timeout_seconds, resolved["delay_ms"] / 1000.0 + 1.0)
+            elif step_type == TestStepType.DAQ_READ.value:
+                timeout_seconds = max(timeout_seconds, resolved["duration_ms"] / 1000.0 + 1.0)
+        
+        depends_on, is_barrier = _step_dependencies(
+            number, name, step_model.depends_on, step_instruments, condition, steps, barrier)
+        if is_barrier:
+            barrier = number
+        
+        steps.append(PlannedStep(
+            number=number,
+            name=name,
+            step_type=step_type,
+            params=MappingProxyType(resolved),
+            handler=handlers[step_type],
+            instruments=tuple(sorted(set(step_instruments))),
+            limits=MappingProxyType(limits),
+            condition=condition,
+            timeout_seconds=timeout_seconds,
+            depends_on=depends_on
+        ))
+    
+    return ExecutionPlan(key, sequence, tuple(steps), tuple(sorted(instruments)))
+
+class PlanCache:
+    """Caché LRU de planes de ejecución por (sequence.id, version)"""
+    
+    def __init__(self, compiler: Callable[[Dict[str, Any]], ExecutionPlan], max_plans: int = 256):
+        self.compiler = compiler
+        self.max_plans = max_plans
+        self._plans: "OrderedDict[PlanKey, ExecutionPlan]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sequence: Dict[str, Any]) -> ExecutionPlan:
+        """Obtener el plan de una secuencia, compilándolo si no está en caché"""
+        key = plan_key(sequence)
+        plan = self._plans.get(key)
+        if plan is not None:
+            self.hits += 1
+            self._plans.move_to_end(key)
+            return plan
+        
+        self.misses += 1
+        plan = self.compiler(sequence)
+        self._plans[key] = plan
+        if len(self._plans) > self.max_plans:
+            self._plans.popitem(last=False)
+        return plan
+
+    def prewarm(self, sequences: Iterable[Dict[str, Any]]) -> List[str]:
+        """Compilar por adelantado; devuelve los errores de validación encontrados"""
+        errors = []
+        for sequence in sequences:
+            try:
+                self.get(sequence)
+            except SequenceValidationError as e:
+                errors.append(f"{sequence.get('id', sequence.get('name', '?'))}: {str(e)}")
+        return errors
+
+    def invalidate(self, sequence_id: Optional[str] = None):
+        """Descartar los planes de una secuencia (o todos)"""
+        if sequence_id is None:
+            self._plans.clear()
+            return
+        for key in [key for key in self._plans if key[0] == sequence_id]:
+            del self._plans[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"plans": len(self._plans), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,85 @@
+import asyncio
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from test_engine.step_record import StepRecord, new_clock
+
+class RunContext:
+    """Estado aislado de una ejecución de secuencia (una por DUT/fixture)"""
+    
+    def __init__(self, test_id: str, sequence: Dict[str, Any], station_id: Optional[str] = None):
+        self.test_id = test_id
+        self.sequence = sequence
+        self.station_id = station_id
+        self.results: List[StepRecord] = []
+        self.completed_steps = 0
+        self.passed_steps = 0
+        # Resultados visibles para las condiciones de validación (step1, step2...)
+        self.namespace: Dict[str, StepRecord] = {}
+        self.instruments: List[str] = []  # Instrumentos físicos reservados
+        self.instrument_map: Dict[str, str] = {}  # Nombre lógico del plan -> instrumento físico
+        self.plan = None  # ExecutionPlan compilado de la secuencia
+        self.leased: Dict[str, Any] = {}  # Drivers reservados para esta ejecución
+        self.simulated: Dict[str, Any] = {}  # Instrumentos simulados propios de la ejecución
+        self.trace = None  # RunTrace si la ejecución se traza
+        self.deadline: Optional[float] = None  # Límite de la secuencia (time.monotonic)
+        self.timed_out = False
+        self.clock = new_clock()  # Referencia para convertir las marcas monotónicas de los pasos
+        self.start_time = self.clock[0]
+        self.status = "pending"
+        self._stop_event = asyncio.Event()
+
+    @property
+    def stop_requested(self) -> bool:
+        return self._stop_event.is_set()
+
+    def request_stop(self):
+        """Solicitar la detención de esta ejecución"""
+        self._stop_event.set()
+
+    def remaining(self) -> float:
+        """Segundos que le quedan a la secuencia antes de su límite"""
+        if self.deadline is None:
+            return float("inf")
+        return self.deadline - time.monotonic()
+
+    @property
+    def deadline_exceeded(self) -> bool:
+        return self.remaining() <= 0
+
+    @property
+    def sequence_key(self) -> Tuple[Optional[str], Optional[str]]:
+        return (self.sequence.get("id"), self.sequence.get("version"))
+
+    def record_result(self, result: StepRecord, publish: bool = True):
+        """Guardar el resultado de un paso y publicarlo para las validaciones"""
+        self.results.append(result)
+        self.completed_steps += 1
+        if result.passed:
+            self.passed_steps += 1
+        if publish:
+            self.publish_result(result)
+
+    def publish_result(self, result: StepRecord):
+        """Hacer visibles las mediciones de un paso como ``stepN`` (sin copiarlas)"""
+        self.namespace[f"step{result.step_number}"] = result
+
+    @property
+    def total_steps(self) -> int:
+        return len(self.sequence.get("steps", []))
+
+    def elapsed(self) -> float:
+        return time.time() - self.start_time
+
+    def get_status(self) -> Dict[str, Any]:
+        """Obtener resumen del estado de la ejecución"""
+        return {
+            "test_id": self.test_id,
+            "station_id": self.station_id,
+            "sequence": self.sequence.get("name"),
+            "status": self.status,
+            "instruments": self.instruments,
+            "completed_steps": self.completed_steps,
+            "total_steps": self.total_steps,
+            "elapsed": self.elapsed()
+        }
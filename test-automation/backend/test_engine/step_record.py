@@ -0,0 +1,116 @@
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+# Reloj de una ejecución: (time.time(), time.monotonic()) tomados a la vez.
+# Los pasos solo guardan instantes monotónicos; la fecha se calcula al exportar.
+Clock = Tuple[float, float]
+
+def new_clock() -> Clock:
+    return (time.time(), time.monotonic())
+
+class StepRecord:
+    """Resultado de un paso en el camino crítico del motor
+
+    Objeto con ``__slots__`` y marcas de tiempo monotónicas: crearlo no
+    formatea fechas ni construye diccionarios anidados. La conversión a
+    dict/JSON (``to_dict``) solo se hace en los límites, al serializar
+    para la API/WebSocket y en el hilo escritor del almacén de resultados.
+
+    Para las condiciones de validación se comporta como un mapping de sus
+    medidas (``step3.voltage_measured``, ``step3.passed``).
+    """
+
+    __slots__ = ("step_name", "step_number", "step_type", "clock", "started", "ended", "passed",
+                 "measurements", "error", "timed_out", "limits", "extra")
+
+    def __init__(self, step_name: str, step_number: int, step_type: str, clock: Clock):
+        self.step_name = step_name
+        self.step_number = step_number
+        self.step_type = step_type
+        self.clock = clock
+        self.started = time.monotonic()
+        self.ended: Optional[float] = None
+        self.passed = False
+        self.measurements: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.timed_out = False
+        self.limits: Optional[Dict[str, Any]] = None
+        self.extra: Optional[Dict[str, Any]] = None  # Datos poco frecuentes (settle_time_ms...)
+
+    def finish(self):
+        self.ended = time.monotonic()
+
+    @property
+    def duration(self) -> float:
+        return (self.ended if self.ended is not None else time.monotonic()) - self.started
+
+    def set(self, key: str, value: Any):
+        """Guardar un dato adicional del paso (se exporta al nivel superior del dict)"""
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def wall_time(self, instant: float) -> float:
+        """Convertir un instante monotónico a tiempo de calendario (epoch)"""
+        return self.clock[0] + (instant - self.clock[1])
+
+    @property
+    def start_datetime(self) -> datetime:
+        return datetime.fromtimestamp(self.wall_time(self.started))
+
+    @property
+    def end_datetime(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self.wall_time(self.ended)) if self.ended is not None else None
+
+    # Acceso tipo mapping para las condiciones (y lectores del dict antiguo)
+
+    def __getitem__(self, key: str) -> Any:
+        measurements = self.measurements
+        if key in measurements:
+            return measurements[key]
+        if key == "passed":
+            return self.passed
+        if key == "duration":
+            return self.duration
+        if key == "error":
+            return self.error
+        if key == "step_number":
+            return self.step_number
+        if key == "step_name":
+            return self.step_name
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable (la misma forma que el resultado en dict de siempre)"""
+        end = self.end_datetime
+        data = {
+            "step_name": self.step_name,
+            "step_number": self.step_number,
+            "start_time": self.start_datetime.isoformat(),
+            "passed": self.passed,
+            "measurements": self.measurements,
+            "error": self.error,
+            "duration": self.duration,
+            "end_time": end.isoformat() if end is not None else None,
+        }
+        if self.timed_out:
+            data["timed_out"] = True
+        if self.limits is not None:
+            data["limits"] = self.limits
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+def json_default(value: Any) -> Any:
+    """``default`` de ``json.dumps`` para los objetos del motor (``StepRecord``)"""
+    to_dict = getattr(value, "to_dict", None)
+    if to_dict is None:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return to_dict()
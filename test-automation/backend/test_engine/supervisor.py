@@ -0,0 +1,71 @@
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional
+
+class RunSupervisor:
+    """Registro de ejecuciones lanzadas como tareas en segundo plano
+    
+    ``start`` devuelve el test_id al instante; la secuencia corre en su
+    propia tarea. ``cancel`` cancela la tarea, lo que interrumpe también
+    cualquier espera en curso (instrumento, establecimiento, reserva).
+    """
+    
+    def __init__(self, engine, history_size: int = 200):
+        self.engine = engine
+        self.history_size = history_size
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.history: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def start(self, sequence: Dict[str, Any], callback: Callable = None,
+              station_id: Optional[str] = None, test_id: Optional[str] = None) -> str:
+        """Lanzar una secuencia en segundo plano y devolver su test_id"""
+        test_id = test_id or self.engine.new_test_id()
+        task = asyncio.create_task(
+            self.engine.run_sequence(sequence, callback, station_id=station_id, test_id=test_id),
+            name=f"run-{test_id}"
+        )
+        self.tasks[test_id] = task
+        task.add_done_callback(lambda t: self._on_done(test_id, t))
+        return test_id
+
+    def _on_done(self, test_id: str, task: asyncio.Task):
+        self.tasks.pop(test_id, None)
+        if task.cancelled():
+            summary = {"test_id": test_id, "status": "stopped"}
+        elif task.exception() is not None:
+            summary = {"test_id": test_id, "status": "failed", "error": str(task.exception())}
+        else:
+            summary = task.result()
+        self.history[test_id] = summary
+        if len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+
+    def cancel(self, test_id: Optional[str] = None) -> List[str]:
+        """Cancelar una ejecución (o todas); devuelve los test_id afectados"""
+        if test_id is None:
+            targets = list(self.tasks)
+        else:
+            targets = [test_id] if test_id in self.tasks else []
+        for target in targets:
+            self.tasks[target].cancel()
+        return targets
+
+    async def wait(self, test_id: str, timeout: Optional[float] = None):
+        """Esperar a que termine una ejecución"""
+        task = self.tasks.get(test_id)
+        if task is not None:
+            await asyncio.wait([task], timeout=timeout)
+
+    async def shutdown(self, timeout: float = 5.0):
+        """Cancelar todas las ejecuciones y esperar a que liberen sus recursos"""
+        tasks = list(self.tasks.values())
+        self.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def get_runs(self) -> Dict[str, Any]:
+        """Estado de las ejecuciones activas y de las últimas terminadas"""
+        active = {ctx.test_id: ctx.get_status() for ctx in self.engine.runs.values()}
+        for test_id in self.tasks:
+            active.setdefault(test_id, {"test_id": test_id, "status": "pending"})
+        return {"active": list(active.values()), "finished": list(reversed(self.history.values()))}
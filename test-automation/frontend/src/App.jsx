@@ -13,6 +13,7 @@ function App() {
     isTestRunning,
     currentTest,
     addTestResult,
+    setTestResults,
     updateInstrument,
     setTestRunning 
   } = useStore()
@@ -41,6 +42,20 @@ function App() {
           setTestRunning(false, null)
           console.error('Error en prueba:', data.error)
           break
+        case 'run_snapshot': {
+          // Estado tras reconectar; si es completo sustituye a los resultados locales
+          const isCurrent = data.test_id === useStore.getState().currentTest
+          if (data.status === 'running' && !isCurrent) {
+            setTestRunning(true, data.test_id)
+          }
+          if (data.full && (isCurrent || data.status === 'running')) {
+            setTestResults(data.results || [])
+          }
+          if (data.status !== 'running' && isCurrent) {
+            setTestRunning(false, null)
+          }
+          break
+        }
       }
     }
   })
@@ -122,7 +137,7 @@ function App() {
               })
             }}
             onStopTest={() => {
-              sendMessage({ type: 'stop_test' })
+              sendMessage({ type: 'stop_test', test_id: currentTest })
             }}
             isRunning={isTestRunning}
             currentTest={currentTest}
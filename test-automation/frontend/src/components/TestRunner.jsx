@@ -20,9 +20,9 @@ const TestRunner = ({ onStartTest, onStopTest, isRunning, currentTest }) => {
       editable: true, // Marcar como editables
       steps: [
         { name: 'Configurar fuente a 5V', type: 'power_supply', voltage: 5.0, current_limit: 1.0 },
-        { name: 'Medir voltaje de salida', type: 'measurement', measurement_type: 'voltage', expected_value: 5.0, tolerance: 0.1 },
+        { name: 'Medir voltaje de salida', type: 'measurement', instrument: 'power_supply', measurement_type: 'voltage', expected_value: 5.0, tolerance: 0.1 },
         { name: 'Configurar fuente a 12V', type: 'power_supply', voltage: 12.0, current_limit: 1.0 },
-        { name: 'Medir voltaje 12V', type: 'measurement', measurement_type: 'voltage', expected_value: 12.0, tolerance: 0.2 },
+        { name: 'Medir voltaje 12V', type: 'measurement', instrument: 'power_supply', measurement_type: 'voltage', expected_value: 12.0, tolerance: 0.2 },
         { name: 'Apagar fuente', type: 'power_supply', voltage: 0, current_limit: 0.1 }
       ]
     },
@@ -34,11 +34,11 @@ const TestRunner = ({ onStartTest, onStopTest, isRunning, currentTest }) => {
       steps: [
         { name: 'Inicialización', type: 'power_supply', voltage: 0, current_limit: 0.5 },
         { name: 'Prueba 3.3V', type: 'power_supply', voltage: 3.3, current_limit: 1.0 },
-        { name: 'Verificar 3.3V', type: 'measurement', measurement_type: 'voltage', expected_value: 3.3, tolerance: 0.05 },
+        { name: 'Verificar 3.3V', type: 'measurement', instrument: 'power_supply', measurement_type: 'voltage', expected_value: 3.3, tolerance: 0.05 },
         { name: 'Esperar estabilización', type: 'delay', delay_ms: 100 },
         { name: 'Prueba 5V', type: 'power_supply', voltage: 5.0, current_limit: 1.0 },
-        { name: 'Verificar 5V', type: 'measurement', measurement_type: 'voltage', expected_value: 5.0, tolerance: 0.1 },
-        { name: 'Prueba carga', type: 'measurement', measurement_type: 'current', expected_value: 0.5, tolerance: 0.1 },
+        { name: 'Verificar 5V', type: 'measurement', instrument: 'power_supply', measurement_type: 'voltage', expected_value: 5.0, tolerance: 0.1 },
+        { name: 'Prueba carga', type: 'measurement', instrument: 'power_supply', measurement_type: 'current', expected_value: 0.1, tolerance: 0.02 },
         { name: 'Finalizar', type: 'power_supply', voltage: 0, current_limit: 0.1 }
       ]
     }
@@ -0,0 +1,92 @@
+import { useEffect, useRef, useState } from 'react'
+
+// Decodificador del canal binario /ws/stream (ver backend/api/binary_stream.py)
+const MAGIC = 'TAMB'
+const HEADER_SIZE = 32
+const DTYPES = {
+  1: Float32Array,
+  2: Float64Array
+}
+
+const textDecoder = new TextDecoder()
+
+export const decodeBlock = (buffer) => {
+  const view = new DataView(buffer)
+  const magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3))
+  if (magic !== MAGIC) {
+    throw new Error('Trama binaria no reconocida')
+  }
+
+  const ArrayType = DTYPES[view.getUint8(5)]
+  const nColumns = view.getUint16(6, true)
+  const nRows = view.getUint32(8, true)
+  const sequence = view.getUint32(12, true)
+  const t0 = view.getFloat64(16, true)
+  const dt = view.getFloat64(24, true)
+
+  let offset = HEADER_SIZE
+  const readText = (lengthBytes) => {
+    const length = lengthBytes === 2 ? view.getUint16(offset, true) : view.getUint8(offset)
+    offset += lengthBytes
+    const text = textDecoder.decode(new Uint8Array(buffer, offset, length))
+    offset += length
+    return text
+  }
+
+  const testId = readText(2)
+  const channel = readText(2)
+  const names = []
+  for (let i = 0; i < nColumns; i++) {
+    names.push(readText(1))
+  }
+  offset += (8 - (offset % 8)) % 8
+
+  // Vistas directas sobre el buffer recibido, sin copiar ni parsear
+  const columns = {}
+  for (const name of names) {
+    columns[name] = new ArrayType(buffer, offset, nRows)
+    offset += nRows * ArrayType.BYTES_PER_ELEMENT
+  }
+
+  return { testId, channel, sequence, t0, dt, rows: nRows, columns }
+}
+
+// Hook para suscribirse a bloques de medida de una prueba
+export const useBinaryStream = (url, { testId = '*', channels = ['*'], dtype = 'float32', onBlock } = {}) => {
+  const [connectionStatus, setConnectionStatus] = useState('connecting')
+  const wsRef = useRef(null)
+  const onBlockRef = useRef(onBlock)
+  onBlockRef.current = onBlock
+
+  useEffect(() => {
+    const ws = new WebSocket(url)
+    ws.binaryType = 'arraybuffer'
+    wsRef.current = ws
+
+    ws.onopen = () => {
+      setConnectionStatus('connected')
+      ws.send(JSON.stringify({ type: 'subscribe', test_id: testId, channels, dtype }))
+    }
+
+    ws.onmessage = (event) => {
+      if (typeof event.data === 'string') {
+        return // Confirmaciones de suscripción (JSON)
+      }
+      try {
+        const block = decodeBlock(event.data)
+        if (onBlockRef.current) {
+          onBlockRef.current(block)
+        }
+      } catch (error) {
+        console.error('Error decodificando bloque binario:', error)
+      }
+    }
+
+    ws.onclose = () => setConnectionStatus('disconnected')
+    ws.onerror = () => setConnectionStatus('error')
+
+    return () => ws.close(1000, 'Manual disconnect')
+  }, [url, testId, channels.join(','), dtype])
+
+  return { connectionStatus }
+}
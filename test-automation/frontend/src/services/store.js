@@ -60,6 +60,14 @@ export const useStore = create(
       }]
     })),
     
+    setTestResults: (results) => set(() => ({
+      testResults: results.map((result, index) => ({
+        ...result,
+        id: `${result.step_number ?? index}-${index}`,
+        timestamp: result.end_time || new Date().toISOString()
+      }))
+    })),
+    
     clearTestResults: () => set(() => ({
       testResults: []
     })),
@@ -6,6 +6,7 @@ export const useWebSocket = (url, options = {}) => {
   const wsRef = useRef(null)
   const reconnectTimeoutRef = useRef(null)
   const reconnectAttempts = useRef(0)
+  const lastSeqRef = useRef({}) // Último número de evento visto por ejecución (test_id -> seq)
   const maxReconnectAttempts = options.maxReconnectAttempts || 5
 
   const connect = () => {
@@ -17,6 +18,9 @@ export const useWebSocket = (url, options = {}) => {
         setConnectionStatus('connected')
         reconnectAttempts.current = 0
         
+        // Pedir los eventos perdidos durante la desconexión (y las pruebas en curso)
+        wsRef.current.send(JSON.stringify({ type: 'resume', runs: lastSeqRef.current }))
+        
         if (options.onOpen) {
           options.onOpen()
         }
@@ -25,6 +29,14 @@ export const useWebSocket = (url, options = {}) => {
       wsRef.current.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data)
+          
+          // Los eventos numerados ya recibidos (p.ej. duplicados al reanudar) se descartan
+          if (data.test_id && typeof data.seq === 'number') {
+            const lastSeq = lastSeqRef.current[data.test_id] || 0
+            if (data.type !== 'run_snapshot' && data.seq <= lastSeq) return
+            lastSeqRef.current[data.test_id] = Math.max(lastSeq, data.seq)
+          }
+          
           setLastMessage(data)
           
           if (options.onMessage) {
@@ -154,7 +166,8 @@ export const WebSocketUtils = {
     STEP_STARTED: 'step_started',
     STEP_COMPLETED: 'step_completed',
     INSTRUMENT_STATUS: 'instrument_status',
-    TEST_PROGRESS: 'test_progress'
+    TEST_PROGRESS: 'test_progress',
+    RUN_SNAPSHOT: 'run_snapshot'
   },
 
   // Crear mensaje formateado